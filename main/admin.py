@@ -1,3 +1,147 @@
-from django.contrib import admin
+from math import ceil
 
-# Register your models here.
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import PAGE_VAR
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.http import HttpResponseRedirect
+from django.utils.functional import cached_property
+
+from .models import Task
+
+
+def estimated_count(model, using):
+    """
+    The number of rows in the table of `model` according to the planner
+    statistics, or None where there are none yet. On SQLite they come
+    from ANALYZE, which `manage.py migrate` does not run.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    queries = {
+        'postgresql': ("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table]),
+        'sqlite': ("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table]),
+        'mysql': ("SELECT table_rows FROM information_schema.tables"
+                  " WHERE table_schema = DATABASE() AND table_name = %s", [table]),
+    }
+    if connection.vendor not in queries:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(*queries[connection.vendor])
+            row = cursor.fetchone()
+    except DatabaseError:
+        # no sqlite_stat1 before the first ANALYZE
+        return None
+    if row is None or row[0] is None:
+        return None
+    # SQLite's stat is the row count followed by per-column estimates
+    count = int(str(row[0]).split()[0])
+    return count if count >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Pages a changelist without counting a large table. An unfiltered list
+    takes its size from the planner statistics, or from its highest
+    primary key where they are missing or stale; a filtered one is counted
+    up to ADMIN_EXACT_COUNT_LIMIT matches, and `truncated` tells there are
+    more. Only the first ADMIN_MAX_PAGES pages are offered: pages past the
+    first skip their offset over the ids alone, then load and join only
+    their own rows, which stays fast that deep but not a million rows in.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.truncated = False
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        if not bottom:
+            return super().page(number)
+        top = bottom + self.per_page
+        if top + self.orphans >= self.count:
+            top = self.count
+        ids = list(self.object_list.values_list('pk', flat=True)[bottom:top])
+        return self._get_page(self.object_list.filter(pk__in=ids), number, self)
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        limit = settings.ADMIN_EXACT_COUNT_LIMIT
+        filtered = bool(queryset.query.where)
+        if not filtered:
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > limit:
+                return estimate
+        count = queryset[:limit + 1].count()
+        if count <= limit:
+            return count
+        if filtered:
+            self.truncated = True
+            return limit
+        highest = queryset.order_by('-pk').values_list('pk', flat=True).first()
+        return max(highest, count) if isinstance(highest, int) else count
+
+    @cached_property
+    def num_pages(self):
+        if self.count == 0 and not self.allow_empty_first_page:
+            return 0
+        hits = max(1, self.count - self.orphans)
+        return min(ceil(hits / self.per_page), settings.ADMIN_MAX_PAGES)
+
+    @property
+    def listed_all(self):
+        """ Whether the pages offered reach every row. """
+        return not self.truncated and self.count <= self.num_pages * self.per_page
+
+
+class ScaleModelAdmin(admin.ModelAdmin):
+    """
+    An admin for tables of millions of rows. Changelists are never
+    counted in full and offer ADMIN_MAX_PAGES pages at most, saying so
+    when that leaves rows out; subclasses name the relations their list shows in
+    `list_select_related` and use raw-ID widgets for large relations, and
+    search only with lookups an index answers.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_select_related = ()
+    # with the queries indexed, rendering the rows is most of a page
+    list_per_page = 50
+
+    def changelist_view(self, request, extra_context=None):
+        # the admin's page numbers count from zero
+        try:
+            page = int(request.GET.get(PAGE_VAR, 0))
+        except ValueError:
+            page = 0
+        if page >= settings.ADMIN_MAX_PAGES:
+            params = request.GET.copy()
+            params[PAGE_VAR] = settings.ADMIN_MAX_PAGES - 1
+            self.message_user(request, self.deep_message(), messages.WARNING)
+            return HttpResponseRedirect('?' + params.urlencode())
+        response = super().changelist_view(request, extra_context)
+        changelist = getattr(response, 'context_data', {}).get('cl')
+        if changelist is not None and not changelist.paginator.listed_all:
+            self.message_user(request, self.deep_message(changelist.paginator.truncated),
+                              messages.INFO)
+        return response
+
+    def deep_message(self, truncated=False):
+        if truncated:
+            return ("More than %d %s match, and only the first pages of them are "
+                    "listed. Narrow the search or filters to reach the others." % (
+                        settings.ADMIN_EXACT_COUNT_LIMIT, self.model._meta.verbose_name_plural))
+        return ("Only the first %d pages are listed. Search or filter to reach "
+                "the other %s." % (settings.ADMIN_MAX_PAGES,
+                                   self.model._meta.verbose_name_plural))
+
+
+@admin.register(Task)
+class TaskAdmin(ScaleModelAdmin):
+    list_display = ("id", "name", "state", "attempts", "run_after", "finished")
+    list_filter = ("state",)
+    readonly_fields = ("claimed_by", "claimed_at", "created", "finished", "last_error")
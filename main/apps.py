@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class MainConfig(AppConfig):
     name = 'main'
+
+    def ready(self):
+        from . import db  # noqa: F401
+        from .tasks import autodiscover
+        autodiscover()
@@ -0,0 +1,56 @@
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    # WAL lets readers carry on while a write commits, and NORMAL sync is
+    # durable enough under WAL while saving an fsync per transaction
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+
+
+def is_locked(error):
+    return 'locked' in str(error) or 'busy' in str(error)
+
+
+def retry_on_locked(func):
+    """
+    Retries `func` when SQLite gives up waiting for the write lock, backing
+    off exponentially with jitter so a burst of writers spreads out.
+    Keep the wrapped function a single short transaction.
+    """
+    @wraps(func)
+    def wrapped(*args, **kwargs):
+        attempts = settings.DATABASE_LOCK_RETRIES
+        for attempt in range(attempts):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as error:
+                if not is_locked(error) or attempt == attempts - 1:
+                    raise
+                time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+    return wrapped
+
+
+def sync_replica(alias):
+    """
+    Copies the primary SQLite database over the replica `alias` with the
+    online backup API, which is safe while both are in use.
+    """
+    primary, replica = connections['default'], connections[alias]
+    if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+        raise NotImplementedError(
+            "Only SQLite replicas are copied; real replicas sync themselves.")
+    primary.ensure_connection()
+    replica.ensure_connection()
+    primary.connection.backup(replica.connection)
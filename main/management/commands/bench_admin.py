@@ -0,0 +1,111 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries, transaction
+from django.forms.renderers import get_default_renderer
+from django.template import engines
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from services import search
+from services.models import Service
+from services.seeding import seed_companies, seed_customers, seed_services
+from users.models import User
+
+# changelist pages should render within this many milliseconds
+BUDGET_MS = 100
+
+
+class Rollback(Exception):
+    pass
+
+
+def cache_templates():
+    """
+    Caches the parsed templates, of the pages and of the form widgets, as
+    Django does when DEBUG is off; with it on, the row checkboxes alone
+    reparse a few templates per row and dwarf everything else.
+    """
+    for backend in (*engines.all(), get_default_renderer().engine):
+        engine = backend.engine
+        if not engine.debug:
+            continue
+        engine.__dict__['template_loaders'] = engine.get_template_loaders(
+            [('django.template.loaders.cached.Loader', engine.loaders)])
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds large service and user tables inside a transaction, times "
+        "the admin changelists, searches and change forms of the large "
+        "models against a %d ms budget, then rolls everything back." % BUDGET_MS
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--services', type=int, default=1000000)
+        parser.add_argument('--customers', type=int, default=1000000)
+        parser.add_argument('--companies', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=5,
+                            help="Requests per page when timing it.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            self.stdout.write("Rolled back the seeded rows.")
+
+    def run(self, options):
+        self.stdout.write("Seeding %d services over %d companies and %d customers..." % (
+            options['services'], options['companies'], options['customers']))
+        start = time.perf_counter()
+        companies = seed_companies(options['companies'], prefix='bench')
+        seed_services(companies, options['services'])
+        seed_customers(options['customers'], prefix='bench')
+        if search.is_available():
+            search.rebuild()
+        with connection.cursor() as cursor:
+            # the planner statistics the changelist counts are estimated from
+            cursor.execute('ANALYZE')
+        self.stdout.write("Seeded in %.1fs" % (time.perf_counter() - start))
+
+        cache_templates()
+        admin = User.objects.create_superuser(
+            username='bench-admin', email='bench-admin@example.com', password=None)
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(admin)
+        service = Service.objects.order_by('id').values_list('id', 'name').first()
+        customer = 'bench-customer-%d' % (options['customers'] // 2)
+        # the deepest page offered; past it the changelist points to search
+        deep = settings.ADMIN_MAX_PAGES - 1
+        pages = [
+            ('services', '/admin/services/service/'),
+            ('services, deep page', '/admin/services/service/?p=%d' % deep),
+            ('services, search', '/admin/services/service/?q=%s' % service[1].split()[0]),
+            ('service change form', '/admin/services/service/%d/change/' % service[0]),
+            ('users', '/admin/users/user/'),
+            ('users, search', '/admin/users/user/?q=%s' % customer),
+            ('companies', '/admin/users/company/'),
+            ('customers', '/admin/users/customer/'),
+            ('customers, search', '/admin/users/customer/?q=%s' % customer),
+        ]
+        for name, path in pages:
+            self.time(client, name, path, options['repeat'])
+
+    def time(self, client, name, path, repeat):
+        timings = []
+        for _ in range(repeat):
+            # the seeding filled the log DEBUG keeps, which hides new queries
+            reset_queries()
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = client.get(path)
+                timings.append((time.perf_counter() - start) * 1000)
+        elapsed = statistics.median(timings)
+        style = self.style.SUCCESS if (
+            response.status_code == 200 and elapsed <= BUDGET_MS) else self.style.WARNING
+        self.stdout.write(style("%-22s %8.1f ms  %2d queries  %d  %s" % (
+            name, elapsed, len(queries), response.status_code, path)))
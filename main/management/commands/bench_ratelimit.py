@@ -0,0 +1,90 @@
+import logging
+import random
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+
+from users.models import User
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays an attack-shaped load on the login and signup forms, "
+        "credential stuffing from a few addresses over many emails plus "
+        "guessing one account's password, once without rate limits and "
+        "once with RATE_LIMITS, and reports the CPU time each took. The "
+        "accounts it creates are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--attempts', type=int, default=1000)
+        parser.add_argument('--addresses', type=int, default=5,
+                            help="Client IP addresses the attempts come from.")
+        parser.add_argument('--emails', type=int, default=200,
+                            help="Distinct emails the stuffing tries.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        # a warning per refused attempt would drown the report
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        load = self.load(options)
+        results = {}
+        for label, limits in (('unlimited', {}), ('limited', settings.RATE_LIMITS)):
+            cache.clear()
+            try:
+                with transaction.atomic(), override_settings(RATE_LIMITS=limits):
+                    User.objects.create_user(
+                        username='bench-victim', email='victim@example.com',
+                        password='Correct-horse-1')
+                    results[label] = self.replay(load)
+                    raise Rollback
+            except Rollback:
+                pass
+            seconds, statuses = results[label]
+            self.stdout.write("%-10s %6d attempts  %6.2fs CPU  %6.2f ms/attempt  %s" % (
+                label, len(load), seconds, seconds / len(load) * 1000,
+                ', '.join('%d: %d' % item for item in sorted(statuses.items()))))
+        unlimited, limited = results['unlimited'][0], results['limited'][0]
+        self.stdout.write(self.style.SUCCESS("Rate limiting saved %.0f%% of the CPU time." % (
+            (1 - limited / unlimited) * 100 if unlimited else 0)))
+
+    def load(self, options):
+        rng = random.Random(options['seed'])
+        addresses = ['203.0.113.%d' % n for n in range(1, options['addresses'] + 1)]
+        emails = ['user%d@example.com' % n for n in range(options['emails'])]
+        load = []
+        for n in range(options['attempts']):
+            address = rng.choice(addresses)
+            kind = rng.random()
+            if kind < 0.6:
+                load.append(('/login/', address, {
+                    'email': rng.choice(emails), 'password': 'Guess-%d' % n}))
+            elif kind < 0.9:
+                load.append(('/login/', address, {
+                    'email': 'victim@example.com', 'password': 'Guess-%d' % n}))
+            else:
+                load.append(('/register/customer/', address, {
+                    'username': 'bench-%d' % n, 'email': 'bench-%d@example.com' % n,
+                    'password1': 'Bench-pass-%d' % n, 'password2': 'Bench-pass-%d' % n,
+                    'birth': '1990-01-01'}))
+        return load
+
+    def replay(self, load):
+        client = Client(HTTP_HOST='localhost')
+        statuses = Counter()
+        start = time.process_time()
+        for path, address, data in load:
+            response = client.post(path, data, REMOTE_ADDR=address)
+            statuses[response.status_code] += 1
+            # a signup logs the client in; attackers start afresh
+            client.cookies.clear()
+        return time.process_time() - start, statuses
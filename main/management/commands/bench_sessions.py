@@ -0,0 +1,72 @@
+import random
+import time
+from importlib import import_module
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from main import sessions
+
+ENGINES = (
+    ('db', 'django.contrib.sessions.backends.db'),
+    ('cached', 'main.sessions'),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the stock database session engine with the cached one in "
+        "main/sessions.py: creates sessions, then loads and saves random "
+        "ones, reporting operations per second and queries per operation. "
+        "The sessions it creates are deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=1000)
+        parser.add_argument('--reads', type=int, default=20000)
+        parser.add_argument('--writes', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.queries = 0
+        with connection.execute_wrapper(self.count_query):
+            for label, engine in ENGINES:
+                sessions.cache.clear()
+                store = import_module(engine).SessionStore
+                rng = random.Random(options['seed'])
+                keys = []
+                try:
+                    self.measure(label, "create", options['sessions'],
+                                 lambda n: keys.append(self.create(store, n)))
+                    self.measure(label, "load", options['reads'],
+                                 lambda n: store(rng.choice(keys)).load())
+                    self.measure(label, "save", options['writes'],
+                                 lambda n: self.touch(store(rng.choice(keys)), n))
+                finally:
+                    model = store.get_model_class()
+                    for start in range(0, len(keys), 500):
+                        model.objects.filter(session_key__in=keys[start:start + 500]).delete()
+
+    def count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def create(self, store, n):
+        session = store()
+        session['_auth_user_id'] = str(n)
+        session.create()
+        return session.session_key
+
+    def touch(self, session, n):
+        session['last_seen'] = n
+        session.save()
+
+    def measure(self, label, operation, count, func):
+        queries = self.queries
+        start = time.perf_counter()
+        for n in range(count):
+            func(n)
+        elapsed = time.perf_counter() - start
+        self.stdout.write("%-7s %-7s %7d ops %10.0f ops/s %6.2f queries/op" % (
+            label, operation, count, count / elapsed if elapsed else 0,
+            (self.queries - queries) / count if count else 0))
@@ -0,0 +1,171 @@
+import contextlib
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import time
+
+import django
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from main.routes import iter_routes, sample_path, sample_values
+from users.models import User
+
+ROLES = ('anonymous', 'company', 'customer')
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Requests every project URL in-process with Django's test client, as "
+        "an anonymous visitor, a company and a customer, and reports latency "
+        "percentiles, queries per request and throughput. Run seed_netfix "
+        "first. --output writes the results as JSON for --compare."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50,
+                            help="Requests per URL and role.")
+        parser.add_argument('--roles', default=','.join(ROLES),
+                            help="Comma-separated subset of %s." % ', '.join(ROLES))
+        parser.add_argument('--cold', action='store_true',
+                            help="Clear the cache before every request.")
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+        parser.add_argument('--compare', help="Print the change against an earlier JSON file.")
+
+    def handle(self, *args, **options):
+        roles = options['roles'].split(',')
+        unknown = set(roles) - set(ROLES)
+        if unknown:
+            raise CommandError("Unknown roles: %s" % ', '.join(sorted(unknown)))
+        users = {
+            'anonymous': None,
+            'company': User.objects.filter(is_company=True, company__isnull=False).first(),
+            'customer': User.objects.filter(is_customer=True, customer__isnull=False).first(),
+        }
+        values = sample_values()
+
+        results = []
+        # server errors are counted per URL; their tracebacks would bury
+        # the report
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver']):
+                for route, name in iter_routes():
+                    path = sample_path(route, values)
+                    if path is None:
+                        self.stderr.write("Skipping %s: nothing to fill it with" % route)
+                        continue
+                    for role in roles:
+                        if role != 'anonymous' and users[role] is None:
+                            continue
+                        results.append(self.bench(
+                            path, route, name, role, users[role], options))
+        finally:
+            request_logger.setLevel(level)
+
+        self.table(results)
+        report = {
+            'created': timezone.now().isoformat(),
+            'commit': self.commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'requests_per_url': options['requests'],
+            'cold': options['cold'],
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write("Wrote %s" % options['output'])
+        if options['compare']:
+            with open(options['compare']) as previous:
+                self.compare(json.load(previous), report)
+
+    def bench(self, path, route, name, role, user, options):
+        client = Client(raise_request_exception=False)
+        latencies, queries, statuses = [], [], {}
+        for _ in range(options['requests']):
+            # logout and similar views end the session; log back in outside
+            # of the timed section
+            if user is not None and '_auth_user_id' not in client.session:
+                client.force_login(user)
+            if options['cold']:
+                cache.clear()
+            captured = []
+
+            def capture(execute, sql, params, many, context):
+                captured.append(sql)
+                return execute(sql, params, many, context)
+
+            # reads routed to the replica count as much as the primary's
+            with contextlib.ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(capture))
+                start = time.perf_counter()
+                response = client.get(path)
+                # a streamed body is produced, and queried for, as it is read
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                latencies.append((time.perf_counter() - start) * 1000)
+            queries.append(len(captured))
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        return {
+            'route': route,
+            'name': name,
+            'path': path,
+            'role': role,
+            'statuses': {str(code): count for code, count in sorted(statuses.items())},
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'mean_ms': round(statistics.mean(latencies), 3),
+            'queries': round(statistics.mean(queries), 2),
+            'max_queries': max(queries),
+            'throughput_rps': round(len(latencies) / (sum(latencies) / 1000), 1),
+        }
+
+    def table(self, results):
+        self.stdout.write("%-36s %-9s %-10s %8s %8s %8s %7s %8s" % (
+            'path', 'role', 'status', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'req/s'))
+        for result in results:
+            status = ','.join(result['statuses'])
+            style = self.style.ERROR if any(
+                code.startswith('5') for code in result['statuses']) else str
+            self.stdout.write(style("%-36s %-9s %-10s %8.2f %8.2f %8.2f %7.1f %8.0f" % (
+                result['path'][:36], result['role'], status, result['p50_ms'],
+                result['p95_ms'], result['p99_ms'], result['queries'],
+                result['throughput_rps'])))
+
+    def compare(self, previous, current):
+        before = {(r['route'], r['role']): r for r in previous['results']}
+        self.stdout.write("\nAgainst %s (%s):" % (
+            previous.get('commit') or 'previous run', previous.get('created')))
+        self.stdout.write("%-36s %-9s %14s %14s" % ('route', 'role', 'p95 ms', 'queries'))
+        for result in current['results']:
+            old = before.get((result['route'], result['role']))
+            if old is None:
+                continue
+            self.stdout.write("%-36s %-9s %6.2f -> %-6.2f %5.1f -> %-5.1f" % (
+                result['route'][:36], result['role'], old['p95_ms'],
+                result['p95_ms'], old['queries'], result['queries']))
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
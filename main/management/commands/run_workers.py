@@ -0,0 +1,102 @@
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing.managers import SyncManager
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from main import tasks
+from main.models import Task
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the background tasks queued in the database with a pool of "
+        "worker threads, or processes for CPU-bound tasks, until stopped "
+        "with Ctrl-C or SIGTERM. Failed tasks are retried with exponential "
+        "backoff and left dead after TASK_MAX_ATTEMPTS runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--processes', action='store_true',
+                            help="Run the workers in processes rather than threads.")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds an idle worker waits before looking again.")
+        parser.add_argument('--report-interval', type=float, default=60.0,
+                            help="Seconds between throughput reports.")
+        parser.add_argument('--burst', action='store_true',
+                            help="Exit once no task is due.")
+        parser.add_argument('--retry-dead', action='store_true',
+                            help="Queue the dead tasks again before starting.")
+
+    def handle(self, *args, **options):
+        if options['retry_dead']:
+            count = Task.objects.filter(state=Task.DEAD).update(
+                state=Task.QUEUED, attempts=0, finished=None)
+            self.stdout.write("Queued %d dead tasks again." % count)
+
+        manager = None
+        if options['processes']:
+            manager = SyncManager()
+            manager.start(tasks.ignore_interrupts)
+            stop = manager.Event()
+            counters = tasks.Counters(manager.dict(), manager.Lock())
+            # the children open their own connections
+            connection.close()
+            pool = ProcessPoolExecutor(options['workers'], initializer=tasks.setup_process)
+        else:
+            stop = threading.Event()
+            counters = tasks.Counters()
+            pool = ThreadPoolExecutor(options['workers'])
+
+        def shut_down(signum, frame):
+            self.stdout.write("Stopping after the running tasks...")
+            stop.set()
+        signal.signal(signal.SIGINT, shut_down)
+        signal.signal(signal.SIGTERM, shut_down)
+
+        self.stdout.write("Running %d worker %s." % (
+            options['workers'], 'processes' if options['processes'] else 'threads'))
+        started = time.perf_counter()
+        with pool:
+            futures = [pool.submit(tasks.work, number, stop, counters,
+                                   options['poll_interval'], options['burst'])
+                       for number in range(options['workers'])]
+            self.supervise(futures, stop, counters, options['report_interval'])
+            for future in futures:
+                future.result()
+        self.report(counters.snapshot(), time.perf_counter() - started, {})
+        if manager is not None:
+            manager.shutdown()
+
+    def supervise(self, futures, stop, counters, interval):
+        # reports throughput, and housekeeps the queue every minute
+        last_report = last_housekeeping = time.perf_counter()
+        reported = {}
+        while not all(future.done() for future in futures) and not stop.is_set():
+            time.sleep(0.5)
+            now = time.perf_counter()
+            if now - last_housekeeping >= 60:
+                requeued = tasks.requeue_abandoned()
+                if requeued:
+                    self.stderr.write("Took back %d abandoned tasks." % requeued)
+                tasks.purge_finished()
+                last_housekeeping = now
+            if now - last_report >= interval:
+                current = counters.snapshot()
+                self.report(current, now - last_report, reported)
+                reported, last_report = current, now
+
+    def report(self, counts, seconds, since):
+        ran = {outcome: count - since.get(outcome, 0) for outcome, count in counts.items()}
+        total = sum(ran.values())
+        depth, age = tasks.depth()
+        self.stdout.write(
+            "%d tasks in %.0fs (%.1f/s): %d done, %d retrying, %d dead, %d lost; "
+            "%d queued, oldest due %.0fs ago" % (
+                total, seconds, total / seconds if seconds else 0,
+                ran.get(Task.DONE, 0), ran.get(Task.QUEUED, 0), ran.get(Task.DEAD, 0),
+                ran.get('lost', 0), depth[Task.QUEUED], age))
@@ -0,0 +1,97 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from services import availability, categories, reviews, rollups, search, similar, stats
+from services.cache import NAVBAR, bump
+from services.models import Service
+from services.seeding import (
+    seed_availability, seed_companies, seed_customers, seed_services, seed_requests,
+    seed_reviews)
+from users.models import User, Company
+
+
+class Command(BaseCommand):
+    help = (
+        "Fills the database with generated companies, customers, services "
+        "across every field, service requests and reviews, using bulk "
+        "inserts. Seeded users have unusable passwords."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--companies', type=int, default=1000)
+        parser.add_argument('--customers', type=int, default=5000)
+        parser.add_argument('--services', type=int, default=50000)
+        parser.add_argument('--requests', type=int, default=20000)
+        parser.add_argument('--reviews', type=int, default=20000)
+        parser.add_argument('--prefix', default='seed',
+                            help="Prefix of the seeded usernames.")
+        parser.add_argument('--seed', type=int, default=0,
+                            help="Random seed, for reproducible datasets.")
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=prefix + '-').exists():
+            raise CommandError(
+                "Users prefixed '%s-' already exist; pick another --prefix." % prefix)
+        rng = random.Random(options['seed'])
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            step = self.step("companies")
+            companies = seed_companies(options['companies'], prefix=prefix)
+            step(len(companies))
+
+            step = self.step("availability windows")
+            step(seed_availability(companies, rng=rng))
+
+            step = self.step("customers")
+            customers = seed_customers(options['customers'], prefix=prefix, rng=rng)
+            step(len(customers))
+
+            step = self.step("services")
+            step(seed_services(companies, options['services'], rng=rng))
+
+            step = self.step("service requests")
+            step(seed_requests(customers, options['requests'], rng=rng)
+                 if customers else 0)
+
+            step = self.step("reviews")
+            step(seed_reviews(customers, options['reviews'], rng=rng)
+                 if customers else 0)
+
+            # bulk inserts skip the signals that maintain these
+            step = self.step("ratings")
+            step(reviews.reconcile(Service) + reviews.reconcile(Company))
+            step = self.step("stats")
+            stats.rebuild()
+            step(None)
+            step = self.step("activity rollups")
+            step(rollups.backfill())
+            step = self.step("free slots")
+            step(availability.refresh())
+            if search.is_available():
+                step = self.step("search index")
+                step(search.rebuild())
+        if similar.is_available():
+            # after the seeding transaction, so it does not hold the write
+            # lock while vectorizing
+            step = self.step("similar services")
+            step(similar.build())
+        bump('catalogue', NAVBAR, *categories.scopes())
+
+        self.stdout.write(self.style.SUCCESS(
+            "Seeded in %.1fs" % (time.perf_counter() - started)))
+
+    def step(self, name):
+        self.stdout.write("Seeding %s..." % name, ending='')
+        self.stdout.flush()
+        started = time.perf_counter()
+
+        def done(count):
+            self.stdout.write(" %s(%.1fs)" % (
+                '' if count is None else '%d ' % count,
+                time.perf_counter() - started))
+        return done
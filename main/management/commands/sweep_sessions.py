@@ -0,0 +1,38 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main.sessions import sweep_expired
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes expired sessions a batch at a time, each batch its own "
+        "short transaction, pausing between batches so logins are not held "
+        "up behind one long delete as with clearsessions. Safe to run often."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.SESSION_SWEEP_BATCH_SIZE)
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help="Seconds to wait between batches.")
+        parser.add_argument('--limit', type=int, default=0,
+                            help="Stop after deleting about this many sessions; 0 for no limit.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        limit = options['limit']
+        start = time.perf_counter()
+        deleted = batches = 0
+        while True:
+            count = sweep_expired(batch_size)
+            deleted += count
+            batches += 1
+            if count < batch_size or (limit and deleted >= limit):
+                break
+            time.sleep(options['pause'])
+        self.stdout.write(self.style.SUCCESS(
+            "Deleted %d expired sessions in %d batches in %.2fs" % (
+                deleted, batches, time.perf_counter() - start)))
@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main.db import sync_replica
+from services.cache import bump
+
+
+class Command(BaseCommand):
+    help = "Refreshes the local SQLite read replica from the primary database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=settings.REPLICA_DATABASE or 'replica',
+                            help="Replica alias to refresh.")
+
+    def handle(self, *args, **options):
+        alias = options['database']
+        if alias not in settings.DATABASES or alias == 'default':
+            raise CommandError("'%s' is not a replica alias." % alias)
+        start = time.perf_counter()
+        try:
+            sync_replica(alias)
+        except NotImplementedError as error:
+            raise CommandError(error)
+        # pages rendered from the old copy must not be served any more
+        bump('replica')
+        self.stdout.write(self.style.SUCCESS(
+            "Copied the primary to '%s' in %.2fs" % (alias, time.perf_counter() - start)))
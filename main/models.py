@@ -1,3 +1,44 @@
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
 
-# Create your models here.
+
+class Task(models.Model):
+    """
+    A call of a function registered with main.tasks.task, waiting for or
+    run by a `manage.py run_workers` worker.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    # failed every attempt; kept for inspection and `run_workers --retry-dead`
+    DEAD = 'dead'
+    STATES = [(state, state) for state in (QUEUED, RUNNING, DONE, DEAD)]
+
+    name = models.CharField(max_length=200)
+    kwargs = models.JSONField(default=dict)
+    state = models.CharField(max_length=10, choices=STATES, default=QUEUED)
+    # at most one queued task per key; enqueueing another is a no-op
+    dedupe_key = models.CharField(max_length=200, null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField()
+    # not claimed before this, which is how retries back off
+    run_after = models.DateTimeField(default=timezone.now)
+    claimed_by = models.CharField(max_length=100, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dedupe_key'], condition=Q(state='queued'),
+                                    name='task_queued_dedupe_key_unique'),
+        ]
+        indexes = [
+            # the claim query: the next due queued task
+            models.Index(fields=['state', 'run_after', 'id'], name='task_state_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.state})"
@@ -0,0 +1,95 @@
+import hashlib
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.shortcuts import render
+
+PREFIX = 'ratelimit:'
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def submitted_email(request):
+    return request.POST.get('email', '').strip().lower()
+
+
+def user_id(request):
+    return request.user.pk if request.user.is_authenticated else ''
+
+
+# what each kind of limit counts attempts by
+KEYS = {
+    'ip': client_ip,
+    'email': submitted_email,
+    'user': user_id,
+}
+
+
+def _key(name, kind, value):
+    digest = hashlib.md5(str(value).encode()).hexdigest()
+    return '%s%s:%s:%s' % (PREFIX, name, kind, digest)
+
+
+def hit(key, limit, window, now=None):
+    """
+    Counts an attempt under `key` if fewer than `limit` were made in the
+    last `window` seconds, and returns 0; otherwise returns the seconds
+    to wait. The window slides: the count of the previous fixed window
+    is weighted by how much of it still overlaps, which takes two cache
+    reads and one write instead of a timestamp per attempt.
+    """
+    now = time.time() if now is None else now
+    number, elapsed = divmod(now, window)
+    current, previous = '%s:%d' % (key, number), '%s:%d' % (key, number - 1)
+    counts = cache.get_many([current, previous])
+    made = counts.get(previous, 0) * (1 - elapsed / window) + counts.get(current, 0)
+    if made >= limit:
+        return max(1, math.ceil(window - elapsed))
+    # a fixed window is read until the end of the next one
+    if not cache.add(current, 1, math.ceil(window * 2)):
+        try:
+            cache.incr(current)
+        except ValueError:
+            # expired between the two calls
+            cache.set(current, 1, math.ceil(window * 2))
+    return 0
+
+
+def check(name, request):
+    """
+    Counts a `name` attempt against each of its RATE_LIMITS, and returns
+    the seconds to wait before trying again, or 0 when it may go ahead.
+    """
+    wait = 0
+    for kind, (limit, window) in settings.RATE_LIMITS.get(name, {}).items():
+        value = KEYS[kind](request)
+        if value == '':
+            continue
+        wait = max(wait, hit(_key(name, kind, value), limit, window))
+    return wait
+
+
+def ratelimit(name):
+    """
+    Limits the POSTs to a view by the RATE_LIMITS of `name`, answering
+    429 Too Many Requests once one is reached, before the view does any
+    work such as hashing a password.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method == 'POST':
+                wait = check(name, request)
+                if wait:
+                    response = render(request, 'main/ratelimited.html',
+                                      {'minutes': math.ceil(wait / 60)}, status=429)
+                    response['Retry-After'] = str(wait)
+                    return response
+            return view(request, *args, **kwargs)
+        return wrapped
+    return decorator
@@ -0,0 +1,62 @@
+import re
+
+from django.urls import URLPattern, URLResolver, get_resolver
+
+from services.models import Service, ServiceRequest
+from users.models import Company, Customer
+
+# namespaces left out of project-wide sweeps
+SKIPPED_NAMESPACES = {'admin'}
+
+PARAMETER = re.compile(r'<(?:(?P<converter>\w+):)?(?P<name>\w+)>')
+
+
+def iter_routes(resolver=None, prefix=''):
+    """
+    Yields (route, name) for every URL pattern of the project, with `route`
+    the full pattern string, e.g. 'services/<int:id>'.
+    """
+    resolver = resolver or get_resolver()
+    for pattern in resolver.url_patterns:
+        route = prefix + str(pattern.pattern)
+        if isinstance(pattern, URLResolver):
+            if pattern.namespace in SKIPPED_NAMESPACES:
+                continue
+            yield from iter_routes(pattern, route)
+        elif isinstance(pattern, URLPattern):
+            yield route.lstrip('^').rstrip('$'), pattern.name
+
+
+def sample_values():
+    """ Values for each URL parameter, taken from the current database. """
+    service = Service.objects.order_by('-date', '-id').only('id', 'field').first()
+    company = Company.objects.select_related('user').only('user__username').first()
+    customer = Customer.objects.select_related('user').only('user__username').first()
+    request = ServiceRequest.objects.only('id').first()
+    return {
+        'id': service and service.pk,
+        'field': service and service.field.slug,
+        'company_name': company and company.user.username,
+        'customer_name': customer and customer.user.username,
+        'request_id': request and request.pk,
+    }
+
+
+def sample_path(route, values):
+    """
+    Fills the parameters of `route` from sample_values(), or returns None
+    if the database has nothing to fill one of them with.
+    """
+    def value_for(match):
+        name = match.group('name')
+        if name == 'name':
+            name = 'customer_name' if route.startswith('customer/') else 'company_name'
+        value = values.get(name)
+        if value is None:
+            raise LookupError(name)
+        return str(value)
+
+    try:
+        return '/' + PARAMETER.sub(value_for, route)
+    except LookupError:
+        return None
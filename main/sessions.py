@@ -0,0 +1,176 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.sessions.backends import db
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+
+from .db import retry_on_locked
+
+
+class SessionCache:
+    """
+    A bounded least-recently-used map of session key to (session data,
+    expiry date, version), whose entries are dropped `ttl` seconds after
+    they were stored.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            stored_at, data, expire_date, version = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return data, expire_date, version
+
+    def set(self, key, data, expire_date, version):
+        with self.lock:
+            self.entries[key] = (time.monotonic(), data, expire_date, version)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+@retry_on_locked
+@transaction.atomic
+def sweep_expired(batch_size):
+    """
+    Deletes up to `batch_size` expired sessions in one short transaction
+    and returns how many it deleted.
+    """
+    model = SessionStore.get_model_class()
+    keys = list(model.objects.filter(expire_date__lt=timezone.now()).values_list(
+        'session_key', flat=True)[:batch_size])
+    if keys:
+        model.objects.filter(session_key__in=keys).delete()
+    return len(keys)
+
+
+# Versions
+#
+# Every save or deletion of a session gives it a new version in the
+# SESSION_CACHE_ALIAS cache, which all processes share: in memory for a
+# single process, memcached for several, as it is read on every
+# authenticated request and must cost less than the query it saves. A
+# process only serves its cached copy of a session while the shared
+# version is still the one it loaded, so a logout or a cycle_key in any
+# process is seen by every other at once. A version that is missing,
+# evicted say, means a read from the database.
+
+def version_key(session_key):
+    return 'session:version:' + session_key
+
+
+def current_version(session_key):
+    return caches[settings.SESSION_CACHE_ALIAS].get(version_key(session_key))
+
+
+def add_version(session_key):
+    caches[settings.SESSION_CACHE_ALIAS].add(
+        version_key(session_key), uuid.uuid4().hex, settings.SESSION_COOKIE_AGE)
+
+
+def new_version(session_key):
+    version = uuid.uuid4().hex
+    caches[settings.SESSION_CACHE_ALIAS].set(
+        version_key(session_key), version, settings.SESSION_COOKIE_AGE)
+    return version
+
+
+cache = SessionCache(settings.SESSION_CACHE_MAX_ENTRIES, settings.SESSION_CACHE_TTL)
+
+
+class SessionStore(db.SessionStore):
+    """
+    The database session engine with a write-through cache of the hot
+    sessions in this process, so most requests of a logged-in user load
+    their session with a read of the shared version instead of a query.
+    """
+
+    def cached(self, session_key):
+        """ The data of `session_key` cached here, if still current. """
+        entry = cache.get(session_key) if session_key else None
+        if entry is None:
+            return None
+        data, expire_date, version = entry
+        if (expire_date <= timezone.now() or version is None
+                or current_version(session_key) != version):
+            cache.delete(session_key)
+            return None
+        return data
+
+    def load(self):
+        data = self.cached(self.session_key)
+        if data is not None:
+            return self.decode(data)
+        # the version is read before the load: a change committed in
+        # between moves it on, so the copy is reloaded on its next use
+        # rather than served stale
+        version = current_version(self.session_key) if self.session_key else None
+        s = self._get_session_from_db()
+        if s is None:
+            return {}
+        if version is None:
+            # cached from the next load on; giving the session a version
+            # only once it is found keeps made-up keys out of the cache
+            add_version(s.session_key)
+        else:
+            cache.set(s.session_key, s.session_data, s.expire_date, version)
+        return self.decode(s.session_data)
+
+    def exists(self, session_key):
+        return self.cached(session_key) is not None or super().exists(session_key)
+
+    def create_model_instance(self, data):
+        obj = super().create_model_instance(data)
+        self._saving = obj
+        return obj
+
+    def save(self, must_create=False):
+        self._saving = None
+        try:
+            super().save(must_create)
+        except Exception:
+            if self.session_key:
+                cache.delete(self.session_key)
+            raise
+        obj = self._saving
+        if obj is not None:
+            cache.set(obj.session_key, obj.session_data, obj.expire_date,
+                      new_version(obj.session_key))
+
+    def delete(self, session_key=None):
+        key = session_key or self.session_key
+        super().delete(session_key)
+        if key:
+            cache.delete(key)
+            new_version(key)
+
+    @classmethod
+    def clear_expired(cls):
+        # clearsessions, in batches instead of one long delete
+        batch_size = settings.SESSION_SWEEP_BATCH_SIZE
+        while sweep_expired(batch_size) == batch_size:
+            pass
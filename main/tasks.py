@@ -0,0 +1,228 @@
+import json
+import os
+import random
+import signal
+import socket
+import threading
+import traceback
+from collections import namedtuple
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .db import retry_on_locked
+from .models import Task
+
+Registered = namedtuple('Registered', 'func max_attempts')
+
+# task name to Registered, filled by the @task decorator as the apps'
+# tasks modules are imported (see MainConfig.ready)
+registry = {}
+
+Claimed = namedtuple('Claimed', 'id name kwargs attempts max_attempts')
+
+
+def task(func=None, *, max_attempts=None):
+    """
+    Registers `func` to be run by the workers, under the name
+    '<module>.<function>'. Its keyword arguments must be JSON.
+    """
+    def register(func):
+        func.task_name = '%s.%s' % (func.__module__, func.__name__)
+        registry[func.task_name] = Registered(func, max_attempts)
+        return func
+    return register(func) if func is not None else register
+
+
+def enqueue(func, *, dedupe_key=None, countdown=0, **kwargs):
+    """
+    Queues a call of the task `func` with `kwargs`, `countdown` seconds
+    from now. Inside a transaction, the task is only seen by workers once
+    it commits, and is dropped if it rolls back.
+
+    With `dedupe_key`, nothing is queued while a task with that key is
+    still waiting; use it for work that only needs doing once however
+    often it is asked for, like a rebuild.
+    """
+    name = func.task_name
+    registered = registry[name]
+    Task.objects.bulk_create([Task(
+        name=name, kwargs=kwargs, dedupe_key=dedupe_key,
+        max_attempts=registered.max_attempts or settings.TASK_MAX_ATTEMPTS,
+        run_after=timezone.now() + timedelta(seconds=countdown),
+    )], ignore_conflicts=dedupe_key is not None)
+
+
+def worker_name(number):
+    return '%s:%d:%d' % (socket.gethostname(), os.getpid(), number)
+
+
+@retry_on_locked
+def claim(worker):
+    """
+    Marks the next due task running for `worker` and returns it as a
+    Claimed, or None when no task is due. A task is claimed by exactly
+    one worker however many poll at once. Its dedupe key is dropped, so
+    the same work can be queued again while it runs.
+    """
+    now = timezone.now()
+    if connection.vendor == 'sqlite':
+        # SQLite has no row locks, but one UPDATE both picks and takes the
+        # task, serialized by the database write lock
+        adapt = connection.ops.adapt_datetimefield_value
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE main_task SET state = %s, claimed_by = %s, claimed_at = %s,"
+                " attempts = attempts + 1, dedupe_key = NULL"
+                " WHERE id = (SELECT id FROM main_task WHERE state = %s AND run_after <= %s"
+                "             ORDER BY run_after, id LIMIT 1)"
+                " RETURNING id, name, kwargs, attempts, max_attempts",
+                [Task.RUNNING, worker, adapt(now), Task.QUEUED, adapt(now)])
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        pk, name, kwargs, attempts, max_attempts = row
+        return Claimed(pk, name, json.loads(kwargs), attempts, max_attempts)
+
+    # elsewhere, lock the row and have concurrent workers skip past it
+    with transaction.atomic():
+        found = Task.objects.select_for_update(skip_locked=True).filter(
+            state=Task.QUEUED, run_after__lte=now).order_by('run_after', 'id').first()
+        if found is None:
+            return None
+        found.attempts += 1
+        Task.objects.filter(pk=found.pk).update(
+            state=Task.RUNNING, claimed_by=worker, claimed_at=now,
+            attempts=found.attempts, dedupe_key=None)
+    return Claimed(found.pk, found.name, found.kwargs, found.attempts, found.max_attempts)
+
+
+def backoff(attempts):
+    """ Seconds before retrying a task that failed its `attempts`th run. """
+    delay = min(settings.TASK_RETRY_MAX_DELAY,
+                settings.TASK_RETRY_DELAY * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.5)
+
+
+@retry_on_locked
+def finish(claimed, worker, error=None):
+    """
+    Records how the run went: done, queued again after a backoff, or dead
+    once out of attempts. Returns the new state. A run that took so long
+    its task was handed to another worker (see requeue_abandoned) records
+    nothing.
+    """
+    now = timezone.now()
+    if error is None:
+        changes = {'state': Task.DONE, 'finished': now, 'last_error': ''}
+    elif claimed.attempts < claimed.max_attempts:
+        changes = {'state': Task.QUEUED, 'last_error': error,
+                   'run_after': now + timedelta(seconds=backoff(claimed.attempts))}
+    else:
+        changes = {'state': Task.DEAD, 'finished': now, 'last_error': error}
+    updated = Task.objects.filter(
+        pk=claimed.id, state=Task.RUNNING, claimed_by=worker,
+        attempts=claimed.attempts).update(**changes)
+    return changes['state'] if updated else None
+
+
+def execute(claimed, worker):
+    registered = registry.get(claimed.name)
+    if registered is None:
+        return finish(claimed._replace(max_attempts=0), worker,
+                      "No task is registered as %s." % claimed.name)
+    try:
+        registered.func(**claimed.kwargs)
+    except Exception:
+        return finish(claimed, worker, traceback.format_exc())
+    return finish(claimed, worker)
+
+
+@retry_on_locked
+@transaction.atomic
+def requeue_abandoned():
+    """
+    Queues again the tasks claimed more than TASK_TIMEOUT seconds ago,
+    whose workers presumably died; each counts as a failed attempt.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.TASK_TIMEOUT)
+    abandoned = Task.objects.filter(state=Task.RUNNING, claimed_at__lt=cutoff)
+    dead = abandoned.filter(attempts__gte=F('max_attempts')).update(
+        state=Task.DEAD, finished=timezone.now(), last_error='Timed out.')
+    return dead + abandoned.update(state=Task.QUEUED, last_error='Timed out.')
+
+
+@retry_on_locked
+def purge_finished(batch_size=1000):
+    """ Deletes a batch of done tasks older than TASK_KEEP_DONE seconds. """
+    cutoff = timezone.now() - timedelta(seconds=settings.TASK_KEEP_DONE)
+    ids = list(Task.objects.filter(state=Task.DONE, finished__lt=cutoff).values_list(
+        'id', flat=True)[:batch_size])
+    return Task.objects.filter(id__in=ids).delete()[0] if ids else 0
+
+
+class Counters:
+    """ Tasks run per outcome, shared by the workers of a pool. """
+
+    def __init__(self, values=None, lock=None):
+        self.values = {} if values is None else values
+        self.lock = lock or threading.Lock()
+
+    def add(self, outcome):
+        with self.lock:
+            self.values[outcome] = self.values.get(outcome, 0) + 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+
+def work(number, stop, counters, poll_interval=1.0, burst=False):
+    """
+    The loop of one worker: claims and runs tasks until `stop` is set, or
+    with `burst`, until no task is due.
+    """
+    worker = worker_name(number)
+    try:
+        while not stop.is_set():
+            close_old_connections()
+            claimed = claim(worker)
+            if claimed is None:
+                if burst:
+                    return
+                stop.wait(poll_interval * random.uniform(0.5, 1.5))
+                continue
+            counters.add(execute(claimed, worker) or 'lost')
+    finally:
+        connection.close()
+
+
+def ignore_interrupts():
+    # Ctrl-C reaches every process of the terminal; leave it to the parent,
+    # which stops the workers through their shared event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def setup_process():
+    ignore_interrupts()
+    django.setup()
+
+
+def autodiscover():
+    from django.utils.module_loading import autodiscover_modules
+    autodiscover_modules('tasks')
+
+
+def depth():
+    """ The number of tasks in each state, and the age of the oldest due one. """
+    counts = dict.fromkeys((state for state, _ in Task.STATES), 0)
+    counts.update(Task.objects.values_list('state').annotate(
+        number=Count('id')).order_by())
+    oldest = Task.objects.filter(state=Task.QUEUED, run_after__lte=timezone.now()).order_by(
+        'run_after', 'id').values_list('run_after', flat=True).first()
+    age = (timezone.now() - oldest).total_seconds() if oldest else 0.0
+    return counts, age
@@ -1,3 +1,580 @@
-from django.test import TestCase
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connections
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+from main import ratelimit, sessions, tasks
+from main.admin import EstimatedCountPaginator, TaskAdmin
+from main.db import sync_replica
+from main.management.commands.bench_urls import Command as BenchUrlsCommand
+from main.models import Task
+from main.routes import iter_routes, sample_path, sample_values
+from netfix.middleware import PIN_COOKIE, StaticFilesMiddleware
+from services import categories
+from services.cache import bump
+from services.models import Review, Service, ServiceRequest
+from users.models import User, Company, Customer
+
+
+@override_settings(REPLICA_DATABASE='replica')
+class ReplicaRoutingTests(TransactionTestCase):
+    databases = {'default', 'replica'}
+    # the flush after each test empties the categories the migrations made
+    fixtures = ['categories']
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(
+            username='acme', email='acme@example.com', password='secret',
+            is_company=True)
+        self.company = Company.objects.create(user=user, field=categories.by_slug('plumbing'))
+        self.sync()
+
+    def sync(self):
+        sync_replica('replica')
+        bump('replica')
+
+    def get(self, path):
+        with CaptureQueriesContext(connections['replica']) as replica, \
+                CaptureQueriesContext(connections['default']) as primary:
+            response = self.client.get(path)
+        return response, replica, primary
+
+    def test_catalogue_reads_are_served_from_the_replica(self):
+        Service.objects.create(company=self.company, name='Leak repair',
+                               description='Fixes leaks', price_hour=20,
+                               field=categories.by_slug('plumbing'))
+
+        # the write is on the primary only until the replica is synced
+        response, replica, primary = self.get('/services/')
+        self.assertNotContains(response, 'Leak repair')
+        self.assertTrue(replica.captured_queries)
+        self.assertFalse([q for q in primary.captured_queries
+                          if 'services_service' in q['sql']])
+
+        self.sync()
+        response, replica, _ = self.get('/services/')
+        self.assertContains(response, 'Leak repair')
+        self.assertTrue(replica.captured_queries)
+
+        response, replica, _ = self.get('/company/acme')
+        self.assertContains(response, 'Leak repair')
+        self.assertTrue(replica.captured_queries)
+
+    def test_benchmarks_count_the_replica_queries(self):
+        Service.objects.create(company=self.company, name='Leak repair',
+                               description='Fixes leaks', price_hour=20,
+                               field=categories.by_slug('plumbing'))
+        self.sync()
+        _, replica, primary = self.get('/services/')
+        counts = len(replica.captured_queries), len(primary.captured_queries)
+        self.assertTrue(counts[0])
+        result = BenchUrlsCommand().bench('/services/', 'services/', 'services_list',
+                                          'anonymous', None, {'requests': 1, 'cold': True})
+        self.assertEqual(result['queries'], sum(counts))
+
+    def test_client_that_wrote_reads_its_writes_from_the_primary(self):
+        customer = User.objects.create_user(
+            username='bob', email='bob@example.com', password='secret')
+        response = self.client.post(
+            '/login/', {'email': 'bob@example.com', 'password': 'secret'})
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        self.client.force_login(customer)
+        Service.objects.create(company=self.company, name='Boiler check',
+                               description='Yearly check', price_hour=30,
+                               field=categories.by_slug('plumbing'))
+        response, replica, _ = self.get('/services/')
+        self.assertContains(response, 'Boiler check')
+        self.assertFalse(replica.captured_queries)
+
+    def test_reads_outside_requests_use_the_primary(self):
+        Service.objects.create(company=self.company, name='Tap fitting',
+                               description='New taps', price_hour=25,
+                               field=categories.by_slug('plumbing'))
+        self.assertEqual(Service.objects.all().db, 'default')
+        self.assertEqual(Service.objects.count(), 1)
+
+
+runs = []
+
+
+@tasks.task(max_attempts=2)
+def record_run(value, fail=False):
+    runs.append(value)
+    if fail:
+        raise ValueError(value)
+
+
+def run_due(worker='test:0'):
+    outcomes = []
+    while True:
+        claimed = tasks.claim(worker)
+        if claimed is None:
+            return outcomes
+        outcomes.append(tasks.execute(claimed, worker))
+
+
+@override_settings(TASK_RETRY_DELAY=0)
+class TaskQueueTests(TestCase):
+
+    def setUp(self):
+        runs.clear()
+
+    def test_failing_task_is_retried_then_left_dead(self):
+        tasks.enqueue(record_run, value='a', fail=True)
+        self.assertEqual(run_due(), [Task.QUEUED, Task.DEAD])
+        dead = Task.objects.get()
+        self.assertEqual((dead.state, dead.attempts), (Task.DEAD, 2))
+        self.assertIn('ValueError', dead.last_error)
+
+    def test_dedupe_key_queues_the_work_once(self):
+        for _ in range(3):
+            tasks.enqueue(record_run, value='b', dedupe_key='b')
+        self.assertEqual(run_due(), [Task.DONE])
+        tasks.enqueue(record_run, value='b', dedupe_key='b')
+        self.assertEqual(Task.objects.filter(state=Task.QUEUED).count(), 1)
+
+    def test_booking_notifies_the_company(self):
+        company = User.objects.create_user(
+            username='acme', email='acme@example.com', password='secret',
+            is_company=True)
+        service = Service.objects.create(
+            company=Company.objects.create(user=company, field=categories.by_slug('plumbing')),
+            name='Leak repair', description='Fixes leaks', price_hour=20,
+            field=categories.by_slug('plumbing'))
+        self.client.post('/register/customer/', {
+            'username': 'bob', 'email': 'bob@example.com', 'password1': 'Secret-pass-1',
+            'password2': 'Secret-pass-1', 'birth': '1990-01-01'})
+        self.client.post('/services/%d/request_service/' % service.pk, {
+            'address': '1 Main Street', 'service_time': 2,
+            'idempotency_key': '3f2a1c9e-5d4b-4a8e-9f1c-2b3d4e5f6a7b'})
+        self.assertEqual(len(mail.outbox), 0)
+        run_due()
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ['acme@example.com', 'bob@example.com'])
+
+
+class SessionEngineTests(TestCase):
+
+    def setUp(self):
+        sessions.cache.clear()
+        caches[settings.SESSION_CACHE_ALIAS].clear()
+
+    def create(self, expiry=None, **data):
+        store = sessions.SessionStore()
+        store.update(data)
+        if expiry is not None:
+            store.set_expiry(expiry)
+        store.create()
+        return store.session_key
+
+    def test_least_recently_used_entries_are_evicted(self):
+        lru = sessions.SessionCache(max_entries=2, ttl=60)
+        lru.set('a', 'A', None, 1)
+        lru.set('b', 'B', None, 1)
+        lru.get('a')
+        lru.set('c', 'C', None, 1)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual([lru.get(key)[0] for key in 'ac'], ['A', 'C'])
+
+    def test_entries_expire_after_the_ttl(self):
+        lru = sessions.SessionCache(max_entries=2, ttl=30)
+        with mock.patch.object(sessions.time, 'monotonic', side_effect=[100, 129, 131]):
+            lru.set('a', 'A', None, 1)
+            self.assertEqual(lru.get('a')[0], 'A')
+            self.assertIsNone(lru.get('a'))
+
+    def test_writes_go_through_to_the_database(self):
+        key = self.create(seen=1)
+        with self.assertNumQueries(0):
+            self.assertEqual(sessions.SessionStore(key).load(), {'seen': 1})
+        store = sessions.SessionStore(key)
+        store['seen'] = 2
+        store.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(sessions.SessionStore(key).load(), {'seen': 2})
+        row = Session.objects.get(session_key=key)
+        self.assertEqual(row.get_decoded(), {'seen': 2})
+
+        # a lost version costs reads from the database until one is set
+        caches[settings.SESSION_CACHE_ALIAS].clear()
+        for queries in (1, 1, 0):
+            with self.assertNumQueries(queries):
+                self.assertEqual(sessions.SessionStore(key).load(), {'seen': 2})
+        with self.assertNumQueries(1):
+            self.assertEqual(sessions.SessionStore('made-up-key-0123456789').load(), {})
+        self.assertIsNone(sessions.current_version('made-up-key-0123456789'))
+
+    def test_changes_made_by_other_processes_are_never_served_stale(self):
+        deleted, changed, cycled = (self.create(user=name) for name in 'abc')
+        for key in (deleted, changed, cycled):
+            sessions.SessionStore(key).load()
+
+        # another process, with its own in-process cache
+        with mock.patch.object(sessions, 'cache', sessions.SessionCache(10, 60)):
+            sessions.SessionStore(deleted).delete()
+            store = sessions.SessionStore(changed)
+            store['user'] = 'z'
+            store.save()
+            store = sessions.SessionStore(cycled)
+            store.load()
+            store.cycle_key()
+
+        self.assertEqual(sessions.SessionStore(deleted).load(), {})
+        self.assertEqual(sessions.SessionStore(changed).load(), {'user': 'z'})
+        self.assertEqual(sessions.SessionStore(cycled).load(), {})
+        self.assertFalse(sessions.SessionStore().exists(deleted))
+
+    def test_logging_out_ends_the_session_everywhere(self):
+        user = User.objects.create_user(username='bob', email='bob@example.com',
+                                        password='secret')
+        self.client.force_login(user)
+        key = self.client.session.session_key
+        self.assertEqual(sessions.SessionStore(key).load()['_auth_user_id'], str(user.pk))
+        with mock.patch.object(sessions, 'cache', sessions.SessionCache(10, 60)):
+            self.client.get('/logout/')
+        self.assertEqual(sessions.SessionStore(key).load(), {})
+
+    def test_expired_sessions_are_swept_in_batches(self):
+        live = self.create(user='a')
+        expired = [self.create(expiry=-60, user=str(n)) for n in range(5)]
+        self.assertEqual(sessions.sweep_expired(2), 2)
+        call_command('sweep_sessions', batch_size=2, pause=0, stdout=StringIO())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), [live])
+        self.assertEqual(sessions.SessionStore(expired[0]).load(), {})
+
+
+class StaticFilesTests(TestCase):
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        for name, content in (('style.css', b'body {}'), ('style.css.br', b'br'),
+                              ('style.css.gz', b'gz')):
+            with open(os.path.join(root.name, name), 'wb') as file:
+                file.write(content)
+        with override_settings(STATIC_ROOT=root.name):
+            self.middleware = StaticFilesMiddleware(lambda request: HttpResponse(status=404))
+
+    def get(self, accept_encoding):
+        request = RequestFactory().get('/static/style.css', HTTP_ACCEPT_ENCODING=accept_encoding)
+        response = self.middleware(request)
+        return response.get('Content-Encoding'), b''.join(response.streaming_content)
+
+    def test_encodings_refused_with_a_zero_quality_are_not_sent(self):
+        self.assertEqual(self.get('br, gzip'), ('br', b'br'))
+        for refusal in ('br;q=0', 'br; q=0.0', 'br;q=0.000', 'br;Q=0', 'br;q=x'):
+            self.assertEqual(self.get(refusal + ', gzip;q=0.5'), ('gzip', b'gz'), refusal)
+        self.assertEqual(self.get('br;q=0.00, gzip;q=0.000'), (None, b'body {}'))
+
+    def test_the_wildcard_accepts_every_encoding_not_refused(self):
+        self.assertEqual(self.get('*'), ('br', b'br'))
+        self.assertEqual(self.get('br;q=0, *'), ('gzip', b'gz'))
+        self.assertEqual(self.get('gzip, *;q=0'), ('gzip', b'gz'))
+        self.assertEqual(self.get('*;q=0'), (None, b'body {}'))
+        self.assertEqual(self.get('identity'), (None, b'body {}'))
+
+
+class BenchmarkCommandTests(TestCase):
+
+    def test_seeding_and_benchmarking_every_url(self):
+        call_command('seed_netfix', prefix='bench', stdout=StringIO(), **BUDGET_SIZES[0])
+        output = tempfile.NamedTemporaryFile(suffix='.json')
+        self.addCleanup(output.close)
+        call_command('bench_urls', requests=1, roles='anonymous,customer',
+                     output=output.name, stdout=StringIO(), stderr=StringIO())
+        with open(output.name) as f:
+            results = {(result['name'], result['role']): result
+                       for result in json.load(f)['results']}
+        self.assertIn(('services_list', 'customer'), results)
+        for result in results.values():
+            self.assertFalse([code for code in result['statuses'] if code.startswith('5')],
+                             result['path'])
+        # the streamed export is read, so its queries count
+        self.assertGreater(results['services_export', 'anonymous']['queries'], 0)
+
+
+class PerformanceTests(TestCase):
+    path = '/services/'
+
+    def setUp(self):
+        cache.clear()
+        self.view = resolve(self.path).view_name
+
+    def metric(self, name):
+        """ The sample lines of `name` for the listing view, by label. """
+        lines = self.client.get('/metrics').content.decode().splitlines()
+        pattern = re.compile(r'netfix_%s(_\w+)?\{view="%s"(?:,le="([^"]+)")?\} (\S+)$' % (
+            name, re.escape(self.view)))
+        return {match.group(1, 2): float(match.group(3))
+                for match in map(pattern.match, lines) if match}
+
+    def test_responses_carry_server_timing(self):
+        timing = self.client.get(self.path)['Server-Timing']
+        match = re.fullmatch(r'sql;dur=([\d.]+);desc="(\d+) queries", '
+                             r'template;dur=([\d.]+), total;dur=([\d.]+)', timing)
+        self.assertIsNotNone(match, timing)
+        sql, queries, template, total = map(float, match.groups())
+        self.assertGreater(queries, 0)
+        self.assertGreater(template, 0)
+        self.assertLessEqual(max(sql, template), total)
+
+    def test_metrics_are_cumulative_histograms_per_view(self):
+        before = self.metric('request_duration_seconds').get(('_count', None), 0)
+        for _ in range(2):
+            self.client.get(self.path)
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4')
+        content = response.content.decode()
+        for name in ('request_duration_seconds', 'sql_queries', 'sql_duration_seconds',
+                     'template_duration_seconds'):
+            self.assertIn('# TYPE netfix_%s histogram' % name, content)
+        self.assertIn('# TYPE netfix_tasks gauge', content)
+        self.assertIn('netfix_tasks{state="queued"}', content)
+
+        samples = self.metric('request_duration_seconds')
+        buckets = [value for (suffix, bound), value in samples.items() if suffix == '_bucket']
+        self.assertEqual(buckets, sorted(buckets))
+        self.assertEqual(samples['_bucket', '+Inf'], samples['_count', None])
+        self.assertEqual(samples['_count', None], before + 2)
+        self.assertGreater(samples['_sum', None], 0)
+
+    def test_metrics_are_refused_outside_the_allowed_addresses(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.9').status_code, 403)
+        with override_settings(METRICS_ALLOWED_IPS=None):
+            self.assertEqual(
+                self.client.get('/metrics', REMOTE_ADDR='203.0.113.9').status_code, 200)
+
+    def test_sampled_slow_requests_log_their_sql(self):
+        with override_settings(PERFORMANCE_SQL_SAMPLE_RATE=1, PERFORMANCE_SLOW_REQUEST_MS=0):
+            with self.assertLogs('netfix.performance', 'WARNING') as logs:
+                self.client.get(self.path)
+        [message] = logs.output
+        self.assertIn('Slow request GET %s (%s)' % (self.path, self.view), message)
+        self.assertIn('SELECT', message)
+
+        # under the threshold, or not sampled, nothing is logged
+        for rate, threshold in ((1, 60000), (0, 0)):
+            with override_settings(PERFORMANCE_SQL_SAMPLE_RATE=rate,
+                                   PERFORMANCE_SLOW_REQUEST_MS=threshold):
+                with self.assertNoLogs('netfix.performance', 'WARNING'):
+                    self.client.get(self.path)
+
+
+class ScaleAdminTests(TestCase):
+
+    def setUp(self):
+        for n in range(5):
+            tasks.enqueue(record_run, value=str(n))
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=3)
+    def test_counts_come_from_the_statistics_or_stop_at_the_limit(self):
+        with connections['default'].cursor() as cursor:
+            cursor.execute('ANALYZE')
+        Task.objects.filter(pk=Task.objects.first().pk).delete()
+        self.assertEqual(EstimatedCountPaginator(Task.objects.order_by('id'), 2).count, 5)
+        queued = EstimatedCountPaginator(Task.objects.filter(state=Task.QUEUED).order_by('id'), 2)
+        self.assertEqual(queued.count, 3)
+        self.assertTrue(queued.truncated)
+        self.assertFalse(queued.listed_all)
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=3)
+    def test_pages_past_the_limit_are_reached_without_statistics(self):
+        ids = list(Task.objects.order_by('-id').values_list('id', flat=True))
+        with mock.patch('main.admin.estimated_count', return_value=None):
+            paginator = EstimatedCountPaginator(Task.objects.order_by('-id'), 2)
+            self.assertEqual(paginator.count, ids[0])
+            self.assertEqual(paginator.num_pages, (ids[0] + 1) // 2)
+            self.assertEqual([task.pk for task in paginator.page(3)], ids[4:])
+            self.assertTrue(paginator.listed_all)
+            with override_settings(ADMIN_MAX_PAGES=2):
+                self.assertEqual(EstimatedCountPaginator(Task.objects.order_by('-id'), 2)
+                                 .num_pages, 2)
+
+    @override_settings(ADMIN_MAX_PAGES=2)
+    def test_changelists_point_past_the_last_page_to_search(self):
+        self.client.force_login(User.objects.create_superuser(
+            username='admin', email='admin@example.com', password=None))
+        with mock.patch.object(TaskAdmin, 'list_per_page', 2):
+            response = self.client.get('/admin/main/task/?state__exact=queued&p=7')
+            self.assertRedirects(response, '/admin/main/task/?state__exact=queued&p=1',
+                                 fetch_redirect_response=False)
+            response = self.client.get('/admin/main/task/' + response.url)
+        self.assertEqual(len(response.context['cl'].result_list), 2)
+        self.assertContains(response, 'Only the first 2 pages are listed.', count=2)
+
+    def test_changelists_query_a_fixed_number_of_times(self):
+        self.client.force_login(User.objects.create_superuser(
+            username='admin', email='admin@example.com', password=None))
+        company = User.objects.create_user(
+            username='acme', email='acme@example.com', password='secret',
+            is_company=True)
+        company = Company.objects.create(user=company, field=categories.by_slug('plumbing'))
+        for n in range(3):
+            Service.objects.create(
+                company=company, name='Leak repair %d' % n, description='Fixes leaks',
+                price_hour=20, field=categories.by_slug('plumbing'))
+        for path in ('/admin/services/service/', '/admin/services/service/?q=leak',
+                     '/admin/users/company/', '/admin/users/user/?q=acme',
+                     '/admin/main/task/'):
+            with CaptureQueriesContext(connections['default']) as queries:
+                response = self.client.get(path)
+            self.assertEqual(response.status_code, 200, path)
+            self.assertLessEqual(len(queries), 6, path)
+
+
+class RateLimitTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_window_slides(self):
+        self.assertEqual([ratelimit.hit('k', 2, 10, now) for now in (0, 1, 2)], [0, 0, 8])
+        # half the previous window still counts
+        self.assertEqual([ratelimit.hit('k', 2, 10, now) for now in (15, 15)], [0, 5])
+        self.assertEqual(ratelimit.hit('k', 2, 10, 30), 0)
+
+    @override_settings(RATE_LIMITS={'login': {'ip': (5, 60), 'email': (2, 60)}})
+    def test_login_stops_hashing_once_limited(self):
+        with mock.patch('users.views.authenticate', return_value=None) as authenticate:
+            statuses = [self.client.post('/login/', {
+                'email': email, 'password': 'wrong'}).status_code
+                for email in ('bob@example.com', 'BOB@example.com ', 'bob@example.com',
+                              'eve@example.com', 'eve@example.com', 'eve@example.com')]
+        self.assertEqual(statuses, [200, 200, 429, 200, 200, 429])
+        self.assertEqual(authenticate.call_count, 4)
+        # by now the address has made more than its five attempts
+        response = self.client.post('/login/', {'email': 'amy@example.com', 'password': 'x'})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+
+class ConcurrentClaimTests(TransactionTestCase):
+
+    def test_each_task_is_run_once(self):
+        runs.clear()
+        for n in range(40):
+            tasks.enqueue(record_run, value=n)
+        stop, counters = threading.Event(), tasks.Counters()
+        threads = [threading.Thread(target=tasks.work, args=(n, stop, counters),
+                                    kwargs={'burst': True}) for n in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(runs), list(range(40)))
+        self.assertEqual(counters.snapshot(), {Task.DONE: 40})
+
+
+# the datasets every page is requested at; the listings grow fourfold
+# between them, and SAMPLE_ROWS more of each kind go to the sampled
+# service, company and customer, whose pages would not grow otherwise
+BUDGET_SIZES = (
+    {'companies': 3, 'customers': 8, 'services': 24, 'requests': 24, 'reviews': 24},
+    {'companies': 12, 'customers': 32, 'services': 96, 'requests': 96, 'reviews': 96},
+)
+SAMPLE_ROWS = (2, 8)
+
+# the most queries a page may make as any role, by URL name
+QUERY_BUDGETS = {
+    'services_list': 7,
+    'index': 6,
+    'company_profile': 5,
+    'customer_profile': 5,
+    'services_field': 5,
+    'services_availability': 5,
+    'request_service': 5,
+    'logout': 4,
+    'services_create': 3,
+    'review_service': 3,
+}
+DEFAULT_QUERY_BUDGET = 2
+# generous, for slow machines; every page is requested with a cold cache
+RESPONSE_TIME_BUDGET_MS = 500
+
+
+class QueryBudgetTests(TestCase):
+    """
+    Requests every project URL as a visitor, a company and a customer at
+    both BUDGET_SIZES. Each page must make as many queries at both, within
+    its budget, and answer within RESPONSE_TIME_BUDGET_MS.
+    """
+
+    def seed(self, size):
+        call_command('seed_netfix', prefix='budget%d' % size, seed=size,
+                     stdout=StringIO(), **BUDGET_SIZES[size])
+        values = sample_values()
+        rows = SAMPLE_ROWS[size]
+        service = Service.objects.get(pk=values['id'])
+        company = Company.objects.get(user__username=values['company_name'])
+        customer = Customer.objects.get(user__username=values['customer_name'])
+        for n in range(rows):
+            Service.objects.create(
+                company=company, name='Sample %d-%d' % (size, n), description='Sample',
+                price_hour=10, field=company.field or service.field)
+        ServiceRequest.objects.bulk_create([
+            ServiceRequest(customer=customer, service=service, address='1 Sample Street',
+                           service_time=1, price=service.price_hour,
+                           idempotency_key=uuid.uuid4())
+            for _ in range(rows)])
+        Review.objects.bulk_create([
+            Review(customer=reviewer, service=service, stars=4)
+            for reviewer in Customer.objects.exclude(reviews__service=service)[:rows]])
+        return values, {'anonymous': None, 'company': company.user, 'customer': customer.user}
+
+    def sweep(self, values, users):
+        """ {(role, URL name): (path, status, queries, milliseconds)} """
+        measured = {}
+        # logging out last, or the roles after it would be anonymous
+        routes = sorted(iter_routes(), key=lambda route: route[1] == 'logout')
+        for role, user in users.items():
+            self.client.logout()
+            if user is not None:
+                self.client.force_login(user)
+            for route, name in routes:
+                path = sample_path(route, values)
+                if path is None:
+                    continue
+                cache.clear()
+                with CaptureQueriesContext(connections['default']) as queries:
+                    started = time.perf_counter()
+                    response = self.client.get(path)
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                    elapsed = (time.perf_counter() - started) * 1000
+                measured[role, name] = (path, response.status_code, queries.captured_queries,
+                                        elapsed)
+        return measured
+
+    def test_pages_keep_their_query_counts_as_the_data_grows(self):
+        small, large = (self.sweep(*self.seed(size)) for size in range(len(BUDGET_SIZES)))
+        for key, (path, status, queries, elapsed) in sorted(large.items()):
+            role, name = key
+            before = len(small[key][2]) if key in small else len(queries)
+            budget = QUERY_BUDGETS.get(name, DEFAULT_QUERY_BUDGET)
+            report = "%s as %s: %d queries at the small size, %d at the large one " \
+                     "(budget %d):\n%s" % (path, role, before, len(queries), budget,
+                                           '\n'.join(query['sql'] for query in queries))
+            with self.subTest(role=role, name=name):
+                self.assertLess(status, 500, path)
+                self.assertEqual(len(queries), before, report)
+                self.assertLessEqual(len(queries), budget, report)
+                self.assertLessEqual(elapsed, RESPONSE_TIME_BUDGET_MS,
+                                     "%s as %s took %.0f ms" % (path, role, elapsed))
@@ -0,0 +1,109 @@
+import bisect
+import contextvars
+import threading
+import time
+
+# upper bounds, in seconds, of the latency histogram buckets
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0)
+# upper bounds of the queries-per-request histogram buckets
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+
+class RequestTimings:
+    """ What one request spent, filled in while it is served. """
+
+    def __init__(self, record_sql=False):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_depth = 0
+        # only filled when the request was sampled for the slow log
+        self.statements = [] if record_sql else None
+
+    def sql_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.sql_seconds += elapsed
+            if self.statements is not None:
+                self.statements.append((elapsed, sql, params))
+
+
+_current = contextvars.ContextVar('netfix_request_timings', default=None)
+
+
+def start_request(timings):
+    return _current.set(timings)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """ Per-view histograms of this process, rendered for Prometheus. """
+
+    METRICS = (
+        ('request_duration_seconds', 'Time to serve a request.', SECONDS_BUCKETS),
+        ('sql_queries', 'SQL queries run per request.', QUERY_BUCKETS),
+        ('sql_duration_seconds', 'Time spent in SQL per request.', SECONDS_BUCKETS),
+        ('template_duration_seconds', 'Time spent rendering templates per request.',
+         SECONDS_BUCKETS),
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def observe(self, view, total, timings):
+        values = (total, timings.queries, timings.sql_seconds, timings.template_seconds)
+        with self.lock:
+            for (name, _, buckets), value in zip(self.METRICS, values):
+                key = (name, view)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(buckets)
+                self.histograms[key].observe(value)
+
+    def render(self, prefix='netfix_'):
+        lines = []
+        with self.lock:
+            for name, help_text, buckets in self.METRICS:
+                lines.append('# HELP %s%s %s' % (prefix, name, help_text))
+                lines.append('# TYPE %s%s histogram' % (prefix, name))
+                for (metric, view), histogram in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    label = 'view="%s"' % view.replace('\\', '\\\\').replace('"', '\\"')
+                    cumulative = 0
+                    for bound, count in zip(buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append('%s%s_bucket{%s,le="%s"} %d' % (
+                            prefix, name, label, bound, cumulative))
+                    lines.append('%s%s_sum{%s} %s' % (prefix, name, label, histogram.sum))
+                    lines.append('%s%s_count{%s} %d' % (prefix, name, label, histogram.count))
+        return lines
+
+
+registry = Registry()
@@ -0,0 +1,191 @@
+import contextlib
+import logging
+import mimetypes
+import os
+import random
+import time
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import connections
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from . import metrics, routers
+
+logger = logging.getLogger('netfix.performance')
+
+PIN_COOKIE = 'netfix_primary'
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Marks the request for the replica router. Unsafe methods and clients
+    that wrote recently read from the primary; a request that writes sets
+    a cookie pinning its client to the primary for REPLICA_PIN_SECONDS,
+    long enough for sync_replica to have copied the write.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pinned = (request.method not in ('GET', 'HEAD', 'OPTIONS')
+                  or PIN_COOKIE in request.COOKIES)
+        token = routers.begin_request(pinned)
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = routers.end_request(token)
+        if wrote:
+            response.set_cookie(PIN_COOKIE, '1',
+                                max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
+
+
+class PerformanceMiddleware:
+    """
+    Times every request: SQL queries and their time on every database,
+    template rendering (through netfix.templates.DjangoTemplates) and the
+    total. Reports them in a Server-Timing header and in the per-view
+    histograms served at /metrics.
+
+    PERFORMANCE_SQL_SAMPLE_RATE of the requests also keep their SQL, which
+    is logged to 'netfix.performance' when the request took longer than
+    PERFORMANCE_SLOW_REQUEST_MS. At the default rate of 0 nothing but a
+    counter and a clock read is added per query.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = settings.PERFORMANCE_SQL_SAMPLE_RATE
+        timings = metrics.RequestTimings(
+            record_sql=bool(rate) and random.random() < rate)
+        token = metrics.start_request(timings)
+        start = time.perf_counter()
+        try:
+            with contextlib.ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(timings.sql_wrapper))
+                response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        total = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        metrics.registry.observe(view, total, timings)
+        response['Server-Timing'] = (
+            'sql;dur=%.1f;desc="%d queries", template;dur=%.1f, total;dur=%.1f' % (
+                timings.sql_seconds * 1000, timings.queries,
+                timings.template_seconds * 1000, total * 1000))
+        if (timings.statements is not None
+                and total * 1000 >= settings.PERFORMANCE_SLOW_REQUEST_MS):
+            self.log_slow(request, view, total, timings)
+        return response
+
+    def log_slow(self, request, view, total, timings):
+        lines = ['%.1fms %s' % (elapsed * 1000, sql)
+                 for elapsed, sql, params in timings.statements]
+        logger.warning(
+            'Slow request %s %s (%s) took %.1fms, %d queries in %.1fms:\n%s',
+            request.method, request.get_full_path(), view, total * 1000,
+            timings.queries, timings.sql_seconds * 1000, '\n'.join(lines))
+
+
+class StaticFilesMiddleware:
+    """
+    Serves the files collectstatic put in STATIC_ROOT, so no separate web
+    server is needed. A file named after its content hash (see
+    netfix.storage) never changes, so browsers may keep it a year without
+    revalidating; other files are revalidated on every use. Text files
+    are sent as their brotli or gzip variant when the client accepts it.
+
+    The hashed names are read from the manifest once per process, so
+    restart after collectstatic.
+    """
+
+    # content encodings tried in order, with the suffix of their variant
+    ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+    IMMUTABLE = 'public, max-age=31536000, immutable'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL
+        self.root = settings.STATIC_ROOT
+        self.hashed = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+    def __call__(self, request):
+        if (self.root and request.method in ('GET', 'HEAD')
+                and request.path.startswith(self.prefix)):
+            response = self.serve(request, request.path[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def serve(self, request, name):
+        try:
+            path = safe_join(self.root, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+        content_type, _ = mimetypes.guess_type(path)
+
+        accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''),
+                                      [encoding for encoding, _ in self.ENCODINGS])
+        variants = [(encoding, path + suffix) for encoding, suffix in self.ENCODINGS
+                    if os.path.isfile(path + suffix)]
+        encoding, served = next(
+            ((encoding, variant) for encoding, variant in variants
+             if encoding in accepted), (None, path))
+
+        stat = os.stat(served)
+        immutable = name in self.hashed
+        if not immutable and not was_modified_since(
+                request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime, stat.st_size):
+            return HttpResponseNotModified()
+        response = FileResponse(open(served, 'rb'),
+                                content_type=content_type or 'application/octet-stream')
+        del response['Content-Disposition']
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Cache-Control'] = self.IMMUTABLE if immutable else 'no-cache'
+        if encoding:
+            response['Content-Encoding'] = encoding
+        if variants:
+            patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+def accepted_encodings(header, codings):
+    """
+    The content codings of `codings` an Accept-Encoding header allows:
+    those it names, or that its * wildcard covers, with a q-value above
+    zero. A q-value of zero, written 0, 0.0, 0.000 and so on, or one that
+    does not parse refuses the coding, and a coding named outright is
+    refused even when the wildcard allows the rest.
+    """
+    qualities = {}
+    for value in header.split(','):
+        coding, *params = [part.strip() for part in value.split(';')]
+        quality = 1.0
+        for param in params:
+            key, _, number = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            qualities[coding.lower()] = quality
+    wildcard = qualities.get('*', 0.0)
+    return {coding for coding in codings if qualities.get(coding, wildcard) > 0}
@@ -0,0 +1,58 @@
+import contextvars
+
+from django.conf import settings
+
+
+class _RequestState:
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.wrote = False
+
+
+# set for the duration of a request by ReplicaRoutingMiddleware; reads
+# outside requests (commands, shells, workers) always go to the primary
+_state = contextvars.ContextVar('netfix_replica_routing', default=None)
+
+
+def begin_request(pinned):
+    return _state.set(_RequestState(pinned))
+
+
+def end_request(token):
+    """ Ends the request started with `token`; True if it wrote. """
+    state = _state.get()
+    _state.reset(token)
+    return state.wrote
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends catalogue reads made while serving a request to the replica
+    named by settings.REPLICA_DATABASE, and everything else (writes, auth,
+    sessions) to the primary. A request that writes pins its client to the
+    primary for a while so it reads its own writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        alias = settings.REPLICA_DATABASE
+        if (alias and state is not None and not state.pinned
+                and model._meta.label_lower in settings.REPLICA_READ_MODELS):
+            return alias
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+            # later reads in this request must see the write
+            state.pinned = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica is a copy of the primary, so rows relate across them
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # the replica is only ever a copy made by sync_replica
+        return db == 'default'
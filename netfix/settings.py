@@ -46,8 +46,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'netfix.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'netfix.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'netfix.middleware.ReplicaRoutingMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -59,7 +62,7 @@ ROOT_URLCONF = 'netfix.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'netfix.templates.DjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -68,6 +71,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'services.context_processors.service_fields',
             ],
         },
     },
@@ -83,9 +87,129 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'OPTIONS': {
+            # seconds a writer waits for the lock before "database is locked"
+            'timeout': 20,
+        },
+        # a file rather than the in-memory default, so tests with several
+        # threads writing at once see the same locking as production
+        'TEST': {'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3')},
     }
 }
 
+# times a short write transaction is retried after the lock wait above
+# runs out (see main.db.retry_on_locked)
+DATABASE_LOCK_RETRIES = 5
+
+# Read replica
+# a local copy of the primary, refreshed with `manage.py sync_replica`;
+# stands in for a real replica in development and tests
+DATABASES['replica'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': os.path.join(BASE_DIR, 'db_replica.sqlite3'),
+    'OPTIONS': {'timeout': 20},
+}
+
+DATABASE_ROUTERS = ['netfix.routers.PrimaryReplicaRouter']
+
+# alias catalogue reads are served from during requests, or None to read
+# everything from the primary
+REPLICA_DATABASE = os.environ.get('NETFIX_REPLICA_DATABASE') or None
+
+# models whose reads may go to the replica
+REPLICA_READ_MODELS = [
+    'services.service',
+    'services.fieldstats',
+    'services.companystats',
+    'users.company',
+]
+
+# seconds a client that wrote keeps reading from the primary
+REPLICA_PIN_SECONDS = 10
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+# the catalogue pages work with the local-memory and file-based backends
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'netfix',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # session versions (see main/sessions.py), read on every authenticated
+    # request; must be shared by every process serving the site, so set
+    # NETFIX_SESSION_CACHE to a memcached server when running more than one
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': os.environ['NETFIX_SESSION_CACHE'],
+    } if os.environ.get('NETFIX_SESSION_CACHE') else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'netfix-sessions',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
+# seconds anonymous catalogue pages and service cards stay cached; writes
+# invalidate them earlier through version keys (see services/cache.py)
+CATALOGUE_CACHE_TIMEOUT = 600
+
+
+# Availability
+# days ahead companies' free slots are kept for (see services/availability.py);
+# `manage.py refresh_free_slots`, run daily, moves them along
+AVAILABILITY_DAYS = 14
+
+
+# Rate limits
+# POSTs allowed per view over a sliding window, as (attempts, seconds), by
+# client IP address, submitted email or logged-in user (see main/ratelimit.py).
+# Counts are kept in the default cache, so with an in-process cache each
+# process limits on its own
+RATE_LIMITS = {
+    'login': {'ip': (30, 300), 'email': (10, 300)},
+    'signup': {'ip': (10, 3600), 'email': (5, 3600)},
+    'create_service': {'user': (60, 3600)},
+}
+
+
+# Sessions
+# database sessions with a write-through in-process cache (main/sessions.py),
+# checked against the version in the SESSION_CACHE_ALIAS cache on every use,
+# so a session changed or deleted by another process is never served stale
+
+SESSION_ENGINE = 'main.sessions'
+SESSION_CACHE_ALIAS = 'sessions'
+SESSION_CACHE_MAX_ENTRIES = 10000
+SESSION_CACHE_TTL = 30
+
+# expired sessions deleted per transaction by `manage.py sweep_sessions`
+SESSION_SWEEP_BATCH_SIZE = 500
+
+
+# Performance instrumentation
+# see netfix.middleware.PerformanceMiddleware; histograms are per process
+
+# share of requests whose SQL is kept, to be logged if they turn out slow
+PERFORMANCE_SQL_SAMPLE_RATE = float(
+    os.environ.get('NETFIX_SQL_SAMPLE_RATE', 0))
+PERFORMANCE_SLOW_REQUEST_MS = 500
+
+# client addresses allowed to read /metrics, or None for everyone
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'netfix.performance': {'handlers': ['console'], 'level': 'WARNING'},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
@@ -127,3 +251,64 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static')
 ]
+
+# `manage.py collectstatic` writes content-hashed copies of the files, with
+# gzip and brotli variants of the text ones, here; they are served from it
+# by netfix.middleware.StaticFilesMiddleware
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+STATICFILES_STORAGE = 'netfix.storage.CompressedManifestStaticFilesStorage'
+
+
+# Catalogue pagination
+# services per page on the catalogue and profile pages, and the largest
+# page a client may ask for with ?size=
+
+SERVICES_PAGE_SIZE = 20
+SERVICES_MAX_PAGE_SIZE = 100
+
+
+# Similar services
+# see services/similar.py; building them needs NumPy
+
+# similar services kept for each service
+SIMILAR_SERVICES_COUNT = 6
+
+# the most frequent terms a build compares as dense columns, the rest
+# through the services they are found in; building holds a services x
+# terms float32 matrix, 200MB for 50,000 services at 1000 terms
+SIMILAR_SERVICES_MAX_TERMS = 1000
+
+
+# Background tasks
+# queued in the database by main.tasks.enqueue, run by `manage.py run_workers`
+
+# runs of a failing task before it is left dead
+TASK_MAX_ATTEMPTS = 5
+# seconds before the first retry, doubling with every further one, and
+# the most a retry waits
+TASK_RETRY_DELAY = 10
+TASK_RETRY_MAX_DELAY = 3600
+# seconds a claimed task may run before it is taken to be abandoned by a
+# dead worker and queued again
+TASK_TIMEOUT = 600
+# seconds finished tasks are kept before workers delete them
+TASK_KEEP_DONE = 7 * 24 * 3600
+
+# signup and booking emails; printed to the console unless configured
+EMAIL_BACKEND = os.environ.get(
+    'NETFIX_EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = 'NetFix <no-reply@netfix.example>'
+
+
+# Admin
+# see main.admin.ScaleModelAdmin, used by the admins of the large tables
+
+# tables with more rows than this are not counted with COUNT(*); their
+# changelists show the planner's estimate, or the highest primary key before
+# the first ANALYZE, and filtered ones count matches up to this many and say
+# when there are more
+ADMIN_EXACT_COUNT_LIMIT = 10000
+
+# changelists offer this many pages at most; deeper pages would mean long
+# OFFSET scans, and searches and filters find those rows faster
+ADMIN_MAX_PAGES = 200
@@ -0,0 +1,57 @@
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.contrib.staticfiles.utils import matches_patterns
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# text formats worth compressing; images and fonts are compressed already
+COMPRESSIBLE = ('*.css', '*.js', '*.map', '*.svg', '*.txt', '*.html', '*.json',
+                '*.xml', '*.ico')
+
+
+def compressors():
+    yield '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)
+    if brotli is not None:
+        yield '.br', lambda data: brotli.compress(data, quality=11)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Names collected files after a hash of their content and, for text
+    formats, writes gzip and (with the brotli package) brotli variants
+    next to them, for netfix.middleware.StaticFilesMiddleware to serve.
+    """
+
+    # before collectstatic has run, as in development and tests, files are
+    # referred to by their plain names
+    manifest_strict = False
+
+    def stored_name(self, name):
+        if not self.hashed_files and not self.exists(name):
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(self.hashed_files.values()):
+            if matches_patterns(name, COMPRESSIBLE):
+                self.compress(name)
+
+    def compress(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            data = f.read()
+        for suffix, compress in compressors():
+            compressed = compress(data)
+            if len(compressed) >= len(data):
+                continue
+            with open(path + suffix + '.tmp', 'wb') as f:
+                f.write(compressed)
+            os.replace(path + suffix + '.tmp', path + suffix)
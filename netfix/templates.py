@@ -0,0 +1,36 @@
+import time
+
+from django.template import TemplateDoesNotExist
+from django.template.backends import django as backend
+
+from . import metrics
+
+
+class Template(backend.Template):
+
+    def render(self, context=None, request=None):
+        timings = metrics.current()
+        if timings is None:
+            return super().render(context, request)
+        # only the outermost render counts; includes render inside it
+        timings.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings.template_depth -= 1
+            if not timings.template_depth:
+                timings.template_seconds += time.perf_counter() - start
+
+
+class DjangoTemplates(backend.DjangoTemplates):
+    """ The stock Django backend, timing renders for PerformanceMiddleware. """
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            backend.reraise(exc, self)
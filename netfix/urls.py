@@ -27,5 +27,7 @@ urlpatterns = [
     path('register/', include('users.urls')),
     path('login/', LoginUserView, name='login_user'),
     path('customer/<slug:name>', v.customer_profile, name='customer_profile'),
-    path('company/<slug:name>', v.company_profile, name='company_profile')
+    path('company/<slug:name>', v.company_profile, name='company_profile'),
+    path('company/<slug:name>/activity', v.company_activity, name='company_activity'),
+    path('metrics', v.metrics, name='metrics'),
 ]
@@ -1,21 +1,84 @@
-from django.shortcuts import render
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.shortcuts import render, get_object_or_404
+from django.utils import timezone
 
-from users.models import User, Company
-from services.models import Service
+from users.models import Company, Customer
+from services.models import Service, CompanyActivity, ServiceRequest
+from services.pagination import paginate
+from services import cache
+from services.cache import cache_catalogue_page, conditional_page
+from services.views import activity_chart, company_validators
+from main import tasks
+from main.models import Task
+
+from . import metrics as m
 
 
 def home(request):
     return render(request, 'users/home.html', {'user': request.user})
 
 
-def customer_profile(request):
-    pass
+def customer_profile(request, name):
+    # the services a customer requested, newest first off the (customer,
+    # -request_date) index; only shown to the customer
+    if request.user.username != name or not request.user.is_customer:
+        raise Http404("No customer %s." % name)
+    customer = get_object_or_404(Customer.objects.select_related('user'), user=request.user)
+    today = timezone.localdate()
+    birth = customer.birth
+    age = today.year - birth.year - ((today.month, today.day) < (birth.month, birth.day))
+    requests = paginate(request, ServiceRequest.objects.filter(customer=customer).select_related(
+        'service__company__user'), ('-request_date', '-id'))
+
+    return render(request, 'users/profile.html', {
+        'user': customer.user, 'user_age': age, 'sh': requests})
 
 
+@conditional_page(lambda name: ['company:' + name], company_validators)
+@cache_catalogue_page(lambda name: ['company:' + name])
 def company_profile(request, name):
-    # fetches the company user and all of the services available by it
-    user = User.objects.get(username=name)
-    services = Service.objects.filter(
-        company=Company.objects.get(user=user)).order_by("-date")
+    # fetches the company together with its user, then the services
+    # available by it, only loading what the profile page renders
+    company = get_object_or_404(
+        Company.objects.select_related('user', 'stats'), user__username=name)
+    user = company.user
+    stats = getattr(company, 'stats', None)
+    services = paginate(request, Service.objects.filter(company=company).only(
+        'id', 'name', 'price_hour', 'date'))
+
+    return render(request, 'users/profile.html', {
+        'user': user, 'services': services, 'stats': stats})
+
+
+def company_activity(request, name):
+    # bookings and revenue are for the company's eyes only
+    if request.user.username != name or not request.user.is_company:
+        raise Http404("No company %s." % name)
+    return activity_chart(request, CompanyActivity.objects.filter(company_id=request.user.pk))
+
 
-    return render(request, 'users/profile.html', {'user': user, 'services': services})
+def metrics(request):
+    # Prometheus text exposition of this process's request histograms and
+    # catalogue cache counters, and of the task queue
+    allowed = settings.METRICS_ALLOWED_IPS
+    if allowed is not None and request.META.get('REMOTE_ADDR') not in allowed:
+        return HttpResponseForbidden()
+    lines = m.registry.render()
+    lines.append('# HELP netfix_catalogue_cache_total Catalogue cache lookups.')
+    lines.append('# TYPE netfix_catalogue_cache_total counter')
+    for name, value in sorted(cache.counters().items()):
+        kind, result = name.rsplit('_', 1)
+        lines.append('netfix_catalogue_cache_total{kind="%s",result="%s"} %d' % (
+            kind, {'hits': 'hit', 'misses': 'miss'}[result], value))
+    # the task queue is shared by every process, so it is read from the database
+    depth, age = tasks.depth()
+    lines.append('# HELP netfix_tasks Background tasks by state.')
+    lines.append('# TYPE netfix_tasks gauge')
+    for state, _ in Task.STATES:
+        lines.append('netfix_tasks{state="%s"} %d' % (state, depth[state]))
+    lines.append('# HELP netfix_task_queue_lag_seconds Time the oldest due task has waited.')
+    lines.append('# TYPE netfix_task_queue_lag_seconds gauge')
+    lines.append('netfix_task_queue_lag_seconds %s' % age)
+    return HttpResponse('\n'.join(lines) + '\n',
+                        content_type='text/plain; version=0.0.4')
@@ -1,8 +1,38 @@
 from django.contrib import admin
 
-from .models import Service
+from main.admin import ScaleModelAdmin
+from . import search
+from .models import AvailabilityWindow, Category, Service
+
+# the most matches a changelist search lists, the newest ones
+SEARCH_LIMIT = 500
+
+
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "slug")
+    prepopulated_fields = {"slug": ("name",)}
 
 
 @admin.register(Service)
-class ServiceAdmin(admin.ModelAdmin):
-    list_display = ("id", "name", "price_hour", "field", "date")
+class ServiceAdmin(ScaleModelAdmin):
+    list_display = ("id", "name", "company", "price_hour", "field", "date")
+    list_select_related = ("company__user",)
+    raw_id_fields = ("company",)
+    # searched through the full-text index, see get_search_results
+    search_fields = ("name",)
+
+    def get_search_results(self, request, queryset, search_term):
+        # the same index as the site search, over the name, description
+        # and company name, in the changelist's newest-first order
+        if not search_term:
+            return queryset, False
+        ids = search.search_ids(search_term, limit=SEARCH_LIMIT, ranked=False)
+        return queryset.filter(pk__in=ids), False
+
+
+@admin.register(AvailabilityWindow)
+class AvailabilityWindowAdmin(ScaleModelAdmin):
+    list_display = ("id", "company", "weekday", "date", "start", "end")
+    list_select_related = ("company__user",)
+    raw_id_fields = ("company",)
@@ -0,0 +1,149 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, Min, OuterRef, Q
+from django.utils import timezone
+
+from main.db import retry_on_locked
+from users.models import Company
+from .models import AvailabilityWindow, FreeSlot, Service, ServiceRequest
+
+HOUR = timedelta(hours=1)
+
+
+class SlotTaken(Exception):
+    """ Some of the hours asked for are not free. """
+
+
+def next_hour(now):
+    """ The first whole hour at or after `now`. """
+    hour = now.replace(minute=0, second=0, microsecond=0)
+    return hour if hour == now else hour + HOUR
+
+
+def window_hours(window, day, tz=None):
+    """ The starts of the whole hours inside `window` on `day`. """
+    tz = tz or timezone.get_current_timezone()
+    first = window.start.hour + (window.start != time(window.start.hour))
+    for hour in range(first, window.end.hour):
+        yield timezone.make_aware(datetime.combine(day, time(hour)), tz)
+
+
+def booked_hours(company_ids, since):
+    """ {company id: hours booked from `since`} of `company_ids`, or all. """
+    # a booking lasts up to 24 hours, so one from the day before may still run
+    requests = ServiceRequest.objects.filter(start__gte=since - timedelta(hours=24))
+    if company_ids is not None:
+        requests = requests.filter(service__company_id__in=company_ids)
+    booked = defaultdict(set)
+    for company_id, start, hours in requests.values_list(
+            'service__company_id', 'start', 'service_time'):
+        booked[company_id].update(start + HOUR * n for n in range(hours))
+    return booked
+
+
+@retry_on_locked
+@transaction.atomic
+def refresh(company_ids=None, now=None, batch_size=2000):
+    """
+    Replaces the free slots of `company_ids`, or of every company, with
+    the hours of their windows from now to AVAILABILITY_DAYS days ahead
+    that are not booked. Returns the number of slots written.
+    """
+    now = now or timezone.now()
+    first = next_hour(now)
+    today = timezone.localdate(now)
+    days = [today + timedelta(days=n) for n in range(settings.AVAILABILITY_DAYS)]
+
+    windows = AvailabilityWindow.objects.filter(
+        Q(date__isnull=True) | Q(date__gte=days[0], date__lte=days[-1]))
+    companies = Company.objects.all()
+    slots = FreeSlot.objects.all()
+    if company_ids is not None:
+        company_ids = list(company_ids)
+        windows = windows.filter(company_id__in=company_ids)
+        companies = companies.filter(pk__in=company_ids)
+        slots = slots.filter(company_id__in=company_ids)
+    slots.delete()
+
+    by_company = defaultdict(list)
+    for window in windows.only('company_id', 'weekday', 'date', 'start', 'end'):
+        by_company[window.company_id].append(window)
+    fields = {pk: None if all_in_one else field_id
+              for pk, field_id, all_in_one in companies.filter(
+                  pk__in=list(by_company)).values_list('pk', 'field_id', 'is_all_in_one')}
+    booked = booked_hours(company_ids, first)
+
+    # most windows share their hours with many others, so each distinct
+    # day and hours is expanded, and each hour adapted for the database, once
+    tz = timezone.get_current_timezone()
+    expanded = {}
+    adapted = {}
+    rows = []
+    for company_id, company_windows in by_company.items():
+        hours = set()
+        for window in company_windows:
+            for day in days:
+                if window.date == day or window.weekday == day.weekday():
+                    key = (day, window.start, window.end)
+                    if key not in expanded:
+                        expanded[key] = list(window_hours(window, day, tz))
+                    hours.update(expanded[key])
+        hours -= booked[company_id]
+        for start in sorted(hours):
+            if start >= first:
+                if start not in adapted:
+                    adapted[start] = connection.ops.adapt_datetimefield_value(start)
+                rows.append((company_id, fields.get(company_id), adapted[start]))
+
+    # a plain executemany, as in similar.store; a refresh of every company
+    # writes millions of rows
+    quote = connection.ops.quote_name
+    insert = "INSERT INTO %s (%s) VALUES (%%s, %%s, %%s)" % (
+        quote(FreeSlot._meta.db_table),
+        ', '.join(quote(column) for column in ('company_id', 'field_id', 'start')))
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            cursor.executemany(insert, rows[start:start + batch_size])
+    return len(rows)
+
+
+def free_companies(field, since, until):
+    """
+    The companies free for at least an hour between `since` and `until`
+    that work in `field`, or in every field, and offer a service in
+    `field`, as (company id, first free hour) pairs, soonest first. Each
+    of the two fields is one range of the (field, start, company) index,
+    and a company's services are found by the start of its listing index.
+    """
+    return FreeSlot.objects.filter(
+        Q(field=field) | Q(field__isnull=True),
+        Exists(Service.objects.filter(company_id=OuterRef('company_id'), field=field)),
+        start__gte=next_hour(since), start__lt=until,
+    ).values_list('company_id').annotate(first=Min('start')).order_by('first', 'company_id')
+
+
+def search(field, since, until, limit=50):
+    return list(free_companies(field, since, until)[:limit])
+
+
+def free_hours(company, limit=48):
+    """ The next free hours of `company`. """
+    return list(FreeSlot.objects.filter(
+        company=company, start__gte=timezone.now()).order_by('start').values_list(
+        'start', flat=True)[:limit])
+
+
+def take(company, start, hours):
+    """
+    Removes the `hours` hours from `start` from the free slots of
+    `company`, or raises SlotTaken if any is not free. Call it inside the
+    booking's transaction.
+    """
+    wanted = [start + HOUR * n for n in range(hours)]
+    free = FreeSlot.objects.select_for_update().filter(company=company, start__in=wanted)
+    if len(list(free.values_list('start', flat=True))) < hours:
+        raise SlotTaken(start)
+    free.delete()
@@ -0,0 +1,46 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+
+from main.db import retry_on_locked
+from main.tasks import enqueue
+from . import availability
+from .models import ServiceRequest
+from .tasks import notify_company
+
+
+class IdempotencyConflict(Exception):
+    """ The key was already used for a booking of something else. """
+
+
+@retry_on_locked
+def book(customer, service, address, hours, key, start=None):
+    """
+    Books `service` for `customer`, from the hour `start` if given, which
+    takes those hours out of the company's free slots or raises
+    availability.SlotTaken. Returns (request, created); submitting the
+    same key again returns the booking it created the first time.
+
+    Everything is computed before the transaction opens, so it holds the
+    write lock for the booking and the task notifying the company, which
+    commit or roll back together.
+    """
+    price = Decimal(service.price_hour) * hours
+    try:
+        with transaction.atomic():
+            request = ServiceRequest.objects.create(
+                customer=customer, service=service, address=address,
+                service_time=hours, price=price, idempotency_key=key, start=start)
+            if start is not None:
+                availability.take(service.company_id, start, hours)
+            enqueue(notify_company, request_id=request.pk)
+            return request, True
+    except IntegrityError:
+        existing = ServiceRequest.objects.filter(idempotency_key=key).first()
+        if existing is None:
+            raise
+        if (existing.customer_id, existing.service_id, existing.address,
+                existing.service_time, existing.start) != (
+                customer.pk, service.pk, address, hours, start):
+            raise IdempotencyConflict(key)
+        return existing, False
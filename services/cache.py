@@ -0,0 +1,206 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.views.decorators.http import condition
+
+PREFIX = 'catalogue:'
+
+_counters = Counter()
+_counters_lock = threading.Lock()
+
+
+def count(kind, hit):
+    with _counters_lock:
+        _counters['%s_%s' % (kind, 'hits' if hit else 'misses')] += 1
+
+
+def counters():
+    """ Hit and miss counts of this process, e.g. {'page_hits': 3}. """
+    with _counters_lock:
+        return dict(_counters)
+
+
+# Version keys
+#
+# Every cached entry embeds the versions of the scopes it was built from:
+# 'catalogue' (the full listing), 'field:<category id>', 'company:<username>',
+# 'service:<id>', 'similar' (every similar-services list, which a build
+# rewrites) and NAVBAR. Writes bump the versions of the scopes they
+# touch, which orphans exactly the entries that could have changed; orphans
+# age out.
+
+# the service counts per field in the navbar of every page; bumped only
+# when they change, by a service created, deleted or moved to another field
+NAVBAR = 'navbar'
+
+def version_key(scope):
+    # some backends reject spaces in keys
+    return PREFIX + 'version:' + scope.replace(' ', '_')
+
+
+def initial_version():
+    # a version that was evicted must not restart at a number old entries
+    # were already built with
+    return int(time.time() * 1000)
+
+
+def get_versions(scopes):
+    keys = [version_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    versions = []
+    for key in keys:
+        if key not in found:
+            cache.add(key, initial_version(), None)
+            found[key] = cache.get(key)
+        versions.append(found[key])
+    return versions
+
+
+def bump(*scopes):
+    for scope in set(scopes):
+        key = version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, initial_version(), None)
+
+
+def read_scopes():
+    """
+    Scopes every page depends on besides its own: NAVBAR, and with a
+    replica 'replica'. What a page shows then also depends on when the
+    replica was last synced, so sync_replica bumps it; otherwise a page
+    rendered from a lagging replica right after a write would be cached
+    under the new version.
+    """
+    return [NAVBAR] + (['replica'] if settings.REPLICA_DATABASE else [])
+
+
+def _key(kind, *parts):
+    digest = hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()
+    return PREFIX + kind + ':' + digest
+
+
+# Full pages
+
+def is_cacheable(request):
+    # only anonymous pages are shared; pending messages are one-off
+    return (request.method in ('GET', 'HEAD')
+            and not request.user.is_authenticated
+            and not len(get_messages(request)))
+
+
+def cache_catalogue_page(scopes):
+    """
+    Caches the anonymous responses of a catalogue view. `scopes` takes the
+    view's arguments and returns the version scopes the page depends on.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if not is_cacheable(request):
+                return view(request, *args, **kwargs)
+            key = _key('page', request.get_full_path(), *get_versions(
+                scopes(*args, **kwargs) + read_scopes()))
+            cached = cache.get(key)
+            if cached is not None:
+                count('page', True)
+                content, content_type = cached
+                response = HttpResponse(content, content_type=content_type)
+                response['X-Cache'] = 'HIT'
+                return response
+            count('page', False)
+            response = view(request, *args, **kwargs)
+            if (response.status_code == 200 and not response.streaming
+                    and not response.cookies):
+                cache.set(key, (response.content, response['Content-Type']),
+                          settings.CATALOGUE_CACHE_TIMEOUT)
+                response['X-Cache'] = 'MISS'
+            return response
+        return wrapped
+    return decorator
+
+
+# Computed values
+
+def cached_value(kind, scopes, parts, compute):
+    """
+    What `compute()` returns for `parts`, cached under the versions of
+    `scopes` and read_scopes(), so it is recomputed only after a write
+    bumps one of them. Shared by every user, unlike the page cache.
+    """
+    key = _key(kind, *parts, *get_versions(scopes + read_scopes()))
+    value = cache.get(key)
+    count(kind, value is not None)
+    if value is None:
+        value = compute()
+        cache.set(key, value, settings.CATALOGUE_CACHE_TIMEOUT)
+    return value
+
+
+# Conditional GET
+
+def conditional_page(scopes, validators):
+    """
+    Answers If-None-Match on a catalogue view with a 304 before the view,
+    or the page cache, runs. `validators` takes the view's arguments and
+    returns the newest date and the number of the services the page
+    covers, from cheap indexed queries. The ETag covers them, the page's
+    version scopes, which reviews, renames and deletions bump, the user
+    and the query string. No Last-Modified is sent: a review or deleting
+    an older service changes a page without moving its newest date, so
+    If-Modified-Since would answer 304 with the old content.
+    """
+    def etag(request, *args, **kwargs):
+        # pending messages are one-off, like in is_cacheable
+        if request.method not in ('GET', 'HEAD') or len(get_messages(request)):
+            return None
+        latest, count = validators(*args, **kwargs)
+        versions = get_versions(scopes(*args, **kwargs) + read_scopes())
+        return hashlib.md5(':'.join(map(str, [
+            latest and latest.timestamp(), count, request.user.pk,
+            request.get_full_path(), *versions])).encode()).hexdigest()
+
+    return condition(etag_func=etag)
+
+
+# Service card fragments
+
+def render_cards(services):
+    """
+    Renders services/card.html for each service, reusing the fragments
+    cached for the same service and company versions. A card changes with
+    its service, whose date moves on every save, or with its company.
+    """
+    services = list(services)
+    companies = sorted({service.company.user.username for service in services})
+    company_versions = dict(zip(companies, get_versions(
+        ['company:' + name for name in companies])))
+    keys = [
+        _key('card', service.pk, service.date.timestamp(),
+             company_versions[service.company.user.username])
+        for service in services
+    ]
+    found = cache.get_many(keys)
+    cards, missing = [], {}
+    for key, service in zip(keys, services):
+        if key in found:
+            count('card', True)
+            cards.append(mark_safe(found[key]))
+        else:
+            count('card', False)
+            html = render_to_string('services/card.html', {'service': service})
+            missing[key] = html
+            cards.append(mark_safe(html))
+    if missing:
+        cache.set_many(missing, settings.CATALOGUE_CACHE_TIMEOUT)
+    return cards
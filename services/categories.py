@@ -0,0 +1,73 @@
+import threading
+
+from .models import Category
+
+# Categories by id, slug and name, read from the database once per process
+# at the first lookup and kept for its lifetime. They change only through
+# the admin; the signals in services/signals.py drop this process' copy,
+# other processes see the change once restarted.
+_maps = None
+_lock = threading.Lock()
+
+
+def _load():
+    global _maps
+    maps = _maps
+    if maps is None:
+        with _lock:
+            if _maps is None:
+                everything = list(Category.objects.order_by('name'))
+                _maps = (
+                    {category.pk: category for category in everything},
+                    {category.slug: category for category in everything},
+                    {category.name: category for category in everything},
+                )
+            maps = _maps
+    return maps
+
+
+def clear():
+    global _maps
+    _maps = None
+
+
+def all():
+    """ Every category, by name. """
+    return list(_load()[0].values())
+
+
+def get(pk):
+    return _load()[0].get(pk)
+
+
+def by_slug(slug):
+    return _load()[1].get(slug)
+
+
+def by_name(name):
+    return _load()[2].get(name)
+
+
+def choices():
+    """ (slug, name) of every category, for forms. """
+    return [(category.slug, category.name) for category in all()]
+
+
+def attach(instance, loaded):
+    """
+    Sets the `field` of a Service or Company being loaded from `loaded`,
+    its column values, to the category from the map, so reading it costs
+    no query.
+    """
+    category = get(loaded.get('field_id'))
+    if category is not None:
+        type(instance)._meta.get_field('field').set_cached_value(instance, category)
+
+
+def scope(category_id):
+    """ The catalogue cache scope of the services of a category. """
+    return 'field:%d' % category_id
+
+
+def scopes():
+    return [scope(category.pk) for category in all()]
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+
+from . import cache as catalogue_cache
+from . import categories
+from .models import FieldStats
+
+
+def _fields():
+    # one cached list per version of the counts, so the navbar costs a
+    # cache read instead of a query on every page
+    key = 'catalogue:navbar:%s' % ':'.join(map(str, catalogue_cache.get_versions(
+        catalogue_cache.read_scopes())))
+    fields = cache.get(key)
+    if fields is None:
+        counts = dict(FieldStats.objects.values_list('field_id', 'service_count'))
+        fields = [
+            {'name': category.name, 'slug': category.slug,
+             'count': counts.get(category.pk, 0)}
+            for category in categories.all()
+        ]
+        cache.set(key, fields, settings.CATALOGUE_CACHE_TIMEOUT)
+    return fields
+
+
+def service_fields(request):
+    return {'service_fields': SimpleLazyObject(_fields)}
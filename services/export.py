@@ -0,0 +1,88 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q, Value
+from django.db.models.functions import Coalesce
+
+from .models import Service
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+# exported name, lookup
+COLUMNS = (
+    ('id', 'id'),
+    ('name', 'name'),
+    ('description', 'description'),
+    ('price_hour', 'price_hour'),
+    ('rating', 'rating'),
+    ('reviews', 'rating_count'),
+    ('field', 'field__name'),
+    ('date', 'date'),
+    ('company', 'company__user__username'),
+    ('company_field', Coalesce('company__field__name', Value('All in One'))),
+)
+
+
+def services(field=None, since=None, until=None):
+    """
+    The services to export: those of the category `field` dated
+    since <= date < until.
+    """
+    queryset = Service.objects.all()
+    if field:
+        queryset = queryset.filter(field=field)
+    if since:
+        queryset = queryset.filter(date__gte=since)
+    if until:
+        queryset = queryset.filter(date__lt=until)
+    return queryset
+
+
+def chunks(queryset, chunk_size=2000):
+    """
+    Yields the rows of `queryset` as lists of at most `chunk_size` value
+    tuples, oldest first. Each chunk is a short query of its own seeking
+    past the last (date, id) on the date indexes, so memory holds one
+    chunk and no cursor or read transaction stays open while the client
+    downloads. A service saved during the export moves to the end and may
+    be exported twice.
+    """
+    rows = queryset.order_by('date', 'id').values_list(
+        *[lookup for _, lookup in COLUMNS])
+    date_at = [name for name, _ in COLUMNS].index('date')
+    last = None
+    while True:
+        if last is None:
+            chunk = list(rows[:chunk_size])
+        else:
+            date, pk = last
+            chunk = list(rows.filter(
+                Q(date__gt=date) | Q(date=date, id__gt=pk), date__gte=date)[:chunk_size])
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last = chunk[-1][date_at], chunk[-1][0]
+
+
+class Echo:
+    # csv.writer writes to a file; this one hands the line back instead
+    def write(self, value):
+        return value
+
+
+def render(chunks, format):
+    """ Yields one string per chunk, CSV with a header row or NDJSON. """
+    names = [name for name, _ in COLUMNS]
+    if format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(names)
+        for chunk in chunks:
+            yield ''.join(writer.writerow(row) for row in chunk)
+    else:
+        encoder = DjangoJSONEncoder()
+        for chunk in chunks:
+            yield ''.join(encoder.encode(dict(zip(names, row))) + '\n' for row in chunk)
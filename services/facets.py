@@ -0,0 +1,108 @@
+from decimal import Decimal
+
+from django.db.models import Count, Q
+
+from . import cache, categories
+from .models import Service
+
+# label, lowest price, price the bucket stops below
+PRICE_BUCKETS = (
+    ('Under 25', None, Decimal(25)),
+    ('25 to 50', Decimal(25), Decimal(50)),
+    ('50 to 100', Decimal(50), Decimal(100)),
+    ('100 to 200', Decimal(100), Decimal(200)),
+    ('200 and over', Decimal(200), None),
+)
+
+# keyset orderings of the catalogue, each backed by an index
+SORTS = {
+    'newest': ('-date', '-id'),
+    'price': ('price_hour', 'id'),
+    '-price': ('-price_hour', '-id'),
+}
+
+
+# prices have two decimals, so a bucket's highest price is a cent below its end
+CENT = Decimal('0.01')
+
+
+def price_range(low, high, high_included=False):
+    condition = Q()
+    if low is not None:
+        condition &= Q(price_hour__gte=low)
+    if high is not None:
+        condition &= Q(price_hour__lte=high) if high_included else Q(price_hour__lt=high)
+    return condition
+
+
+def conditions(data):
+    """ The filters of a cleaned FilterForm, as a Q per facet. """
+    return {
+        'field': Q(field__in=data['field']) if data['field'] else Q(),
+        # the max price asked for is a price the user accepts
+        'price': price_range(data['min_price'], data['max_price'], high_included=True),
+        'rating': (Q(rating__gte=data['min_rating'])
+                   if data['min_rating'] is not None else Q()),
+        'company': (Q(company__user__username=data['company'])
+                    if data['company'] else Q()),
+    }
+
+
+def filtered(queryset, conditions):
+    for condition in conditions.values():
+        queryset = queryset.filter(condition)
+    return queryset
+
+
+def counts(data, conditions):
+    """
+    Counts the services of each field and each price bucket in a single
+    aggregate query. A facet is counted under every filter but its own, so
+    the other fields' counts say what ticking them would add.
+    """
+    aggregates = {}
+    for category in categories.all():
+        aggregates['field_%d' % category.pk] = Count(
+            'id', filter=Q(field=category) & conditions['price'])
+    for n, (_, low, high) in enumerate(PRICE_BUCKETS):
+        aggregates['price_%d' % n] = Count(
+            'id', filter=price_range(low, high) & conditions['field'])
+    return Service.objects.filter(
+        conditions['rating'], conditions['company']).aggregate(**aggregates)
+
+
+def facets(request, data, conditions):
+    """
+    The field and price facets of the listing. The aggregate scans every
+    service matching the rating and company filters, so its counts are
+    cached under the catalogue version, which every service and review
+    write bumps, for everyone showing the same filters.
+    """
+    everything = categories.all()
+    found = cache.cached_value('facets', ['catalogue'], [
+        sorted(category.slug for category in data['field']), data['min_price'],
+        data['max_price'], data['min_rating'], data['company'],
+    ], lambda: counts(data, conditions))
+
+    fields = [
+        {'name': category.name, 'slug': category.slug,
+         'count': found['field_%d' % category.pk],
+         'selected': category in data['field']}
+        for category in everything
+    ]
+    prices = []
+    for n, (label, low, high) in enumerate(PRICE_BUCKETS):
+        params = request.GET.copy()
+        for name in ('after', 'before', 'min_price', 'max_price'):
+            params.pop(name, None)
+        if low is not None:
+            params['min_price'] = low
+        highest = high - CENT if high is not None else None
+        if highest is not None:
+            params['max_price'] = highest
+        prices.append({
+            'label': label, 'count': found['price_%d' % n],
+            'url': '?' + params.urlencode(),
+            'selected': (low, highest) == (data['min_price'], data['max_price']),
+        })
+    return {'fields': fields, 'prices': prices}
@@ -1,6 +1,24 @@
+import uuid
+from datetime import datetime, timedelta
+
 from django import forms
-from .models import Service
+from django.utils import dateformat, timezone
 from users.models import Company
+from . import categories
+from .models import AvailabilityWindow
+
+
+class CategoryField(forms.TypedChoiceField):
+    """ A category picked by its slug, cleaned to the Category. """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('choices', categories.choices)
+        super().__init__(coerce=categories.by_slug, empty_value=None, **kwargs)
+
+
+class CategoriesField(forms.TypedMultipleChoiceField):
+    def __init__(self, **kwargs):
+        super().__init__(choices=categories.choices, coerce=categories.by_slug, **kwargs)
 
 
 class CreateNewService(forms.Form):
@@ -8,15 +26,13 @@ class CreateNewService(forms.Form):
     description = forms.CharField(widget=forms.Textarea, label='Description')
     price_hour = forms.DecimalField(
         decimal_places=2, max_digits=5, min_value=0.00)
-    field = forms.ChoiceField(required=True)
+    field = CategoryField(required=True)
 
     def __init__(self, *args, choices='', ** kwargs):
         super(CreateNewService, self).__init__(*args, **kwargs)
         # adding choices to fields
         if choices:
             self.fields['field'].choices = choices
-        else:
-            self.fields['field'].choices = Service.choices 
         # adding placeholders to form fields
         self.fields['name'].widget.attrs['placeholder'] = 'Enter Service Name'
         self.fields['description'].widget.attrs['placeholder'] = 'Enter Description'
@@ -26,4 +42,140 @@ class CreateNewService(forms.Form):
 
 
 class RequestServiceForm(forms.Form):
-    pass
+    address = forms.CharField(max_length=200)
+    service_time = forms.IntegerField(
+        min_value=1, max_value=24, label='Service time (hours)')
+    idempotency_key = forms.UUIDField(widget=forms.HiddenInput)
+    start = forms.TypedChoiceField(
+        coerce=datetime.fromisoformat, empty_value=None, required=False,
+        label='Start')
+
+    def __init__(self, *args, free_hours=(), **kwargs):
+        super(RequestServiceForm, self).__init__(*args, **kwargs)
+        # a fresh key per rendered form; resubmitting the same form sends
+        # the same key back
+        self.fields['idempotency_key'].initial = uuid.uuid4()
+        # the company's next free hours, or any time
+        self.fields['start'].choices = [('', 'Any time')] + [
+            (hour.isoformat(), dateformat.format(timezone.localtime(hour), 'D j M, H:i'))
+            for hour in free_hours]
+        self.fields['address'].widget.attrs['placeholder'] = 'Enter Address'
+        self.fields['service_time'].widget.attrs['placeholder'] = 'Enter Service Time in hours'
+
+
+class AvailabilityWindowForm(forms.ModelForm):
+    class Meta:
+        model = AvailabilityWindow
+        fields = ['weekday', 'date', 'start', 'end']
+        widgets = {
+            'date': forms.DateInput(attrs={'type': 'date'}),
+            'start': forms.TimeInput(attrs={'type': 'time'}),
+            'end': forms.TimeInput(attrs={'type': 'time'}),
+        }
+        labels = {'weekday': 'Every', 'date': 'Or once on'}
+
+    def clean(self):
+        data = super().clean()
+        if (data.get('weekday') is None) == (data.get('date') is None):
+            raise forms.ValidationError("Pick either a weekday or a date.")
+        if data.get('start') and data.get('end') and data['start'] >= data['end']:
+            raise forms.ValidationError("The window must end after it starts.")
+        return data
+
+
+class AvailableForm(forms.Form):
+    field = CategoryField()
+    day = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}))
+    since = forms.TypedChoiceField(
+        choices=[(hour, '%02d:00' % hour) for hour in range(24)], coerce=int, initial=9)
+    until = forms.TypedChoiceField(
+        choices=[(hour, '%02d:00' % hour) for hour in range(1, 25)], coerce=int, initial=12)
+
+    def clean(self):
+        data = super().clean()
+        if data.get('since') is not None and data.get('until') is not None \
+                and data['since'] >= data['until']:
+            raise forms.ValidationError("The range must end after it starts.")
+        return data
+
+    def period(self):
+        """ The aware start and end of the range searched. """
+        day = timezone.make_aware(datetime.combine(self.cleaned_data['day'], datetime.min.time()))
+        return tuple(day + timedelta(hours=hour)
+                     for hour in (self.cleaned_data['since'], self.cleaned_data['until']))
+
+
+class ExportForm(forms.Form):
+    format = forms.ChoiceField(
+        choices=[('ndjson', 'NDJSON'), ('csv', 'CSV')], required=False)
+    field = CategoryField(required=False)
+    since = forms.DateTimeField(required=False)
+    until = forms.DateTimeField(required=False)
+
+    def clean_format(self):
+        return self.cleaned_data['format'] or 'ndjson'
+
+
+class ActivityForm(forms.Form):
+    # the most periods of each resolution a chart may ask for, and the default
+    LIMITS = {'hour': (168, 48), 'day': (366, 30), 'week': (104, 12)}
+
+    resolution = forms.ChoiceField(
+        choices=[(name, name) for name in LIMITS], required=False)
+    periods = forms.IntegerField(min_value=1, required=False)
+
+    def clean(self):
+        data = super().clean()
+        resolution = data.get('resolution') or 'day'
+        most, default = self.LIMITS[resolution]
+        if data.get('periods') and data['periods'] > most:
+            self.add_error('periods', "At most %d %ss." % (most, resolution))
+        data['resolution'] = resolution
+        data['periods'] = data.get('periods') or default
+        return data
+
+
+class FilterForm(forms.Form):
+    field = CategoriesField(required=False)
+    min_price = forms.DecimalField(min_value=0, decimal_places=2, required=False)
+    max_price = forms.DecimalField(min_value=0, decimal_places=2, required=False)
+    min_rating = forms.TypedChoiceField(
+        choices=[('', 'Any rating')] + [(n, '%d+' % n) for n in range(1, 6)],
+        coerce=int, empty_value=None, required=False)
+    company = forms.CharField(max_length=150, required=False)
+    sort = forms.ChoiceField(choices=[
+        ('newest', 'Newest'),
+        ('price', 'Price: low to high'),
+        ('-price', 'Price: high to low'),
+    ], required=False)
+
+    def __init__(self, *args, **kwargs):
+        super(FilterForm, self).__init__(*args, **kwargs)
+        self.fields['min_price'].widget.attrs['placeholder'] = 'Min price'
+        self.fields['max_price'].widget.attrs['placeholder'] = 'Max price'
+        self.fields['company'].widget.attrs['placeholder'] = 'Company'
+
+    def filters(self):
+        """ The valid filters; invalid ones are shown as errors and ignored. """
+        self.is_valid()
+        data = self.cleaned_data
+        return {
+            'field': data.get('field') or [],
+            'min_price': data.get('min_price'),
+            'max_price': data.get('max_price'),
+            'min_rating': data.get('min_rating'),
+            'company': data.get('company') or '',
+            'sort': data.get('sort') or 'newest',
+        }
+
+
+class ReviewForm(forms.Form):
+    stars = forms.TypedChoiceField(
+        choices=[(n, '%d star%s' % (n, '' if n == 1 else 's')) for n in range(5, 0, -1)],
+        coerce=int)
+    text = forms.CharField(widget=forms.Textarea, required=False, max_length=2000,
+                           label='Review')
+
+    def __init__(self, *args, **kwargs):
+        super(ReviewForm, self).__init__(*args, **kwargs)
+        self.fields['text'].widget.attrs['placeholder'] = 'How was the service?'
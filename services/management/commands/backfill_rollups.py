@@ -0,0 +1,38 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime, parse_date
+from django.utils import timezone
+
+from services import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the hourly and daily activity rollups of every company "
+        "and field from the services and service requests, replacing the "
+        "stored ones. Requests are counted under their service's current "
+        "company and field, and deleted rows drop out."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            help="Only replace the rollups from this date or datetime on.")
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                day = parse_date(options['since'])
+                if day is None:
+                    raise CommandError("--since takes a date or a datetime.")
+                since = datetime.combine(day, datetime.min.time())
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+        start = time.perf_counter()
+        count = rollups.backfill(since)
+        self.stdout.write(self.style.SUCCESS(
+            "Wrote %d rollup rows in %.2fs" % (count, time.perf_counter() - start)))
@@ -0,0 +1,97 @@
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from services import availability, categories
+from services.models import AvailabilityWindow, Service
+from services.seeding import seed_availability, seed_companies, seed_services
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds companies with availability windows inside a transaction, "
+        "times the free slot refresh and free-company searches over random "
+        "fields and ranges, next to expanding the windows in Python for "
+        "each search, then rolls everything back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--companies', type=int, default=10000)
+        parser.add_argument('--searches', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            self.stdout.write("Rolled back the seeded rows.")
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        start = time.perf_counter()
+        companies = seed_companies(options['companies'], prefix='bench')
+        services = seed_services(companies, 2 * len(companies), rng=rng)
+        windows = seed_availability(companies, rng=rng)
+        self.stdout.write("Seeded %d companies with %d services and %d windows in %.1fs" % (
+            len(companies), services, windows, time.perf_counter() - start))
+
+        start = time.perf_counter()
+        slots = availability.refresh()
+        self.stdout.write("Refreshed %d free slots in %.1fs" % (
+            slots, time.perf_counter() - start))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        fields = categories.all()
+        today = timezone.localdate()
+        searches = []
+        for _ in range(options['searches']):
+            day = timezone.make_aware(datetime.combine(
+                today + timedelta(days=rng.randint(1, 7)), datetime.min.time()))
+            since = day + timedelta(hours=rng.randint(6, 20))
+            searches.append((rng.choice(fields), since, since + timedelta(hours=3)))
+
+        if connection.vendor == 'sqlite':
+            sql, params = availability.free_companies(*searches[0])[:50].query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                self.stdout.write("Plan: %s" % '; '.join(row[-1] for row in cursor.fetchall()))
+
+        for label, search in (('slot table', availability.search), ('python', expand_search)):
+            timings, found = [], 0
+            for field, since, until in searches:
+                start = time.perf_counter()
+                found += len(search(field, since, until))
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            self.stdout.write("%-10s median %7.2f ms  p95 %7.2f ms  %.1f companies found" % (
+                label, statistics.median(timings), timings[int(len(timings) * 0.95) - 1],
+                found / len(searches)))
+
+
+def expand_search(field, since, until, limit=50):
+    # what the slot table saves: loading the windows of every company in
+    # the field with a service in it and expanding them for each search
+    day = timezone.localdate(since)
+    windows = AvailabilityWindow.objects.filter(
+        company__is_all_in_one=False, company__field=field) | \
+        AvailabilityWindow.objects.filter(company__is_all_in_one=True)
+    windows = windows.filter(company__in=Service.objects.filter(field=field).values('company'))
+    first = {}
+    for window in windows.filter(date__isnull=True, weekday=day.weekday()) | \
+            windows.filter(date=day):
+        for hour in availability.window_hours(window, day):
+            if since <= hour < until and hour < first.get(window.company_id, until):
+                first[window.company_id] = hour
+    return sorted(first.items(), key=lambda item: (item[1], item[0]))[:limit]
@@ -0,0 +1,119 @@
+import random
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+from django.db.models import Count, Sum
+
+from main.models import Task
+from services import rollups
+from services.booking import book
+from services.models import CompanyActivity, FieldActivity, Service, ServiceRequest
+from users.models import User, Customer
+
+
+class Command(BaseCommand):
+    help = (
+        "Fires concurrent bookings from a thread pool against the configured "
+        "database and reports throughput, latency and error rate. A share of "
+        "the bookings are resubmitted to check that idempotency keys hold. "
+        "The companies are not notified and the activity rollups are left "
+        "alone, so the bookings are never seen outside the benchmark."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bookings', type=int, default=5000)
+        parser.add_argument('--threads', type=int, default=32)
+        parser.add_argument('--customers', type=int, default=100)
+        parser.add_argument('--duplicates', type=float, default=0.1,
+                            help="Share of bookings submitted twice.")
+        parser.add_argument('--keep', action='store_true',
+                            help="Keep the bookings and customers created.")
+
+    def handle(self, *args, **options):
+        # the notification tasks and the rollup counts are stubbed out for
+        # the whole run, the cleanup included
+        before = self.snapshot()
+        with mock.patch('services.booking.enqueue'), mock.patch.object(rollups, 'record'):
+            self.bench(options)
+        if self.snapshot() != before:
+            raise CommandError("The benchmark changed the task queue or the rollups.")
+
+    def snapshot(self):
+        return (Task.objects.count(),) + tuple(
+            tuple(model.objects.aggregate(
+                rows=Count('pk'), requests=Sum('requests'), hours=Sum('hours_booked'),
+                cents=Sum('booked_cents')).values())
+            for model in (CompanyActivity, FieldActivity))
+
+    def bench(self, options):
+        services = list(Service.objects.only('id', 'price_hour')[:1000])
+        if not services:
+            raise CommandError("No services to book; seed the catalogue first.")
+        run = uuid.uuid4().hex[:8]
+        customers = self.customers(run, options['customers'])
+
+        rng = random.Random(0)
+        jobs = []
+        for _ in range(options['bookings']):
+            job = (rng.choice(customers), rng.choice(services), uuid.uuid4())
+            jobs.append(job)
+            if rng.random() < options['duplicates']:
+                jobs.append(job)
+        rng.shuffle(jobs)
+
+        def submit(job):
+            customer, service, key = job
+            start = time.perf_counter()
+            try:
+                _, created = book(customer, service, 'bench street 1', 2, key)
+                return time.perf_counter() - start, created, None
+            except DatabaseError as error:
+                return time.perf_counter() - start, False, error
+
+        self.stdout.write("Submitting %d bookings (%d distinct) from %d threads..."
+                          % (len(jobs), options['bookings'], options['threads']))
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options['threads']) as pool:
+            results = list(pool.map(submit, jobs))
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(result[0] * 1000 for result in results)
+        errors = [result[2] for result in results if result[2] is not None]
+        created = sum(1 for result in results if result[1])
+        stored = ServiceRequest.objects.filter(customer__in=customers).count()
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+        self.stdout.write("Throughput: %.0f bookings/s" % (len(jobs) / elapsed))
+        self.stdout.write("Latency: p50 %.1f ms, p95 %.1f ms, p99 %.1f ms, mean %.1f ms"
+                          % (percentile(0.5), percentile(0.95), percentile(0.99),
+                             statistics.mean(latencies)))
+        self.stdout.write("Errors: %d (%.2f%%)" % (len(errors), 100 * len(errors) / len(jobs)))
+        for error in sorted({str(error) for error in errors})[:5]:
+            self.stdout.write("  " + error)
+        self.stdout.write("Created %d, stored %d for %d distinct keys"
+                          % (created, stored, options['bookings']))
+        if stored > options['bookings']:
+            self.stderr.write(self.style.ERROR("Duplicate bookings were stored."))
+
+        if not options['keep']:
+            User.objects.filter(username__startswith='bench-%s-' % run).delete()
+
+    def customers(self, run, count):
+        password = make_password(None)
+        User.objects.bulk_create(
+            User(username='bench-%s-%d' % (run, n),
+                 email='bench-%s-%d@example.com' % (run, n),
+                 password=password, is_customer=True)
+            for n in range(count))
+        users = User.objects.filter(username__startswith='bench-%s-' % run)
+        Customer.objects.bulk_create(
+            Customer(user=user, birth='1990-01-01') for user in users)
+        return list(Customer.objects.filter(user__in=users))
@@ -0,0 +1,77 @@
+import random
+import statistics
+import time
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from services import search
+from services.seeding import WORDS, seed_companies, seed_services
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds services inside a transaction, indexes them and times ranked "
+        "searches for words most services contain and for rare ones, with "
+        "the ranking bounded to the newest matches and over every match, "
+        "next to the unranked search, then rolls everything back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--services', type=int, default=200000)
+        parser.add_argument('--companies', type=int, default=2000)
+        parser.add_argument('--searches', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError("Full-text search needs SQLite with FTS5.")
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            self.stdout.write("Rolled back the seeded rows.")
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        start = time.perf_counter()
+        companies = seed_companies(options['companies'], prefix='bench')
+        seed_services(companies, options['services'], rng=rng)
+        count = search.rebuild()
+        self.stdout.write("Seeded and indexed %d services in %.1fs" % (
+            count, time.perf_counter() - start))
+
+        queries = {
+            # every seeded service has 43 of the words, so each is common
+            'common': [rng.choice(WORDS) for _ in range(options['searches'])],
+            'prefix': [rng.choice(WORDS)[:3] for _ in range(options['searches'])],
+            'rare': ['%s %s %s' % tuple(rng.sample(WORDS, 3))
+                     for _ in range(options['searches'])],
+        }
+        runs = (
+            ('bounded', lambda query: search.search_ids(query, 21)),
+            ('unbounded', self.unbounded),
+            ('unranked', lambda query: search.search_ids(query, 21, ranked=False)),
+        )
+        for kind, words in queries.items():
+            for label, func in runs:
+                timings = []
+                for query in words:
+                    start = time.perf_counter()
+                    func(query)
+                    timings.append((time.perf_counter() - start) * 1000)
+                timings.sort()
+                self.stdout.write("%-6s %-9s median %8.2f ms  p95 %8.2f ms" % (
+                    kind, label, statistics.median(timings),
+                    timings[int(len(timings) * 0.95) - 1]))
+
+    def unbounded(self, query):
+        # every match is a candidate
+        with mock.patch.object(search, 'CANDIDATES', 2 ** 62):
+            return search.search_ids(query, 21)
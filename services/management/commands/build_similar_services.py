@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from services import similar
+from services.models import StaleSimilarService
+
+
+class Command(BaseCommand):
+    help = (
+        "Computes the similar services shown on each service's page. "
+        "With --stale, refreshes only after the services changed since the "
+        "last run; run it every few minutes, and the full build nightly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale', action='store_true',
+                            help="Only refresh after the changed services.")
+
+    def handle(self, *args, **options):
+        if not similar.is_available():
+            raise CommandError("Building similar services needs NumPy installed.")
+        start = time.perf_counter()
+        if options['stale']:
+            stale = StaleSimilarService.objects.count()
+            refreshed = similar.refresh()
+            message = "Refreshed %d services after %d changed" % (len(refreshed), stale)
+        else:
+            message = "Stored %d similar services" % similar.build()
+        self.stdout.write(self.style.SUCCESS(
+            "%s in %.2fs" % (message, time.perf_counter() - start)))
@@ -0,0 +1,122 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.client import RequestFactory
+
+from services import categories
+from services.models import Service
+from services.pagination import KeysetPaginator, encode_cursor
+from services.seeding import seed_companies, seed_services
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a large Service table inside a transaction, prints the query "
+        "plan and timings of each catalogue listing query without and with "
+        "the listing indexes, then rolls everything back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--services', type=int, default=200000)
+        parser.add_argument('--companies', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=20,
+                            help="Runs per query when timing it.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            self.stdout.write("Rolled back the seeded rows.")
+
+    def run(self, options):
+        self.stdout.write("Seeding %d services over %d companies..." % (
+            options['services'], options['companies']))
+        start = time.perf_counter()
+        companies = seed_companies(options['companies'], prefix='explain')
+        seed_services(companies, options['services'])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write("Seeded in %.1fs\n" % (time.perf_counter() - start))
+
+        queries = self.queries(companies)
+        # only used to render the index DDL; entering it is not allowed
+        # inside the transaction on SQLite
+        editor = connection.schema_editor()
+        indexes = Service._meta.indexes
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Without listing indexes"))
+        with connection.cursor() as cursor:
+            for index in indexes:
+                cursor.execute(str(index.remove_sql(Service, editor)))
+        self.report(queries, options['repeat'])
+
+        self.stdout.write(self.style.MIGRATE_HEADING("With listing indexes"))
+        with connection.cursor() as cursor:
+            for index in indexes:
+                cursor.execute(str(index.create_sql(Service, editor)))
+            cursor.execute('ANALYZE')
+        self.report(queries, options['repeat'])
+
+    def queries(self, companies):
+        # the same querysets the views build, for the first page and for a
+        # page deep into each listing
+        factory = RequestFactory()
+        listings = [
+            ('service_list', Service.objects.for_listing()),
+            ('service_field', Service.objects.for_listing().filter(
+                field=categories.by_slug('plumbing'))),
+            ('company_profile', Service.objects.filter(
+                company_id=companies[0].user_id).only(
+                    'id', 'name', 'price_hour', 'date')),
+        ]
+        queries = []
+        for name, queryset in listings:
+            paginator = KeysetPaginator(queryset)
+            queries.append((name + ' page 1', paginator, factory.get('/')))
+            middle = queryset.order_by('-date', '-id').values_list(
+                'date', 'id')
+            count = middle.count()
+            if count > 1:
+                cursor = encode_cursor(middle[count // 2])
+                queries.append((name + ' deep page', paginator,
+                                factory.get('/', {'after': cursor})))
+        return queries
+
+    def report(self, queries, repeat):
+        for name, paginator, request in queries:
+            # the plan is read off the same queries the paginator runs
+            plan = self.plan(paginator, request)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                paginator.page(request)
+            elapsed = (time.perf_counter() - start) / repeat * 1000
+            sorted_ = 'TEMP B-TREE' in plan
+            style = self.style.WARNING if sorted_ else self.style.SUCCESS
+            self.stdout.write(style("%-28s %8.2f ms%s" % (
+                name, elapsed, '  (sorts)' if sorted_ else '')))
+            for line in plan.splitlines():
+                self.stdout.write("    " + line)
+
+    def plan(self, paginator, request):
+        captured = []
+
+        def capture(execute, sql, params, many, context):
+            captured.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(capture):
+            paginator.page(request)
+        lines = []
+        with connection.cursor() as cursor:
+            for sql, params in captured:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                lines.append(sql[:100])
+                lines.extend('  ' + row[-1] for row in cursor.fetchall())
+        return '\n'.join(lines)
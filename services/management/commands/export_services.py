@@ -0,0 +1,50 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from services import export
+from services.forms import ExportForm
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams the service catalogue, with each service's company and "
+        "field, as NDJSON or CSV, optionally only one field and a date "
+        "range. Memory use does not grow with the number of services."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', default='ndjson', help="ndjson or csv.")
+        parser.add_argument('--field', help="Only services of this field, by slug, e.g. 'air-conditioner'.")
+        parser.add_argument('--since', help="Only services dated on or after this date or time.")
+        parser.add_argument('--until', help="Only services dated before this date or time.")
+        parser.add_argument('--output', help="File to write; defaults to standard output.")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        form = ExportForm({name: options[name] or ''
+                           for name in ('format', 'field', 'since', 'until')})
+        if not form.is_valid():
+            raise CommandError('; '.join(
+                '%s: %s' % (name, ' '.join(errors)) for name, errors in form.errors.items()))
+        data = form.cleaned_data
+        services = export.services(data['field'], data['since'], data['until'])
+
+        start = time.perf_counter()
+        self.rows = 0
+        chunks = self.counted(export.chunks(services, options['chunk_size']))
+        output = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            for text in export.render(chunks, data['format']):
+                output.write(text)
+        finally:
+            if options['output']:
+                output.close()
+        self.stderr.write("Exported %d services in %.1fs" % (
+            self.rows, time.perf_counter() - start))
+
+    def counted(self, chunks):
+        for chunk in chunks:
+            self.rows += len(chunk)
+            yield chunk
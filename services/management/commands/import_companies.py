@@ -0,0 +1,59 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from services.onboarding import COLUMNS, Importer, ImportFileError, setup_worker
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports partner companies and their services from a CSV with the "
+        "columns %s, validating every row with the signup and service "
+        "creation rules. Rejected rows are reported and skipped. Progress is "
+        "checkpointed after every batch, so running the command again after "
+        "a failure resumes where it stopped." % ', '.join(COLUMNS)
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Companies written per transaction.")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Password hashing processes; defaults to one per CPU.")
+        parser.add_argument('--checkpoint',
+                            help="Checkpoint file; defaults to <path>.checkpoint.")
+        parser.add_argument('--restart', action='store_true',
+                            help="Ignore the checkpoint and start from the first row.")
+
+    def handle(self, *args, **options):
+        with ProcessPoolExecutor(options['workers'], initializer=setup_worker) as pool:
+            importer = Importer(options['path'], pool, options['checkpoint'],
+                                options['batch_size'])
+            if options['restart']:
+                importer.checkpoint.clear()
+            try:
+                self.run(importer)
+            except (ImportFileError, OSError) as error:
+                raise CommandError(error)
+
+    def run(self, importer):
+        started = time.perf_counter()
+        rows = companies = services = rejected = 0
+        after = importer.checkpoint.load()
+        if after:
+            self.stdout.write("Resuming after row %d." % after)
+        for batch in importer.run(after):
+            for number, message in batch.errors:
+                self.stderr.write("row %d: %s" % (number, message))
+            rows += batch.rows
+            companies += batch.companies
+            services += batch.services
+            rejected += len(batch.errors)
+            self.stdout.write(
+                "row %d: %d companies, %d services, %d rejected rows, %.0f rows/s" % (
+                    batch.last_row, companies, services, rejected,
+                    rows / (time.perf_counter() - started)))
+        self.stdout.write(self.style.SUCCESS(
+            "Imported %d companies and %d services from %d rows in %.1fs." % (
+                companies, services, rows, time.perf_counter() - started)))
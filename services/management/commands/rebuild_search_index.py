@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main.tasks import enqueue
+from services import search, tasks
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search index over every service."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--background', action='store_true',
+            help="Queue the rebuild for the workers instead of running it.")
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError(
+                "Full-text search needs SQLite with FTS5; other databases "
+                "search with icontains and need no index.")
+        if options['background']:
+            enqueue(tasks.rebuild_search_index, dedupe_key='rebuild-search-index')
+            self.stdout.write("Queued a rebuild of the search index.")
+            return
+        start = time.perf_counter()
+        count = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            "Indexed %d services in %.2fs" % (count, time.perf_counter() - start)))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from main.tasks import enqueue
+from services import categories, stats, tasks
+from services.cache import NAVBAR, bump
+from services.models import FieldStats, CompanyStats
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the per-field and per-company service stats with totals "
+        "recomputed from the services table, reports any drift and rebuilds "
+        "both tables from scratch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only report drift; exit with status 1 if there is any.")
+        parser.add_argument(
+            '--background', action='store_true',
+            help="Queue the rebuild for the workers instead of running it.")
+
+    def handle(self, *args, **options):
+        if options['background']:
+            enqueue(tasks.rebuild_stats, dedupe_key='rebuild-stats')
+            self.stdout.write("Queued a rebuild of the service stats.")
+            return
+        drifted = False
+        for model, key, group_by in ((FieldStats, 'field_id', 'field_id'),
+                                     (CompanyStats, 'company_id', 'company_id')):
+            differences = stats.drift(model, key, group_by)
+            drifted = drifted or bool(differences)
+            self.stdout.write("%s: %d drifted rows" % (
+                model.__name__, len(differences)))
+            for group, (actual, expected) in sorted(differences.items(), key=str):
+                self.stdout.write(
+                    "  %s: stored (count, price cents, stars, reviews) %s, expected %s"
+                    % (group, actual, expected))
+
+        if options['check']:
+            if drifted:
+                raise SystemExit(1)
+            return
+        stats.rebuild()
+        bump('catalogue', NAVBAR, *categories.scopes())
+        self.stdout.write(self.style.SUCCESS("Rebuilt the service stats."))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from services import categories, reviews, stats
+from services.cache import bump
+from services.models import Service
+from users.models import Company, User
+
+
+class Command(BaseCommand):
+    help = (
+        "Recounts the rating totals of every service and company from their "
+        "reviews, reports the rows that drifted and repairs them, then "
+        "rebuilds the per-field and per-company stats from the services."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only report drift; exit with status 1 if there is any.")
+
+    def handle(self, *args, **options):
+        drifted = {}
+        for model in (Service, Company):
+            rows = list(reviews.drift(model))
+            drifted[model] = [pk for pk, _, _ in rows]
+            self.stdout.write("%s: %d drifted rows" % (model.__name__, len(rows)))
+            for pk, actual, expected in rows[:20]:
+                self.stdout.write(
+                    "  %s: stored (stars, reviews, rating) %s, expected %s"
+                    % (pk, actual, expected))
+            if rows and not options['check']:
+                reviews.repair(model, rows)
+
+        if options['check']:
+            if any(drifted.values()):
+                raise SystemExit(1)
+            return
+        if any(drifted.values()):
+            stats.rebuild()
+            # ratings show on service pages, cards and company profiles
+            company_ids = set(drifted[Company]) | set(Service.objects.filter(
+                pk__in=drifted[Service]).values_list('company_id', flat=True))
+            usernames = User.objects.filter(pk__in=company_ids).values_list(
+                'username', flat=True)
+            bump('catalogue', *categories.scopes(),
+                 *['service:%s' % pk for pk in drifted[Service]],
+                 *['company:' + name for name in usernames])
+        self.stdout.write(self.style.SUCCESS("Rating totals match the reviews."))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.tasks import enqueue
+from services import availability, tasks
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the free slots of every company from its availability "
+        "windows and bookings, AVAILABILITY_DAYS days ahead. Run it daily "
+        "so the slots move along with the days."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--background', action='store_true',
+            help="Queue the rebuild for the workers instead of running it.")
+
+    def handle(self, *args, **options):
+        if options['background']:
+            enqueue(tasks.refresh_free_slots, dedupe_key='refresh-free-slots')
+            self.stdout.write("Queued a rebuild of the free slots.")
+            return
+        started = time.perf_counter()
+        count = availability.refresh()
+        self.stdout.write(self.style.SUCCESS("Wrote %d free slots in %.1fs." % (
+            count, time.perf_counter() - started)))
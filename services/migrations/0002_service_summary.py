@@ -0,0 +1,34 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:31
+
+from django.db import migrations, models
+from django.utils.text import Truncator
+
+
+def fill_summaries(apps, schema_editor):
+    Service = apps.get_model('services', 'Service')
+    services = Service.objects.only('id', 'description')
+    batch = []
+    for service in services.iterator(chunk_size=2000):
+        service.summary = Truncator(service.description).chars(100)
+        batch.append(service)
+        if len(batch) == 2000:
+            Service.objects.bulk_update(batch, ['summary'])
+            batch = []
+    Service.objects.bulk_update(batch, ['summary'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_company_is_all_in_one'),
+        ('services', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='summary',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0002_service_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['-date', '-id'], name='service_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['field', '-date', '-id'], name='service_field_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['company', '-date', '-id'], name='service_company_date_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations
+
+TABLE = 'services_service_fts'
+
+
+def create_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Service = apps.get_model('services', 'Service')
+    Company = apps.get_model('users', 'Company')
+    User = apps.get_model('users', 'User')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5("
+            "name, description, company, tokenize='porter unicode61', "
+            "prefix='2 3 4')" % TABLE)
+        cursor.execute(
+            "INSERT INTO %s (rowid, name, description, company) "
+            "SELECT s.id, s.name, s.description, u.username FROM %s s "
+            "INNER JOIN %s c ON c.user_id = s.company_id "
+            "INNER JOIN %s u ON u.id = c.user_id"
+            % (TABLE, Service._meta.db_table, Company._meta.db_table,
+               User._meta.db_table))
+        cursor.execute("INSERT INTO %s (%s) VALUES ('optimize')"
+                       % (TABLE, TABLE))
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS %s" % TABLE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0003_service_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
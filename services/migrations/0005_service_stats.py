@@ -0,0 +1,59 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:40
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+import django.db.models.deletion
+
+
+def fill_stats(apps, schema_editor):
+    Service = apps.get_model('services', 'Service')
+    for name, key, group_by in (('FieldStats', 'field', 'field'),
+                                ('CompanyStats', 'company_id', 'company_id')):
+        model = apps.get_model('services', name)
+        rows = Service.objects.values(group_by).annotate(
+            count=Count('id'), price=Sum('price_hour'),
+            rating=Sum('rating')).order_by()
+        model.objects.bulk_create(
+            model(service_count=row['count'],
+                  price_cents_sum=int(Decimal(str(row['price'])) * 100),
+                  rating_sum=row['rating'], **{key: row[group_by]})
+            for row in rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_company_is_all_in_one'),
+        ('services', '0004_service_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyStats',
+            fields=[
+                ('service_count', models.PositiveIntegerField(default=0)),
+                ('price_cents_sum', models.BigIntegerField(default=0)),
+                ('rating_sum', models.BigIntegerField(default=0)),
+                ('company', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='users.company')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='FieldStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service_count', models.PositiveIntegerField(default=0)),
+                ('price_cents_sum', models.BigIntegerField(default=0)),
+                ('rating_sum', models.BigIntegerField(default=0)),
+                ('field', models.CharField(choices=[('Air Conditioner', 'Air Conditioner'), ('Carpentry', 'Carpentry'), ('Electricity', 'Electricity'), ('Gardening', 'Gardening'), ('Home Machines', 'Home Machines'), ('House Keeping', 'House Keeping'), ('Interior Design', 'Interior Design'), ('Locks', 'Locks'), ('Painting', 'Painting'), ('Plumbing', 'Plumbing'), ('Water Heaters', 'Water Heaters')], max_length=30, unique=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:41
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_company_is_all_in_one'),
+        ('services', '0005_service_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceRequest',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address', models.CharField(max_length=200)),
+                ('service_time', models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(24)])),
+                ('price', models.DecimalField(decimal_places=2, max_digits=100)),
+                ('request_date', models.DateTimeField(auto_now_add=True)),
+                ('idempotency_key', models.UUIDField(unique=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='requests', to='users.customer')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='requests', to='services.service')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='servicerequest',
+            index=models.Index(fields=['customer', '-request_date'], name='request_customer_date_idx'),
+        ),
+    ]
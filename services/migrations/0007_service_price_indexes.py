@@ -0,0 +1,21 @@
+# Generated by Django 3.1.14 on 2026-10-18 21:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0006_service_request'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['price_hour', 'id'], name='service_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['field', 'price_hour', 'id'], name='service_field_price_idx'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 3.1.14 on 2026-10-18 21:04
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def reset_ratings(apps, schema_editor):
+    # ratings were never maintained and there are no reviews yet; they now
+    # come from reviews only
+    apps.get_model('services', 'Service').objects.update(rating=0)
+    apps.get_model('users', 'Company').objects.update(rating=0)
+    for name in ('FieldStats', 'CompanyStats'):
+        apps.get_model('services', name).objects.update(rating_sum=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_company_rating_totals'),
+        ('services', '0007_service_price_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='companystats',
+            name='review_count',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='fieldstats',
+            name='review_count',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='service',
+            name='rating',
+            field=models.IntegerField(default=0, validators=[django.core.validators.MaxValueValidator(5), django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.CreateModel(
+            name='Review',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stars', models.PositiveSmallIntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(5)])),
+                ('text', models.TextField(blank=True)),
+                ('date', models.DateTimeField(auto_now=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='users.customer')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='services.service')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['service', '-date'], name='review_service_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='review',
+            constraint=models.UniqueConstraint(fields=('customer', 'service'), name='review_customer_service_unique'),
+        ),
+        migrations.RunPython(reset_ratings, migrations.RunPython.noop),
+    ]
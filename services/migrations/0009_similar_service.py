@@ -0,0 +1,34 @@
+# Generated by Django 3.1.14 on 2026-10-18 21:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0008_review'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaleSimilarService',
+            fields=[
+                ('service_id', models.IntegerField(primary_key=True, serialize=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SimilarService',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar', to='services.service')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='services.service')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='similarservice',
+            constraint=models.UniqueConstraint(fields=('service', 'rank'), name='similar_service_rank_unique'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 3.1.14 on 2026-10-18 21:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def copy_dates(apps, schema_editor):
+    # the best guess at when existing services were published; fill the
+    # rollups from it with `manage.py backfill_rollups`
+    Service = apps.get_model('services', 'Service')
+    Service.objects.update(created=models.F('date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_company_rating_totals'),
+        ('services', '0009_similar_service'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyActivity',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('hour', 'hour'), ('day', 'day')], max_length=4)),
+                ('period', models.DateTimeField()),
+                ('services_published', models.PositiveIntegerField(default=0)),
+                ('requests', models.PositiveIntegerField(default=0)),
+                ('hours_booked', models.PositiveIntegerField(default=0)),
+                ('booked_cents', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FieldActivity',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('hour', 'hour'), ('day', 'day')], max_length=4)),
+                ('period', models.DateTimeField()),
+                ('services_published', models.PositiveIntegerField(default=0)),
+                ('requests', models.PositiveIntegerField(default=0)),
+                ('hours_booked', models.PositiveIntegerField(default=0)),
+                ('booked_cents', models.BigIntegerField(default=0)),
+                ('field', models.CharField(choices=[('Air Conditioner', 'Air Conditioner'), ('Carpentry', 'Carpentry'), ('Electricity', 'Electricity'), ('Gardening', 'Gardening'), ('Home Machines', 'Home Machines'), ('House Keeping', 'House Keeping'), ('Interior Design', 'Interior Design'), ('Locks', 'Locks'), ('Painting', 'Painting'), ('Plumbing', 'Plumbing'), ('Water Heaters', 'Water Heaters')], max_length=30)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.RunPython(copy_dates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='fieldactivity',
+            constraint=models.UniqueConstraint(fields=('field', 'resolution', 'period'), name='field_activity_unique'),
+        ),
+        migrations.AddField(
+            model_name='companyactivity',
+            name='company',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity', to='users.company'),
+        ),
+        migrations.AddConstraint(
+            model_name='companyactivity',
+            constraint=models.UniqueConstraint(fields=('company', 'resolution', 'period'), name='company_activity_unique'),
+        ),
+    ]
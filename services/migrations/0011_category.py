@@ -0,0 +1,157 @@
+# Generated by Django 3.1.14 on 2026-10-18 22:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils.text import slugify
+
+# the choices `field` had on every model
+FIELDS = (
+    'Air Conditioner', 'Carpentry', 'Electricity', 'Gardening', 'Home Machines',
+    'House Keeping', 'Interior Design', 'Locks', 'Painting', 'Plumbing',
+    'Water Heaters',
+)
+
+MODELS = ('Service', 'FieldStats', 'FieldActivity')
+
+
+def create_categories(apps, schema_editor):
+    Category = apps.get_model('services', 'Category')
+    Category.objects.bulk_create(
+        [Category(name=name, slug=slugify(name)) for name in FIELDS])
+
+
+def link_categories(apps, schema_editor):
+    # one UPDATE per category and table
+    Category = apps.get_model('services', 'Category')
+    for name in MODELS:
+        model = apps.get_model('services', name)
+        for category in Category.objects.all():
+            model.objects.filter(field=category.name).update(category=category)
+
+
+def unlink_categories(apps, schema_editor):
+    Category = apps.get_model('services', 'Category')
+    for name in MODELS:
+        model = apps.get_model('services', name)
+        for category in Category.objects.all():
+            model.objects.filter(category=category).update(field=category.name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0010_activity_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.SmallAutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=30, unique=True)),
+                ('slug', models.SlugField(max_length=30, unique=True)),
+            ],
+            options={
+                'verbose_name_plural': 'categories',
+            },
+        ),
+        migrations.RunPython(create_categories, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='service',
+            name='service_field_date_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='service',
+            name='service_field_price_idx',
+        ),
+        migrations.RemoveConstraint(
+            model_name='fieldactivity',
+            name='field_activity_unique',
+        ),
+        # nullable while both columns exist, so the migration can be reversed
+        migrations.AlterField(
+            model_name='service',
+            name='field',
+            field=models.CharField(choices=[('Air Conditioner', 'Air Conditioner'), ('Carpentry', 'Carpentry'), ('Electricity', 'Electricity'), ('Gardening', 'Gardening'), ('Home Machines', 'Home Machines'), ('House Keeping', 'House Keeping'), ('Interior Design', 'Interior Design'), ('Locks', 'Locks'), ('Painting', 'Painting'), ('Plumbing', 'Plumbing'), ('Water Heaters', 'Water Heaters')], max_length=30, null=True),
+        ),
+        migrations.AlterField(
+            model_name='fieldstats',
+            name='field',
+            field=models.CharField(choices=[('Air Conditioner', 'Air Conditioner'), ('Carpentry', 'Carpentry'), ('Electricity', 'Electricity'), ('Gardening', 'Gardening'), ('Home Machines', 'Home Machines'), ('House Keeping', 'House Keeping'), ('Interior Design', 'Interior Design'), ('Locks', 'Locks'), ('Painting', 'Painting'), ('Plumbing', 'Plumbing'), ('Water Heaters', 'Water Heaters')], max_length=30, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='fieldactivity',
+            name='field',
+            field=models.CharField(choices=[('Air Conditioner', 'Air Conditioner'), ('Carpentry', 'Carpentry'), ('Electricity', 'Electricity'), ('Gardening', 'Gardening'), ('Home Machines', 'Home Machines'), ('House Keeping', 'House Keeping'), ('Interior Design', 'Interior Design'), ('Locks', 'Locks'), ('Painting', 'Painting'), ('Plumbing', 'Plumbing'), ('Water Heaters', 'Water Heaters')], max_length=30, null=True),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='category',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='services.category'),
+        ),
+        migrations.AddField(
+            model_name='fieldstats',
+            name='category',
+            field=models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='services.category'),
+        ),
+        migrations.AddField(
+            model_name='fieldactivity',
+            name='category',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='services.category'),
+        ),
+        migrations.RunPython(link_categories, unlink_categories),
+        migrations.RemoveField(
+            model_name='service',
+            name='field',
+        ),
+        migrations.RemoveField(
+            model_name='fieldstats',
+            name='field',
+        ),
+        migrations.RemoveField(
+            model_name='fieldactivity',
+            name='field',
+        ),
+        migrations.RenameField(
+            model_name='service',
+            old_name='category',
+            new_name='field',
+        ),
+        migrations.RenameField(
+            model_name='fieldstats',
+            old_name='category',
+            new_name='field',
+        ),
+        migrations.RenameField(
+            model_name='fieldactivity',
+            old_name='category',
+            new_name='field',
+        ),
+        migrations.AlterField(
+            model_name='service',
+            name='field',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='services', to='services.category'),
+        ),
+        migrations.AlterField(
+            model_name='fieldstats',
+            name='field',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='services.category'),
+        ),
+        migrations.AlterField(
+            model_name='fieldactivity',
+            name='field',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='activity', to='services.category'),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['field', '-date', '-id'], name='service_field_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(fields=['field', 'price_hour', 'id'], name='service_field_price_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='fieldactivity',
+            constraint=models.UniqueConstraint(fields=('field', 'resolution', 'period'), name='field_activity_unique'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 3.1.14 on 2026-10-18 22:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.expressions
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_company_category'),
+        ('services', '0011_category'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvailabilityWindow',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(blank=True, choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')], null=True)),
+                ('date', models.DateField(blank=True, null=True)),
+                ('start', models.TimeField()),
+                ('end', models.TimeField()),
+            ],
+            options={
+                'ordering': ['weekday', 'date', 'start'],
+            },
+        ),
+        migrations.CreateModel(
+            name='FreeSlot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='servicerequest',
+            name='start',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='servicerequest',
+            index=models.Index(condition=models.Q(start__isnull=False), fields=['start'], name='request_start_idx'),
+        ),
+        migrations.AddField(
+            model_name='freeslot',
+            name='company',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='free_slots', to='users.company'),
+        ),
+        migrations.AddField(
+            model_name='freeslot',
+            name='field',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='services.category'),
+        ),
+        migrations.AddField(
+            model_name='availabilitywindow',
+            name='company',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availability', to='users.company'),
+        ),
+        migrations.AddIndex(
+            model_name='freeslot',
+            index=models.Index(fields=['field', 'start', 'company'], name='free_slot_search_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='freeslot',
+            constraint=models.UniqueConstraint(fields=('company', 'start'), name='free_slot_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='availabilitywindow',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('date__isnull', True), ('weekday__isnull', False)), models.Q(('date__isnull', False), ('weekday__isnull', True)), _connector='OR'), name='window_weekly_or_once'),
+        ),
+        migrations.AddConstraint(
+            model_name='availabilitywindow',
+            constraint=models.CheckConstraint(check=models.Q(start__lt=django.db.models.expressions.F('end')), name='window_start_before_end'),
+        ),
+    ]
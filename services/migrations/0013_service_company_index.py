@@ -0,0 +1,20 @@
+# Generated by Django 3.1.14 on 2026-10-18 22:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_company_category'),
+        ('services', '0012_availability'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='service',
+            name='company',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='users.company'),
+        ),
+    ]
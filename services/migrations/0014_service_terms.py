@@ -0,0 +1,38 @@
+# Generated by Django 3.1.14 on 2026-10-18 22:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0013_service_company_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TermFrequency',
+            fields=[
+                ('term', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('services', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ServiceTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=40)),
+                ('weight', models.FloatField()),
+                ('service', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='services.service')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='serviceterm',
+            index=models.Index(fields=['term', 'service', 'weight'], name='service_term_postings_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='serviceterm',
+            constraint=models.UniqueConstraint(fields=('service', 'term'), name='service_term_unique'),
+        ),
+    ]
@@ -1,34 +1,397 @@
+import calendar
+
 from django.db import models
 
 # Create your models here.
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MaxValueValidator, MinValueValidator
-from users.models import Company, Customer
+from django.utils import timezone
+from django.utils.text import Truncator
+from users.models import Company, Customer, Rated
+
+
+# length of the description preview shown on the listing pages
+SUMMARY_LENGTH = 100
+
+
+class ServiceQuerySet(models.QuerySet):
+
+    def for_listing(self):
+        # only the columns the listing cards render, with the company and its
+        # user joined in, so a page costs one query whatever its size
+        return self.select_related('company__user').only(
+            'id', 'name', 'summary', 'price_hour', 'rating', 'rating_sum',
+            'rating_count', 'field', 'date',
+            'company__field', 'company__is_all_in_one',
+            'company__user__username', 'company__user__email',
+        )
+
+
+class Category(models.Model):
+    """
+    A field of work. Code looks categories up in the map of
+    services/categories.py rather than here.
+    """
+    id = models.SmallAutoField(primary_key=True)
+    name = models.CharField(max_length=30, unique=True)
+    slug = models.SlugField(max_length=30, unique=True)
+
+    class Meta:
+        verbose_name_plural = 'categories'
+
+    def __str__(self):
+        return self.name
 
 
-class Service(models.Model):
-    company = models.ForeignKey(Company, on_delete=models.CASCADE)
+class Service(Rated):
+    # indexed first in service_company_date_idx below
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, db_index=False)
     name = models.CharField(max_length=40)
     description = models.TextField()
+    summary = models.CharField(max_length=SUMMARY_LENGTH, blank=True, default='')
     price_hour = models.DecimalField(decimal_places=2, max_digits=100)
-    rating = models.IntegerField(validators=[MinValueValidator(
-        0), MaxValueValidator(5)], default=0)
-    choices = (
-        ('Air Conditioner', 'Air Conditioner'),
-        ('Carpentry', 'Carpentry'),
-        ('Electricity', 'Electricity'),
-        ('Gardening', 'Gardening'),
-        ('Home Machines', 'Home Machines'),
-        ('House Keeping', 'House Keeping'),
-        ('Interior Design', 'Interior Design'),
-        ('Locks', 'Locks'),
-        ('Painting', 'Painting'),
-        ('Plumbing', 'Plumbing'),
-        ('Water Heaters', 'Water Heaters'),
-    )
-    field = models.CharField(max_length=30, blank=False,
-                             null=False, choices=choices)
+    # indexed first in the field listing indexes below
+    field = models.ForeignKey(Category, on_delete=models.PROTECT,
+                              related_name='services', db_index=False)
     date = models.DateTimeField(auto_now=True, null=False)
+    # when the service was published; `date` moves with every edit
+    created = models.DateTimeField(default=timezone.now, editable=False)
+
+    objects = ServiceQuerySet.as_manager()
+
+    class Meta:
+        # one index per listing, matching its filter and the (-date, -id)
+        # keyset order, so pages are read straight off the index
+        indexes = [
+            models.Index(fields=['-date', '-id'],
+                         name='service_date_idx'),
+            models.Index(fields=['field', '-date', '-id'],
+                         name='service_field_date_idx'),
+            models.Index(fields=['company', '-date', '-id'],
+                         name='service_company_date_idx'),
+            models.Index(fields=['price_hour', 'id'],
+                         name='service_price_idx'),
+            models.Index(fields=['field', 'price_hour', 'id'],
+                         name='service_field_price_idx'),
+        ]
 
     def __str__(self):
         return self.name
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        from . import categories
+        instance = super().from_db(db, field_names, values)
+        # remember the loaded column values so a later save can tell what
+        # it moved away from
+        instance._loaded = dict(zip(field_names, values))
+        categories.attach(instance, instance._loaded)
+        return instance
+
+    def loaded_value(self, attname):
+        """ The value `attname` had when loaded, or the current one. """
+        return getattr(self, '_loaded', {}).get(attname, getattr(self, attname))
+
+    @staticmethod
+    def summarize(description):
+        return Truncator(description).chars(SUMMARY_LENGTH)
+
+    def save(self, *args, **kwargs):
+        from . import stats
+        # keep the stored preview in step with the description
+        self.summary = self.summarize(self.description)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'description' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'summary'}
+        # the aggregate tables move in the same transaction as the row
+        with transaction.atomic(using=kwargs.get('using')):
+            previous = None if self.pk is None else stats.snapshot(self)
+            super().save(*args, **kwargs)
+            stats.record_save(self, previous)
+        self._loaded = dict(getattr(self, '_loaded', {}), **stats.current(self))
+
+
+class ServiceStats(models.Model):
+    """
+    Running totals over a set of services, kept up to date on every write
+    so averages are read from one row instead of aggregated per request.
+    """
+    service_count = models.PositiveIntegerField(default=0)
+    # prices are summed in cents so increments stay exact
+    price_cents_sum = models.BigIntegerField(default=0)
+    # stars and number of the reviews of these services
+    rating_sum = models.BigIntegerField(default=0)
+    review_count = models.BigIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def average_price(self):
+        if not self.service_count:
+            return None
+        return round(self.price_cents_sum / self.service_count / 100, 2)
+
+    @property
+    def average_rating(self):
+        if not self.review_count:
+            return None
+        return round(self.rating_sum / self.review_count, 1)
+
+
+class FieldStats(ServiceStats):
+    field = models.OneToOneField(Category, on_delete=models.CASCADE,
+                                 related_name='stats')
+
+    def __str__(self):
+        return str(self.field)
+
+
+class CompanyStats(ServiceStats):
+    company = models.OneToOneField(Company, on_delete=models.CASCADE,
+                                   primary_key=True, related_name='stats')
+
+
+class Activity(models.Model):
+    """
+    What happened in an hour or a day, counted as services are published
+    and requested (see services/rollups.py), so charts read a row per
+    period instead of scanning the services and requests.
+    """
+    HOUR = 'hour'
+    DAY = 'day'
+    RESOLUTIONS = [(HOUR, 'hour'), (DAY, 'day')]
+
+    resolution = models.CharField(max_length=4, choices=RESOLUTIONS)
+    # the start of the hour or day, in UTC
+    period = models.DateTimeField()
+    services_published = models.PositiveIntegerField(default=0)
+    requests = models.PositiveIntegerField(default=0)
+    hours_booked = models.PositiveIntegerField(default=0)
+    booked_cents = models.BigIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class CompanyActivity(Activity):
+    company = models.ForeignKey(Company, on_delete=models.CASCADE,
+                                related_name='activity')
+
+    class Meta:
+        # also the index the charts read a range of periods from
+        constraints = [
+            models.UniqueConstraint(fields=['company', 'resolution', 'period'],
+                                    name='company_activity_unique'),
+        ]
+
+
+class FieldActivity(Activity):
+    # indexed first in the unique constraint
+    field = models.ForeignKey(Category, on_delete=models.CASCADE,
+                              related_name='activity', db_index=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['field', 'resolution', 'period'],
+                                    name='field_activity_unique'),
+        ]
+
+
+class ServiceRequest(models.Model):
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE,
+                                 related_name='requests')
+    service = models.ForeignKey(Service, on_delete=models.CASCADE,
+                                related_name='requests')
+    address = models.CharField(max_length=200)
+    # hours of work booked; price is the service's hourly price times hours
+    # at the time of the request
+    service_time = models.PositiveIntegerField(validators=[
+        MinValueValidator(1), MaxValueValidator(24)])
+    price = models.DecimalField(decimal_places=2, max_digits=100)
+    request_date = models.DateTimeField(auto_now_add=True)
+    # sent with the form, so a resubmitted form finds the booking it made
+    # instead of creating another one
+    idempotency_key = models.UUIDField(unique=True)
+    # the hour the work starts, when booked into the company's free slots
+    start = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer', '-request_date'],
+                         name='request_customer_date_idx'),
+            # the bookings a slot refresh leaves out
+            models.Index(fields=['start'], name='request_start_idx',
+                         condition=models.Q(start__isnull=False)),
+        ]
+
+    def __str__(self):
+        return f"{self.service} for {self.customer.user}"
+
+
+class AvailabilityWindow(models.Model):
+    """
+    Hours a company takes bookings, every week on `weekday` or once on
+    `date`, in the site's time zone. The whole hours inside the windows
+    of the next AVAILABILITY_DAYS days are expanded into FreeSlot.
+    """
+    WEEKDAYS = list(enumerate(calendar.day_name))
+
+    company = models.ForeignKey(Company, on_delete=models.CASCADE,
+                                related_name='availability')
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAYS, null=True, blank=True)
+    date = models.DateField(null=True, blank=True)
+    start = models.TimeField()
+    end = models.TimeField()
+
+    class Meta:
+        ordering = ['weekday', 'date', 'start']
+        constraints = [
+            models.CheckConstraint(
+                check=(models.Q(weekday__isnull=False, date__isnull=True)
+                       | models.Q(weekday__isnull=True, date__isnull=False)),
+                name='window_weekly_or_once'),
+            models.CheckConstraint(check=models.Q(start__lt=models.F('end')),
+                                   name='window_start_before_end'),
+        ]
+
+    def __str__(self):
+        day = self.get_weekday_display() if self.date is None else self.date
+        return f"{day} {self.start:%H:%M}-{self.end:%H:%M}"
+
+
+class FreeSlot(models.Model):
+    """
+    An hour from `start` a company is available and not booked, kept by
+    services.availability. The company's field is copied in, NULL for an
+    All in One company, so a search reads one index range per field.
+    """
+    company = models.ForeignKey(Company, on_delete=models.CASCADE,
+                                related_name='free_slots', db_index=False)
+    field = models.ForeignKey(Category, on_delete=models.CASCADE, null=True,
+                              related_name='+', db_index=False)
+    start = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            # also the index refreshes and bookings find a company's slots by
+            models.UniqueConstraint(fields=['company', 'start'], name='free_slot_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['field', 'start', 'company'], name='free_slot_search_idx'),
+        ]
+
+
+class Review(models.Model):
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE,
+                                 related_name='reviews')
+    service = models.ForeignKey(Service, on_delete=models.CASCADE,
+                                related_name='reviews')
+    stars = models.PositiveSmallIntegerField(validators=[
+        MinValueValidator(1), MaxValueValidator(5)])
+    text = models.TextField(blank=True)
+    date = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['customer', 'service'],
+                                    name='review_customer_service_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['service', '-date'],
+                         name='review_service_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.stars} stars for {self.service}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_stars = dict(zip(field_names, values)).get('stars')
+        return instance
+
+    def save(self, *args, **kwargs):
+        from . import reviews
+        # the rating totals move in the same transaction as the review
+        with transaction.atomic(using=kwargs.get('using')):
+            previous = None if self.pk is None else (
+                getattr(self, '_loaded_stars', None)
+                or Review.objects.filter(pk=self.pk).values_list(
+                    'stars', flat=True).first())
+            super().save(*args, **kwargs)
+            reviews.record_save(self, previous)
+        self._loaded_stars = self.stars
+
+
+class SimilarService(models.Model):
+    """
+    One of the services most like `service` in name and description, from
+    another company; `rank` 0 is the closest. Rebuilt by
+    services.similar rather than kept up to date on every write.
+    """
+    service = models.ForeignKey(Service, on_delete=models.CASCADE,
+                                related_name='similar')
+    similar = models.ForeignKey(Service, on_delete=models.CASCADE,
+                                related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    # cosine similarity of the two services' TF-IDF vectors
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['service', 'rank'],
+                                    name='similar_service_rank_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.similar} like {self.service}"
+
+
+class ServiceTerm(models.Model):
+    """
+    A term of a service's name and description with its weight in the
+    service's L2-normalized TF-IDF vector, written when the service is
+    saved. By term, the rows are an inverted index: the services sharing
+    a term are one range of the postings index.
+    """
+    service = models.ForeignKey(Service, on_delete=models.CASCADE,
+                                related_name='+', db_index=False)
+    # services.similar leaves longer words out
+    term = models.CharField(max_length=40)
+    weight = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['service', 'term'],
+                                    name='service_term_unique'),
+        ]
+        indexes = [
+            # covering, so comparing through a term never reads the table
+            models.Index(fields=['term', 'service', 'weight'],
+                         name='service_term_postings_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} in {self.service_id}"
+
+
+class TermFrequency(models.Model):
+    """
+    The number of services with `term` in their name or description, for
+    the IDF of their vectors. Kept up to date on every write, like the
+    stats tables.
+    """
+    term = models.CharField(max_length=40, primary_key=True)
+    services = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.term} in {self.services} services"
+
+
+class StaleSimilarService(models.Model):
+    """
+    A service whose similar services are due a refresh. Not a foreign key,
+    so services can be marked while a delete is under way.
+    """
+    service_id = models.IntegerField(primary_key=True)
@@ -0,0 +1,273 @@
+import csv
+import itertools
+import json
+import os
+from collections import namedtuple
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils.text import slugify
+
+from main.db import retry_on_locked
+from main.tasks import enqueue
+from users.forms import CompanySignUpForm
+from users.models import User, Company
+from . import categories, rollups, search, similar, stats
+from .cache import NAVBAR, bump
+from .forms import CreateNewService
+from .models import Service
+from .tasks import refresh_similar_services
+
+# A partner CSV has one row per service, the company columns repeated on
+# each; a company without services has one row with empty service columns.
+# A company's rows must be consecutive. Fields are given by name, e.g.
+# 'Plumbing' or 'All in One'.
+COLUMNS = ('username', 'email', 'password', 'field', 'service_name',
+           'service_description', 'service_price', 'service_field')
+
+
+class ImportFileError(ValueError):
+    pass
+
+
+class ImportCompanyForm(CompanySignUpForm):
+    """
+    CompanySignUpForm without its per-row uniqueness queries; the importer
+    checks a whole batch of usernames and emails against the database at
+    once.
+    """
+
+    def clean_email(self):
+        return self.cleaned_data.get('email').lower().strip()
+
+    def validate_unique(self):
+        pass
+
+
+Onboarding = namedtuple('Onboarding', 'number form services')
+BatchResult = namedtuple('BatchResult', 'rows companies services errors last_row')
+
+
+def format_errors(form):
+    return '; '.join('%s: %s' % (name, ' '.join(messages))
+                     for name, messages in form.errors.items())
+
+
+def read_groups(path, after=0):
+    """
+    Yields the rows of each company in the CSV as lists of (row number,
+    row), skipping the companies whose rows end at or before `after`.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        missing = set(COLUMNS) - set(reader.fieldnames or ())
+        if missing:
+            raise ImportFileError(
+                "%s lacks the columns %s" % (path, ', '.join(sorted(missing))))
+        groups = itertools.groupby(
+            enumerate(reader, 1), key=lambda item: item[1]['username'].strip())
+        for _, group in groups:
+            group = list(group)
+            if group[-1][0] > after:
+                yield group
+
+
+def validate(group, errors):
+    """
+    Validates a company's rows with the signup and service creation rules.
+    Returns an Onboarding, or None after adding to `errors` if the company
+    itself is invalid; invalid services are left out on their own.
+    """
+    number, row = group[0]
+    form = ImportCompanyForm({
+        'username': row['username'].strip(),
+        'email': row['email'],
+        'password1': row['password'],
+        'password2': row['password'],
+        'field': slugify(row['field']),
+    })
+    if not form.is_valid():
+        errors.append((number, format_errors(form)))
+        errors.extend((other, "company of row %d was rejected" % number)
+                      for other, _ in group[1:])
+        return None
+
+    field = form.cleaned_data['field']
+    choices = categories.choices if field is None else [(field.slug, field.name)]
+    services = []
+    for number, row in group:
+        if not row['service_name'].strip():
+            continue
+        service = CreateNewService({
+            'name': row['service_name'].strip(),
+            'description': row['service_description'],
+            'price_hour': row['service_price'],
+            'field': slugify(row['service_field']) or (field and field.slug),
+        }, choices=choices)
+        if service.is_valid():
+            services.append((number, service))
+        else:
+            errors.append((number, format_errors(service)))
+    return Onboarding(group[0][0], form, services)
+
+
+class Checkpoint:
+    """
+    The last CSV row of the last batch that committed. Before committing,
+    a batch marks the checkpoint pending with the username of one of the
+    users it creates; whether that user exists tells, on resume, whether
+    the pending batch made it in.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return 0
+        if state.get('pending'):
+            row, username = state['pending']
+            if User.objects.filter(username=username).exists():
+                return row
+        return state['row']
+
+    def save(self, row, pending=None):
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump({'row': row, 'pending': pending}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Importer:
+    """
+    Imports a partner CSV in batches of `batch_size` companies, each batch
+    in one transaction of bulk inserts, hashing passwords across the
+    processes of `pool` (anything with an executor's map). After a failure
+    it resumes after the last committed batch, see Checkpoint.load.
+    """
+
+    def __init__(self, path, pool, checkpoint=None, batch_size=500):
+        self.path = path
+        self.pool = pool
+        self.checkpoint = Checkpoint(checkpoint or path + '.checkpoint')
+        self.batch_size = batch_size
+        self.row = 0
+
+    def run(self, after=0):
+        """ Imports the rows after `after`, yielding a BatchResult per batch. """
+        self.row = after
+        groups = read_groups(self.path, after=self.row)
+        while True:
+            batch = list(itertools.islice(groups, self.batch_size))
+            if not batch:
+                break
+            yield self.import_batch(batch)
+        self.checkpoint.clear()
+
+    def import_batch(self, groups):
+        errors = []
+        onboardings = [item for item in (validate(group, errors) for group in groups)
+                       if item is not None]
+        accepted = self.check_unique(onboardings, errors)
+
+        passwords = [item.form.cleaned_data['password1'] for item in accepted]
+        chunksize = max(1, len(passwords) // ((os.cpu_count() or 1) * 4))
+        hashes = list(self.pool.map(make_password, passwords, chunksize=chunksize))
+
+        last_row = groups[-1][-1][0]
+        services = []
+        if accepted:
+            self.checkpoint.save(self.row, pending=(
+                last_row, accepted[0].form.cleaned_data['username']))
+            services = self.write(accepted, hashes)
+        self.checkpoint.save(last_row)
+        self.row = last_row
+        if services:
+            bump('catalogue', NAVBAR, *{categories.scope(service.field_id) for service in services})
+        return BatchResult(sum(len(group) for group in groups), len(accepted),
+                           len(services), errors, last_row)
+
+    def check_unique(self, onboardings, errors):
+        # one query per column for the whole batch instead of two per row
+        usernames = set(User.objects.filter(
+            username__in=[item.form.cleaned_data['username'] for item in onboardings]
+        ).values_list('username', flat=True))
+        emails = set(User.objects.filter(
+            email__in=[item.form.cleaned_data['email'] for item in onboardings]
+        ).values_list('email', flat=True))
+        accepted = []
+        for item in onboardings:
+            username = item.form.cleaned_data['username']
+            email = item.form.cleaned_data['email']
+            if username in usernames:
+                error = "username: A user with that username already exists."
+            elif email in emails:
+                error = "email: This email is already registered."
+            else:
+                error = None
+            if error:
+                errors.append((item.number, error))
+                errors.extend((number, "company of row %d was rejected" % item.number)
+                              for number, _ in item.services if number != item.number)
+            else:
+                usernames.add(username)
+                emails.add(email)
+                accepted.append(item)
+        return accepted
+
+    @retry_on_locked
+    @transaction.atomic
+    def write(self, accepted, hashes):
+        User.objects.bulk_create([
+            User(username=item.form.cleaned_data['username'],
+                 email=item.form.cleaned_data['email'],
+                 password=password, is_company=True)
+            for item, password in zip(accepted, hashes)])
+        # bulk_create does not hand back primary keys on SQLite
+        ids = dict(User.objects.filter(
+            username__in=[item.form.cleaned_data['username'] for item in accepted]
+        ).values_list('username', 'id'))
+
+        companies, services = [], []
+        for item in accepted:
+            company_id = ids[item.form.cleaned_data['username']]
+            field = item.form.cleaned_data['field']
+            companies.append(Company(user_id=company_id, field=field,
+                                     is_all_in_one=(field is None)))
+            for _, form in item.services:
+                description = form.cleaned_data['description']
+                services.append(Service(
+                    company_id=company_id,
+                    name=form.cleaned_data['name'],
+                    description=description,
+                    summary=Service.summarize(description),
+                    price_hour=form.cleaned_data['price_hour'],
+                    field=form.cleaned_data['field']))
+        Company.objects.bulk_create(companies)
+        Service.objects.bulk_create(services)
+
+        # bulk inserts skip the signals that maintain these
+        stats.record_bulk_create(services)
+        rollups.record_bulk_services(services)
+        created = list(Service.objects.filter(
+            company_id__in=ids.values()).values_list('id', flat=True))
+        search.index_services(created)
+        similar.index_services(created)
+        similar.mark_stale(created)
+        enqueue(refresh_similar_services, dedupe_key='similar-services')
+        return services
+
+
+def setup_worker():
+    # processes started with spawn rather than fork begin unconfigured
+    django.setup()
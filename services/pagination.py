@@ -0,0 +1,152 @@
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import Http404
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    raw = json.dumps([str(value) for value in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, fields):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(values, list) or len(values) != len(fields):
+        raise InvalidCursor(cursor)
+    try:
+        return [field.to_python(value) for field, value in zip(fields, values)]
+    except Exception:
+        raise InvalidCursor(cursor)
+
+
+class KeysetPage:
+
+    def __init__(self, object_list, paginator, has_next, has_previous, request):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.request = request
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def _url(self, direction, obj):
+        params = self.request.GET.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        params[direction] = encode_cursor(self.paginator.key_of(obj))
+        return '?' + params.urlencode()
+
+    @property
+    def next_url(self):
+        if self.has_next:
+            return self._url('after', self.object_list[-1])
+        return None
+
+    @property
+    def previous_url(self):
+        if self.has_previous:
+            return self._url('before', self.object_list[0])
+        return None
+
+
+class KeysetPaginator:
+    """
+    Paginates a queryset by seeking past the last row seen instead of using
+    OFFSET, so every page costs the same however deep it is. The ordering
+    must end on a unique column (the primary key) to keep pages stable.
+
+    A page takes two queries: one for the primary keys, one for the rows.
+    """
+
+    def __init__(self, queryset, ordering=('-date', '-id'), per_page=None):
+        self.queryset = queryset
+        self.ordering = ordering
+        self.per_page = per_page or settings.SERVICES_PAGE_SIZE
+        opts = queryset.model._meta
+        self.names = [name.lstrip('-') for name in ordering]
+        self.fields = [opts.get_field(name) for name in self.names]
+
+    def key_of(self, obj):
+        return [getattr(obj, field.attname) for field in self.fields]
+
+    def _seek(self, values, forward):
+        # (a, b) > (x, y) expands to a > x OR (a = x AND b > y), with the
+        # comparison flipped for descending columns
+        condition = Q()
+        equal = Q()
+        bound = None
+        for name, attname, value in zip(
+                self.ordering, [f.attname for f in self.fields], values):
+            descending = name.startswith('-')
+            lookup = 'lt' if descending == forward else 'gt'
+            condition |= equal & Q(**{'%s__%s' % (attname, lookup): value})
+            equal &= Q(**{attname: value})
+            if bound is None:
+                # the same range on the leading column alone, which the
+                # planner can seek the index with
+                bound = Q(**{'%s__%se' % (attname, lookup): value})
+        return bound & condition
+
+    def page(self, request):
+        after = request.GET.get('after')
+        before = request.GET.get('before')
+        queryset = self.queryset
+        ordering = list(self.ordering)
+        if before:
+            values = decode_cursor(before, self.fields)
+            queryset = queryset.filter(self._seek(values, forward=False))
+            ordering = [name[1:] if name.startswith('-') else '-' + name
+                        for name in ordering]
+        elif after:
+            values = decode_cursor(after, self.fields)
+            queryset = queryset.filter(self._seek(values, forward=True))
+
+        # pick the page's keys off the index alone, then load just those
+        # rows; joining first lets the planner start from the joined table
+        # and sort the whole result
+        ids = list(queryset.order_by(*ordering).values_list(
+            'pk', flat=True)[:self.per_page + 1])
+        has_more = len(ids) > self.per_page
+        ids = ids[:self.per_page]
+        position = {pk: n for n, pk in enumerate(ids)}
+        rows = self.queryset.filter(pk__in=ids) if ids else []
+        rows = sorted(rows, key=lambda obj: position[obj.pk])
+        if before:
+            rows.reverse()
+            return KeysetPage(rows, self, True, has_more, request)
+        return KeysetPage(rows, self, has_more, bool(after), request)
+
+
+def page_size(request):
+    # lets the client pick a page size, within the configured maximum
+    try:
+        size = int(request.GET.get('size', settings.SERVICES_PAGE_SIZE))
+    except ValueError:
+        size = settings.SERVICES_PAGE_SIZE
+    return max(1, min(size, settings.SERVICES_MAX_PAGE_SIZE))
+
+
+def paginate(request, queryset, ordering=('-date', '-id')):
+    paginator = KeysetPaginator(queryset, ordering, page_size(request))
+    try:
+        return paginator.page(request)
+    except InvalidCursor:
+        raise Http404("Invalid page cursor")
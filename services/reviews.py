@@ -0,0 +1,139 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, FloatField, IntegerField, Sum, Value, When
+from django.db.models.functions import Cast, Round
+
+from main.db import retry_on_locked
+from users.models import Company
+from . import stats
+from .models import Review, Service
+
+
+def rounded_average(stars, count):
+    # half up, like SQL ROUND on the positive averages
+    return int(stars / count + 0.5) if count else 0
+
+
+def rating_changes(stars, count):
+    """
+    UPDATE assignments adding `count` reviews totalling `stars` to a row's
+    rating columns. The right-hand sides all read the values the row had,
+    so the new average is computed from them in the same statement.
+    """
+    total = F('rating_sum') + stars
+    number = F('rating_count') + count
+    return {
+        'rating_sum': total,
+        'rating_count': number,
+        'rating': Case(
+            When(rating_count__lte=-count, then=Value(0)),
+            default=Cast(Round(Cast(total, FloatField()) / Cast(number, FloatField())),
+                         IntegerField()),
+            output_field=IntegerField()),
+    }
+
+
+def _apply(service_id, stars, count):
+    changes = rating_changes(stars, count)
+    # the first UPDATE takes the write lock, so the field and company read
+    # next are the ones the totals below belong to
+    Service.objects.filter(pk=service_id).update(**changes)
+    row = Service.objects.filter(pk=service_id).values('field_id', 'company_id').first()
+    if row is None:
+        return
+    Company.objects.filter(pk=row['company_id']).update(**changes)
+    stats.add_reviews(row, stars, count)
+
+
+def record_save(review, previous):
+    if previous is None:
+        _apply(review.service_id, review.stars, 1)
+    elif previous != review.stars:
+        _apply(review.service_id, review.stars - previous, 0)
+
+
+def record_delete(review):
+    _apply(review.service_id, -review.stars, -1)
+
+
+@retry_on_locked
+def review(customer, service, stars, text=''):
+    """
+    Writes `customer`'s review of `service`, replacing their earlier one.
+    Returns (review, created).
+    """
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                # write before reading: SQLite fails a transaction at once,
+                # without waiting, if it read a snapshot another writer has
+                # since committed over and then tries to write
+                Review.objects.filter(customer=customer, service=service).update(text=text)
+                existing = Review.objects.filter(customer=customer, service=service).first()
+                written = existing or Review(customer=customer, service=service)
+                written.stars = stars
+                written.text = text
+                written.save()
+                return written, existing is None
+        except IntegrityError:
+            # the same customer's first review landed in between; the next
+            # attempt updates it
+            if attempt:
+                raise
+
+
+# Reconciliation
+
+def expected(model, ids):
+    """ (stars, reviews) of the `model` rows `ids`, counted from Review. """
+    group_by = 'service_id' if model is Service else 'service__company_id'
+    rows = Review.objects.filter(**{group_by + '__in': ids}).values(group_by).annotate(
+        stars=Sum('stars'), reviews=Count('id')).order_by()
+    return {row[group_by]: (row['stars'], row['reviews']) for row in rows}
+
+
+def drift(model, chunk_size=5000):
+    """
+    Yields (pk, stored, expected) for each `model` row whose rating columns
+    disagree with its reviews, as (rating_sum, rating_count, rating), a
+    chunk of rows at a time.
+    """
+    last = None
+    while True:
+        rows = model.objects.order_by('pk')
+        if last is not None:
+            rows = rows.filter(pk__gt=last)
+        rows = list(rows.values_list('pk', 'rating_sum', 'rating_count', 'rating')[:chunk_size])
+        if not rows:
+            return
+        counted = expected(model, [row[0] for row in rows])
+        for pk, *stored in rows:
+            stars, reviews = counted.get(pk, (0, 0))
+            wanted = (stars, reviews, rounded_average(stars, reviews))
+            if tuple(stored) != wanted:
+                yield pk, tuple(stored), wanted
+        last = rows[-1][0]
+
+
+@retry_on_locked
+@transaction.atomic
+def repair(model, rows):
+    """ Overwrites the rating columns of `rows`, from drift(). """
+    for pk, _, (stars, reviews, rating) in rows:
+        model.objects.filter(pk=pk).update(
+            rating_sum=stars, rating_count=reviews, rating=rating)
+
+
+def reconcile(model, chunk_size=5000, batch_size=500):
+    """ Repairs every drifted `model` row; returns how many there were. """
+    repaired = 0
+    batch = []
+    for row in drift(model, chunk_size):
+        batch.append(row)
+        if len(batch) == batch_size:
+            repair(model, batch)
+            repaired += len(batch)
+            batch = []
+    if batch:
+        repair(model, batch)
+        repaired += len(batch)
+    return repaired
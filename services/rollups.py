@@ -0,0 +1,153 @@
+from collections import defaultdict
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay, TruncHour
+
+from main.db import retry_on_locked
+from .models import Activity, CompanyActivity, FieldActivity, Service, ServiceRequest
+from .stats import cents, increment
+
+HOUR, DAY, WEEK = Activity.HOUR, Activity.DAY, 'week'
+
+COUNTERS = ('services_published', 'requests', 'hours_booked', 'booked_cents')
+
+# the group column of each rollup, on itself and on Service
+GROUPS = ((CompanyActivity, 'company_id'), (FieldActivity, 'field_id'))
+
+TRUNCATE = {HOUR: TruncHour, DAY: TruncDay}
+
+
+def periods(when):
+    """ The starts of the hour and the day `when` falls in, in UTC. """
+    hour = when.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return {HOUR: hour, DAY: hour.replace(hour=0)}
+
+
+def record(company_id, field_id, when, **deltas):
+    for resolution, period in periods(when).items():
+        for model, key in GROUPS:
+            group = company_id if key == 'company_id' else field_id
+            increment(model, {key: group, 'resolution': resolution, 'period': period},
+                      **deltas)
+
+
+def record_service(service, sign=1):
+    record(service.company_id, service.field_id, service.created,
+           services_published=sign)
+
+
+def record_request(request, sign=1):
+    service = request.service
+    record(service.company_id, service.field_id, request.request_date,
+           requests=sign, hours_booked=sign * request.service_time,
+           booked_cents=sign * cents(request.price))
+
+
+def record_bulk_services(services):
+    """ Adds services inserted with bulk_create, which sends no signals. """
+    published = defaultdict(int)
+    for service in services:
+        for resolution, period in periods(service.created).items():
+            published[(service.company_id, service.field_id, resolution, period)] += 1
+    with transaction.atomic():
+        for (company_id, field_id, resolution, period), count in published.items():
+            increment(CompanyActivity, {'company_id': company_id, 'resolution': resolution,
+                                        'period': period}, services_published=count)
+            increment(FieldActivity, {'field_id': field_id, 'resolution': resolution,
+                                         'period': period}, services_published=count)
+
+
+def compute(key, resolution, since=None):
+    """
+    Recomputes the counters of one kind of rollup from the services and
+    requests since `since`, as {(group, period): {counter: value}}.
+    Requests count under their service's current company and field.
+    """
+    truncate = TRUNCATE[resolution]
+    totals = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+
+    services = Service.objects.all()
+    if since is not None:
+        services = services.filter(created__gte=since)
+    rows = services.annotate(period=truncate('created', tzinfo=dt_timezone.utc)).values(
+        key, 'period').annotate(published=Count('id')).order_by()
+    for row in rows:
+        totals[(row[key], row['period'])]['services_published'] = row['published']
+
+    requests = ServiceRequest.objects.all()
+    if since is not None:
+        requests = requests.filter(request_date__gte=since)
+    rows = requests.annotate(period=truncate('request_date', tzinfo=dt_timezone.utc)).values(
+        'service__' + key, 'period').annotate(
+        number=Count('id'), hours=Sum('service_time'), price=Sum('price')).order_by()
+    for row in rows:
+        total = totals[(row['service__' + key], row['period'])]
+        total['requests'] = row['number']
+        total['hours_booked'] = row['hours']
+        total['booked_cents'] = cents(row['price'])
+    return totals
+
+
+@retry_on_locked
+@transaction.atomic
+def backfill(since=None, batch_size=2000):
+    """
+    Replaces the rollups from the start of the day of `since`, or all of
+    them, with counters recomputed from the services and requests.
+    Returns the number of rollup rows written.
+    """
+    if since is not None:
+        since = periods(since)[DAY]
+    written = 0
+    for model, key in GROUPS:
+        for resolution in TRUNCATE:
+            stale = model.objects.filter(resolution=resolution)
+            if since is not None:
+                stale = stale.filter(period__gte=since)
+            stale.delete()
+            rows = [model(resolution=resolution, period=period, **{key: group}, **counters)
+                    for (group, period), counters in compute(key, resolution, since).items()]
+            model.objects.bulk_create(rows, batch_size=batch_size)
+            written += len(rows)
+    return written
+
+
+def chart(activity, resolution, count, now):
+    """
+    The last `count` hours, days or weeks (from Monday) up to `now` of
+    `activity`, the rollups of one company or field, oldest first and
+    with the periods nothing happened in as zeros.
+    """
+    if resolution == WEEK:
+        end = periods(now)[DAY]
+        end -= timedelta(days=end.weekday())
+        step = timedelta(weeks=1)
+    else:
+        end = periods(now)[resolution]
+        step = timedelta(hours=1) if resolution == HOUR else timedelta(days=1)
+    start = end - step * (count - 1)
+
+    labels = [start + step * n for n in range(count)]
+    index = {label: n for n, label in enumerate(labels)}
+    series = {name: [0] * count for name in COUNTERS}
+    rows = activity.filter(
+        resolution=HOUR if resolution == HOUR else DAY,
+        period__gte=start, period__lt=end + step,
+    ).values_list('period', *COUNTERS)
+    for period, *counters in rows:
+        if resolution == WEEK:
+            period = periods(period)[DAY]
+            period -= timedelta(days=period.weekday())
+        n = index[period.astimezone(dt_timezone.utc)]
+        for name, value in zip(COUNTERS, counters):
+            series[name][n] += value
+
+    booked = series.pop('booked_cents')
+    series['booked'] = [value / 100 for value in booked]
+    return {
+        'resolution': resolution,
+        'labels': [label.isoformat() for label in labels],
+        'series': series,
+    }
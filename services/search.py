@@ -0,0 +1,123 @@
+import re
+
+from django.db import connection, connections, router
+from django.db.models import Q
+
+from .models import Service
+
+TABLE = 'services_service_fts'
+
+# bm25 weights for the name, description and company columns
+WEIGHTS = (10.0, 1.0, 5.0)
+
+# matches ranked by search_ids(), the newest first
+CANDIDATES = 500
+
+TOKEN = re.compile(r'\w+', re.UNICODE)
+
+# the indexed text of a service, keyed by the service id used as the rowid
+SOURCE = '''
+    SELECT s.id, s.name, s.description, u.username
+    FROM services_service s
+    INNER JOIN users_company c ON c.user_id = s.company_id
+    INNER JOIN users_user u ON u.id = c.user_id
+'''
+
+
+def is_available():
+    # FTS5 is SQLite only; other backends fall back to icontains
+    return connection.vendor == 'sqlite'
+
+
+def rebuild():
+    """ Refills the whole index from the services table. """
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM %s" % TABLE)
+        cursor.execute(
+            "INSERT INTO %s (rowid, name, description, company) %s"
+            % (TABLE, SOURCE))
+        cursor.execute("INSERT INTO %s (%s) VALUES ('optimize')"
+                       % (TABLE, TABLE))
+        cursor.execute("SELECT count(*) FROM %s" % TABLE)
+        return cursor.fetchone()[0]
+
+
+def index_services(ids):
+    ids = list(ids)
+    if not ids or not is_available():
+        return
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM %s WHERE rowid IN (%s)"
+                       % (TABLE, placeholders), ids)
+        cursor.execute(
+            "INSERT INTO %s (rowid, name, description, company) %s"
+            " WHERE s.id IN (%s)" % (TABLE, SOURCE, placeholders), ids)
+
+
+def remove_services(ids):
+    ids = list(ids)
+    if not ids or not is_available():
+        return
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM %s WHERE rowid IN (%s)"
+                       % (TABLE, placeholders), ids)
+
+
+def match_expression(query):
+    """
+    Turns free text into an FTS5 query: every word must match, and the
+    last one may be a prefix so results show up while typing. Words are
+    quoted so user input can never be read as FTS5 syntax.
+    """
+    words = TOKEN.findall(query)
+    if not words:
+        return None
+    terms = ['"%s"' % word for word in words]
+    terms[-1] += ' *'
+    return ' '.join(terms)
+
+
+def search_ids(query, limit, offset=0, ranked=True):
+    """
+    Returns the ids of the services matching `query`, best first, or
+    newest first if not `ranked`. Ranking scores only the CANDIDATES
+    newest matches, so words most services contain cost no more than rare
+    ones, and pages of ranked results end there.
+    """
+    if not is_available():
+        return _fallback_ids(query, limit, offset)
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    if ranked:
+        # FTS5 walks the matches newest first and scores only those it
+        # hands over to the sort
+        sql = (
+            "SELECT id FROM (SELECT rowid AS id, bm25({table}, {weights}) AS score "
+            "FROM {table} WHERE {table} MATCH %s ORDER BY rowid DESC LIMIT %s) "
+            "ORDER BY score, id DESC LIMIT %s OFFSET %s").format(
+            table=TABLE, weights=', '.join(map(str, WEIGHTS)))
+        params = [expression, CANDIDATES, limit, offset]
+    else:
+        sql = ("SELECT rowid FROM {table} WHERE {table} MATCH %s "
+               "ORDER BY rowid DESC LIMIT %s OFFSET %s").format(table=TABLE)
+        params = [expression, limit, offset]
+    # a read like any other catalogue read, so it may go to the replica
+    with connections[router.db_for_read(Service)].cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _fallback_ids(query, limit, offset):
+    words = TOKEN.findall(query)
+    if not words:
+        return []
+    services = Service.objects.all()
+    for word in words:
+        services = services.filter(
+            Q(name__icontains=word) | Q(description__icontains=word)
+            | Q(company__user__username__icontains=word))
+    return list(services.order_by('-date', '-id').values_list(
+        'id', flat=True)[offset:offset + limit])
@@ -0,0 +1,192 @@
+import contextlib
+import random
+import uuid
+from datetime import date, time, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.utils import timezone
+
+from users.models import User, Company, Customer
+from . import categories
+from .models import AvailabilityWindow, Review, Service, ServiceRequest
+
+WORDS = (
+    'fast reliable certified local affordable emergency professional '
+    'repair install maintenance cleaning replacement inspection service '
+    'expert friendly licensed quality weekend same-day warranty'
+).split()
+
+
+@contextlib.contextmanager
+def explicit_dates():
+    # Service.date is auto_now and ServiceRequest.request_date auto_now_add,
+    # which would stamp every seeded row with the same instant; switch them
+    # off so the seeder can spread dates out
+    date = Service._meta.get_field('date')
+    request_date = ServiceRequest._meta.get_field('request_date')
+    date.auto_now = request_date.auto_now_add = False
+    try:
+        yield
+    finally:
+        date.auto_now = request_date.auto_now_add = True
+
+
+def seed_companies(count, prefix='seed', batch_size=1000):
+    """
+    Creates `count` company users with unusable passwords and returns their
+    Company rows. Usernames are `<prefix>-company-<n>`.
+    """
+    password = make_password(None)
+    users = [
+        User(username='%s-company-%d' % (prefix, n),
+             email='%s-company-%d@example.com' % (prefix, n),
+             password=password, is_company=True)
+        for n in range(count)
+    ]
+    User.objects.bulk_create(users, batch_size=batch_size)
+    # bulk_create does not hand back primary keys on SQLite
+    ids = User.objects.filter(
+        username__startswith='%s-company-' % prefix).values_list('id', flat=True)
+    fields = categories.all()
+    companies = []
+    for n, user_id in enumerate(ids):
+        field = None if n % 5 == 0 else fields[n % len(fields)]
+        companies.append(Company(user_id=user_id, field=field,
+                                 is_all_in_one=(field is None)))
+    Company.objects.bulk_create(companies, batch_size=batch_size)
+    return companies
+
+
+def seed_services(companies, count, batch_size=2000, days=365, rng=None):
+    """
+    Creates `count` services spread over `companies` and over the last
+    `days` days, in batches.
+    """
+    rng = rng or random.Random(0)
+    fields = categories.all()
+    now = timezone.now()
+    span = int(timedelta(days=days).total_seconds())
+    created = 0
+    with explicit_dates():
+        while created < count:
+            batch = []
+            for _ in range(min(batch_size, count - created)):
+                company = rng.choice(companies)
+                if company.is_all_in_one:
+                    field = rng.choice(fields)
+                else:
+                    field = company.field
+                description = ' '.join(rng.choice(WORDS) for _ in range(40))
+                date = now - timedelta(seconds=rng.randrange(span))
+                batch.append(Service(
+                    company_id=company.user_id,
+                    name=' '.join(rng.choice(WORDS) for _ in range(3))[:40],
+                    description=description,
+                    summary=Service.summarize(description),
+                    price_hour=rng.randint(1000, 20000) / 100,
+                    field=field,
+                    date=date,
+                    created=date,
+                ))
+            Service.objects.bulk_create(batch)
+            created += len(batch)
+    return created
+
+
+def seed_customers(count, prefix='seed', batch_size=1000, rng=None):
+    """
+    Creates `count` customer users with unusable passwords and returns
+    their Customer rows. Usernames are `<prefix>-customer-<n>`.
+    """
+    rng = rng or random.Random(0)
+    password = make_password(None)
+    User.objects.bulk_create((
+        User(username='%s-customer-%d' % (prefix, n),
+             email='%s-customer-%d@example.com' % (prefix, n),
+             password=password, is_customer=True)
+        for n in range(count)), batch_size=batch_size)
+    ids = User.objects.filter(
+        username__startswith='%s-customer-' % prefix).values_list('id', flat=True)
+    Customer.objects.bulk_create((
+        Customer(user_id=user_id,
+                 birth=date(1950, 1, 1) + timedelta(days=rng.randrange(20000)))
+        for user_id in ids), batch_size=batch_size)
+    return list(Customer.objects.filter(user_id__in=ids))
+
+
+def seed_requests(customers, count, batch_size=2000, days=90, rng=None):
+    """
+    Books `count` random services for random `customers` over the last
+    `days` days, each after its service was published.
+    """
+    rng = rng or random.Random(0)
+    services = list(Service.objects.values_list('id', 'price_hour', 'created'))
+    now = timezone.now()
+    earliest = now - timedelta(days=days)
+    created = 0
+    with explicit_dates():
+        while created < count and services:
+            batch = []
+            for _ in range(min(batch_size, count - created)):
+                service_id, price, published = rng.choice(services)
+                start = max(published, earliest)
+                hours = rng.randint(1, 8)
+                batch.append(ServiceRequest(
+                    customer=rng.choice(customers), service_id=service_id,
+                    address='%d Seed Street' % rng.randint(1, 999),
+                    service_time=hours, price=price * hours,
+                    request_date=start + (now - start) * rng.random(),
+                    idempotency_key=uuid.UUID(int=rng.getrandbits(128))))
+            ServiceRequest.objects.bulk_create(batch)
+            created += len(batch)
+    return created
+
+
+def seed_reviews(customers, count, batch_size=2000, rng=None):
+    """
+    Has random `customers` review random services, at most once each.
+    Leaves the rating totals to reviews.reconcile, as bulk_create sends no
+    signals.
+    """
+    rng = rng or random.Random(0)
+    services = list(Service.objects.values_list('id', flat=True))
+    count = min(count, len(services) * len(customers))
+    seen = set()
+    while len(seen) < count:
+        batch = []
+        while len(batch) < batch_size and len(seen) < count:
+            pair = (rng.choice(customers).pk, rng.choice(services))
+            if pair in seen:
+                continue
+            seen.add(pair)
+            batch.append(Review(customer_id=pair[0], service_id=pair[1],
+                                stars=rng.randint(1, 5)))
+        Review.objects.bulk_create(batch)
+    return count
+
+
+def seed_availability(companies, days=14, batch_size=2000, rng=None):
+    """
+    Gives each of `companies` weekday windows of six to ten hours, a
+    Saturday morning for some, and a one-off evening in the next `days`
+    days for others.
+    """
+    rng = rng or random.Random(0)
+    today = timezone.localdate()
+    windows = []
+    for company in companies:
+        opens = rng.randint(6, 10)
+        closes = min(opens + rng.randint(6, 10), 23)
+        for weekday in range(5):
+            windows.append(AvailabilityWindow(
+                company_id=company.user_id, weekday=weekday,
+                start=time(opens), end=time(closes)))
+        if rng.random() < 0.3:
+            windows.append(AvailabilityWindow(
+                company_id=company.user_id, weekday=5, start=time(9), end=time(13)))
+        if rng.random() < 0.2:
+            windows.append(AvailabilityWindow(
+                company_id=company.user_id, date=today + timedelta(days=rng.randrange(days)),
+                start=time(18), end=time(22)))
+    AvailabilityWindow.objects.bulk_create(windows, batch_size=batch_size)
+    return len(windows)
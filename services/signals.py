@@ -0,0 +1,219 @@
+from django.db.models.signals import pre_save, pre_delete, post_save, post_delete
+from django.dispatch import receiver
+
+from main.tasks import enqueue
+from users.models import User, Company
+from . import availability, cache, categories, reviews, rollups, search, similar, stats
+from .models import (
+    AvailabilityWindow, Category, FreeSlot, Review, Service, ServiceRequest, SimilarService)
+from .tasks import refresh_similar_services
+
+
+@receiver(post_save, sender=Service)
+def index_service(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_services([instance.pk])
+
+
+@receiver(post_delete, sender=Service)
+def unindex_service(sender, instance, **kwargs):
+    search.remove_services([instance.pk])
+
+
+@receiver(post_delete, sender=Service)
+def remove_from_stats(sender, instance, **kwargs):
+    # runs inside the delete's transaction; saves update the stats from
+    # Service.save for the same reason
+    stats.record_delete(instance)
+
+
+@receiver(post_save, sender=Service)
+def mark_similar_stale(sender, instance, raw=False, created=False, **kwargs):
+    # what services are alike depends on their text and, as a company's
+    # own services are left out, on their company
+    if raw:
+        return
+    # a service not loaded from the database may have changed anything
+    loaded = getattr(instance, '_loaded', {})
+    changed = {name for name in ('name', 'description', 'company_id')
+               if created or name not in loaded or loaded[name] != getattr(instance, name)}
+    if changed - {'company_id'}:
+        # inside Service.save's transaction, like the stats
+        similar.index_services([instance.pk])
+    if changed:
+        similar.mark_stale([instance.pk])
+        enqueue(refresh_similar_services, dedupe_key='similar-services')
+
+
+@receiver(pre_delete, sender=Service)
+def remove_similar_terms(sender, instance, **kwargs):
+    # inside the delete's transaction, while its terms are still there to
+    # count out of the document frequencies
+    similar.remove_services([instance.pk])
+
+
+@receiver(pre_delete, sender=Service)
+def mark_listing_services_stale(sender, instance, **kwargs):
+    # the delete cascades to their entries for this service, leaving them short
+    listing = SimilarService.objects.filter(similar=instance).values_list(
+        'service_id', flat=True)
+    if listing:
+        similar.mark_stale(listing)
+        enqueue(refresh_similar_services, dedupe_key='similar-services')
+
+
+@receiver(post_save, sender=Service)
+def count_published_service(sender, instance, raw=False, created=False, **kwargs):
+    # inside Service.save's transaction, like the stats
+    if created and not raw:
+        rollups.record_service(instance)
+
+
+@receiver(post_save, sender=ServiceRequest)
+def count_service_request(sender, instance, raw=False, created=False, **kwargs):
+    if created and not raw:
+        rollups.record_request(instance)
+
+
+@receiver(post_delete, sender=Service)
+def uncount_published_service(sender, instance, **kwargs):
+    # a backfill recounts from the rows left, so deletions count out too
+    rollups.record_service(instance, sign=-1)
+
+
+@receiver(post_delete, sender=ServiceRequest)
+def uncount_service_request(sender, instance, **kwargs):
+    # also runs for the requests a service deletion cascades to, before
+    # the service row goes
+    rollups.record_request(instance, sign=-1)
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_rating(sender, instance, **kwargs):
+    # also runs for the reviews a service or customer deletion cascades to,
+    # before the service row goes
+    reviews.record_delete(instance)
+
+
+@receiver(post_save, sender=User)
+def reindex_company_services(sender, instance, raw=False, update_fields=None, **kwargs):
+    # the company name indexed with each service is its user's username;
+    # logins only save last_login, so skip saves that cannot rename it
+    if raw or not instance.is_company:
+        return
+    if update_fields is not None and 'username' not in update_fields:
+        return
+    search.index_services(Service.objects.filter(
+        company_id=instance.pk).values_list('id', flat=True))
+
+
+# Catalogue cache invalidation
+
+def _usernames(service, company_ids):
+    if company_ids == {service.company_id} and Service.company.is_cached(service) \
+            and Company.user.is_cached(service.company):
+        return {service.company.user.username}
+    return set(User.objects.filter(pk__in=company_ids).values_list(
+        'username', flat=True))
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+def invalidate_service(sender, instance, raw=False, created=True, **kwargs):
+    # `created` is left out by post_delete, which changes the counts too
+    if raw:
+        return
+    fields = {instance.field_id, instance.loaded_value('field_id')}
+    company_ids = {instance.company_id, instance.loaded_value('company_id')}
+    counts = [cache.NAVBAR] if created or len(fields) > 1 else []
+    cache.bump(
+        'catalogue', 'service:%s' % instance.pk, *counts,
+        *[categories.scope(field) for field in fields],
+        *['company:' + name for name in _usernames(instance, company_ids)])
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_reviewed_service(sender, instance, raw=False, **kwargs):
+    # the rating shows on the service's card, page and company profile
+    if raw:
+        return
+    row = Service.objects.filter(pk=instance.service_id).values_list(
+        'field_id', 'company__user__username').first()
+    scopes = ['catalogue', 'service:%s' % instance.service_id]
+    if row is not None:
+        scopes += [categories.scope(row[0]), 'company:' + row[1]]
+    cache.bump(*scopes)
+
+
+def invalidate_company(user_id, *usernames):
+    # the company shows on its profile, on every card of its services and,
+    # through its user, on their detail pages
+    services = Service.objects.filter(company_id=user_id).values_list(
+        'id', 'field_id')
+    cache.bump(
+        'catalogue',
+        *['company:' + name for name in usernames],
+        *[categories.scope(field) for _, field in services],
+        *['service:%s' % pk for pk, _ in services])
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+def invalidate_company_profile(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidate_company(instance.user_id, instance.user.username)
+
+
+def _renames(instance, update_fields):
+    return instance.is_company and instance.pk and (
+        update_fields is None
+        or {'username', 'email'} & set(update_fields))
+
+
+@receiver(pre_save, sender=User)
+def remember_username(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw and _renames(instance, update_fields):
+        instance._saved_username = User.objects.filter(
+            pk=instance.pk).values_list('username', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def invalidate_renamed_company(sender, instance, raw=False, created=False,
+                               update_fields=None, **kwargs):
+    if raw or created or not _renames(instance, update_fields):
+        return
+    invalidate_company(instance.pk, instance.username,
+                       getattr(instance, '_saved_username', instance.username))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def reload_categories(sender, instance, raw=False, **kwargs):
+    # names and slugs show in the navbar and the listings; cached cards
+    # keep an old name until they expire
+    categories.clear()
+    if not raw:
+        cache.bump('catalogue', cache.NAVBAR, categories.scope(instance.pk))
+
+
+# Free slots
+
+@receiver(post_save, sender=AvailabilityWindow)
+@receiver(post_delete, sender=AvailabilityWindow)
+def refresh_company_slots(sender, instance, raw=False, **kwargs):
+    # a company's slots are a few hundred rows, rebuilt in the same
+    # transaction as the window
+    if not raw:
+        availability.refresh([instance.company_id])
+
+
+@receiver(post_save, sender=Company)
+def copy_field_to_slots(sender, instance, raw=False, created=False, update_fields=None,
+                        **kwargs):
+    if raw or created:
+        return
+    if update_fields is not None and not {'field', 'is_all_in_one'} & set(update_fields):
+        return
+    FreeSlot.objects.filter(company=instance).update(
+        field=None if instance.is_all_in_one else instance.field_id)
@@ -0,0 +1,434 @@
+import importlib.util
+import math
+from collections import Counter, defaultdict, namedtuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Min, Sum
+
+from main.db import retry_on_locked
+from .cache import bump
+from .models import (
+    FieldStats, Service, ServiceTerm, SimilarService, StaleSimilarService, TermFrequency)
+from .search import TOKEN
+
+# a word of the name counts as much as this many of the description
+NAME_WEIGHT = 3
+
+# longer words are left out, as they fit no ServiceTerm.term
+MAX_TERM_LENGTH = 40
+
+STOP_WORDS = frozenset(
+    'a an and are as at be by for from in is it of on or our the to we with '
+    'you your'.split())
+
+# the TF-IDF vectors of the catalogue as sparse rows, L2-normalized so dot
+# products are cosine similarities: the terms of row n are
+# columns[indptr[n]:indptr[n + 1]], indexes into `vocabulary`, commonest
+# first, with their `weights`; `rows` maps service id to row
+Catalogue = namedtuple(
+    'Catalogue', 'ids companies rows vocabulary frequencies indptr columns weights')
+
+
+def is_available():
+    return importlib.util.find_spec('numpy') is not None
+
+
+def chunked(items, size=500):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def terms(name, description):
+    counts = Counter()
+    for weight, text in ((NAME_WEIGHT, name), (1, description)):
+        for word in TOKEN.findall(text.lower()):
+            if 1 < len(word) <= MAX_TERM_LENGTH and word not in STOP_WORDS:
+                counts[word] += weight
+    return counts
+
+
+def weigh(counts, frequencies, total):
+    """
+    The L2-normalized TF-IDF weights of the terms `counts`, given the
+    number of services with each term and in all.
+    """
+    weights = {term: (1 + math.log(count)) * (
+                   math.log((1 + total) / (1 + frequencies.get(term, 1))) + 1)
+               for term, count in counts.items()}
+    norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+    return {term: weight / norm for term, weight in weights.items()}
+
+
+def insert(model, columns, rows, batch_size=2000):
+    # a plain executemany; building a model instance per row costs more
+    # than the inserts
+    quote = connection.ops.quote_name
+    query = "INSERT INTO %s (%s) VALUES (%s)" % (
+        quote(model._meta.db_table),
+        ', '.join(quote(column) for column in columns),
+        ', '.join(['%s'] * len(columns)))
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            cursor.executemany(query, rows[start:start + batch_size])
+
+
+def index_services(ids):
+    """
+    Stores the vectors of the services `ids` from their name and
+    description as saved, moving the document frequencies by the terms
+    they gained and lost. Run it in the transaction that saved them.
+    """
+    documents = {}
+    for chunk in chunked(ids):
+        services = Service.objects.filter(pk__in=chunk).values_list(
+            'id', 'name', 'description')
+        for pk, name, description in services:
+            documents[pk] = terms(name, description)
+    _reindex(ids, documents)
+
+
+def remove_services(ids):
+    """ Drops the vectors of the services `ids`, about to be deleted. """
+    _reindex(ids, {})
+
+
+def _reindex(ids, documents):
+    ids = list(ids)
+    stored = defaultdict(set)
+    for chunk in chunked(ids):
+        rows = ServiceTerm.objects.filter(service_id__in=chunk).values_list('service_id', 'term')
+        for pk, term in rows:
+            stored[pk].add(term)
+
+    changes = Counter()
+    for pk in ids:
+        found = set(documents.get(pk, ()))
+        changes.update(found - stored[pk])
+        changes.subtract(stored[pk] - found)
+    # created at 0 and then incremented, so concurrent writers adding the
+    # same new term all count
+    TermFrequency.objects.bulk_create(
+        [TermFrequency(term=term) for term, change in changes.items() if change > 0],
+        ignore_conflicts=True)
+    by_change = defaultdict(list)
+    for term, change in changes.items():
+        if change:
+            by_change[change].append(term)
+    for change, group in by_change.items():
+        for chunk in chunked(group):
+            TermFrequency.objects.filter(term__in=chunk).update(services=F('services') + change)
+
+    for chunk in chunked(ids):
+        ServiceTerm.objects.filter(service_id__in=chunk).delete()
+    if not documents:
+        return
+    total = FieldStats.objects.aggregate(total=Sum('service_count'))['total'] or 0
+    frequencies = {}
+    for chunk in chunked({term for counts in documents.values() for term in counts}):
+        frequencies.update(TermFrequency.objects.filter(term__in=chunk).values_list(
+            'term', 'services'))
+    insert(ServiceTerm, ('service_id', 'term', 'weight'), [
+        (pk, term, weight) for pk, counts in documents.items()
+        for term, weight in weigh(counts, frequencies, total).items()])
+
+
+def vectorize():
+    """ Vectorizes every service's name and description. """
+    import numpy as np
+
+    ids, companies, documents = [], [], []
+    frequencies = Counter()
+    services = Service.objects.order_by('id').values_list(
+        'id', 'company_id', 'name', 'description')
+    for pk, company_id, name, description in services.iterator(chunk_size=2000):
+        counts = terms(name, description)
+        ids.append(pk)
+        companies.append(company_id)
+        documents.append(counts)
+        frequencies.update(counts.keys())
+
+    vocabulary = [term for term, _ in frequencies.most_common()]
+    numbers = {term: n for n, term in enumerate(vocabulary)}
+    indptr, columns, weights = [0], [], []
+    for counts in documents:
+        for term, weight in weigh(counts, frequencies, len(ids)).items():
+            columns.append(numbers[term])
+            weights.append(weight)
+        indptr.append(len(columns))
+    return Catalogue(
+        np.array(ids, dtype=np.int64), np.array(companies, dtype=np.int64),
+        {pk: n for n, pk in enumerate(ids)}, vocabulary,
+        np.array([frequencies[term] for term in vocabulary], dtype=np.int64),
+        np.array(indptr, dtype=np.int64), np.array(columns, dtype=np.int64),
+        np.array(weights, dtype=np.float32))
+
+
+@retry_on_locked
+@transaction.atomic
+def store_vectors(catalogue):
+    """ Replaces every stored vector and document frequency with `catalogue`'s. """
+    import numpy as np
+
+    ServiceTerm.objects.all().delete()
+    TermFrequency.objects.all().delete()
+    insert(TermFrequency, ('term', 'services'),
+           list(zip(catalogue.vocabulary, catalogue.frequencies.tolist())))
+    rows = np.repeat(catalogue.ids, np.diff(catalogue.indptr)).tolist()
+    insert(ServiceTerm, ('service_id', 'term', 'weight'), list(zip(
+        rows, [catalogue.vocabulary[column] for column in catalogue.columns.tolist()],
+        catalogue.weights.tolist())))
+
+
+def spans(starts, ends):
+    """ The indexes in the ranges from `starts` to `ends`, one after another. """
+    import numpy as np
+
+    lengths = ends - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(lengths.sum())
+
+
+def neighbours(catalogue, rows, count=None):
+    """
+    Yields (service id, [(similar id, score), ...]) for the services at
+    `rows`, closest first, leaving out services with no term in common.
+    The SIMILAR_SERVICES_MAX_TERMS commonest terms are compared as dense
+    columns, the rarer ones through the services they are found in.
+    """
+    import numpy as np
+
+    count = count or settings.SIMILAR_SERVICES_COUNT
+    size = len(catalogue.ids)
+    columns, weights = catalogue.columns, catalogue.weights
+    # a term of a single service cannot make two services alike; the
+    # vocabulary is commonest first, so the shared terms come first
+    shared = int((catalogue.frequencies > 1).sum())
+    dense = min(shared, settings.SIMILAR_SERVICES_MAX_TERMS)
+    owners = np.repeat(np.arange(size), np.diff(catalogue.indptr))
+
+    common = columns < dense
+    matrix = np.zeros((size, dense), dtype=np.float32)
+    matrix[owners[common], columns[common]] = weights[common]
+    # the services each rarer shared term is found in, by term
+    rare = np.flatnonzero((columns >= dense) & (columns < shared))
+    rare = rare[np.argsort(columns[rare], kind='stable')]
+    postings = np.searchsorted(columns[rare], np.arange(dense, shared + 1))
+
+    # blocks of about 64MB of scores
+    block_size = max(1, 2 ** 24 // max(size, 1))
+    rows = list(rows)
+    for start in range(0, len(rows), block_size):
+        block = np.array(rows[start:start + block_size], dtype=np.int64)
+        similarity = matrix[block] @ matrix.T
+
+        starts, ends = catalogue.indptr[block], catalogue.indptr[block + 1]
+        entries = spans(starts, ends)
+        local = np.repeat(np.arange(len(block)), ends - starts)
+        keep = (columns[entries] >= dense) & (columns[entries] < shared)
+        entries, local = entries[keep], local[keep]
+        term = columns[entries] - dense
+        found = spans(postings[term], postings[term + 1])
+        entry = np.repeat(np.arange(len(entries)), postings[term + 1] - postings[term])
+        np.add.at(similarity, (local[entry], owners[rare[found]]),
+                  weights[entries[entry]] * weights[rare[found]])
+
+        # services of the same company, the service itself included, are
+        # never suggested
+        similarity[catalogue.companies[block][:, None] == catalogue.companies[None, :]] = 0
+        if size > count:
+            top = np.argpartition(-similarity, count - 1, axis=1)[:, :count]
+        else:
+            top = np.tile(np.arange(size), (len(block), 1))
+        for n, row in enumerate(block):
+            best = sorted(top[n], key=lambda column: (
+                -similarity[n, column], catalogue.ids[column]))
+            yield int(catalogue.ids[row]), [
+                (int(catalogue.ids[column]), float(similarity[n, column]))
+                for column in best if similarity[n, column] > 0]
+
+
+def read_postings(terms, postings):
+    """
+    Adds to `postings` the services each of `terms` is found in, as
+    arrays of their ids, their companies and the term's weight in them.
+    """
+    import numpy as np
+
+    for chunk in chunked(terms):
+        rows = ServiceTerm.objects.filter(term__in=chunk).order_by('term').values_list(
+            'term', 'service_id', 'service__company_id', 'weight')
+        if not rows:
+            continue
+        found, services, companies, weights = zip(*rows)
+        services, companies, weights = (
+            np.array(services, dtype=np.int64), np.array(companies, dtype=np.int64),
+            np.array(weights, dtype=np.float64))
+        start = 0
+        for end in range(1, len(found) + 1):
+            if end == len(found) or found[end] != found[start]:
+                postings[found[start]] = (
+                    services[start:end], companies[start:end], weights[start:end])
+                start = end
+
+
+def compare(ids, postings=None):
+    """
+    Yields (service id, similar ids, scores) for the services `ids`, over
+    the services of other companies sharing a term with them. Only their
+    own vectors are read, and the postings of their terms not already in
+    `postings`.
+    """
+    import numpy as np
+
+    postings = {} if postings is None else postings
+    vectors = defaultdict(dict)
+    owners = {}
+    for chunk in chunked(ids):
+        rows = ServiceTerm.objects.filter(service_id__in=chunk).values_list(
+            'service_id', 'service__company_id', 'term', 'weight')
+        for pk, company, term, weight in rows:
+            vectors[pk][term] = weight
+            owners[pk] = company
+    read_postings({term for vector in vectors.values() for term in vector} - postings.keys(),
+                  postings)
+
+    for pk in ids:
+        found = [(postings[term], weight) for term, weight in vectors.get(pk, {}).items()]
+        if not found:
+            yield pk, np.zeros(0, dtype=np.int64), np.zeros(0)
+            continue
+        services = np.concatenate([services for (services, _, _), _ in found])
+        companies = np.concatenate([companies for (_, companies, _), _ in found])
+        products = np.concatenate([weights * weight for (_, _, weights), weight in found])
+        # services of the same company, the service itself included, are
+        # never suggested
+        products[companies == owners[pk]] = 0
+        # summed per distinct service, so the scores stay as long as the
+        # postings rather than the largest service id
+        candidates, positions = np.unique(services, return_inverse=True)
+        scores = np.bincount(positions, products, minlength=len(candidates))
+        found = scores > 0
+        yield pk, candidates[found], scores[found]
+
+
+def closest(similar_ids, scores, count):
+    """ The `count` best of compare()'s scores, as neighbours() lists them. """
+    import numpy as np
+
+    if len(scores) > count:
+        top = np.argpartition(-scores, count - 1)[:count]
+    else:
+        top = range(len(scores))
+    return sorted(((int(similar_ids[n]), float(scores[n])) for n in top),
+                  key=lambda item: (-item[1], item[0]))
+
+
+@retry_on_locked
+@transaction.atomic
+def store(lists, everything=False, done=()):
+    """
+    Replaces the similar services of the services in `lists`, from
+    neighbours(), or of every service if `everything`, and clears the
+    stale marks of `done`.
+    """
+    if everything:
+        SimilarService.objects.all().delete()
+    else:
+        for chunk in chunked(pk for pk, _ in lists):
+            SimilarService.objects.filter(service_id__in=chunk).delete()
+
+    # services deleted since they were vectorized
+    existing = set()
+    referenced = {pk for pk, _ in lists} | {
+        similar for _, found in lists for similar, _ in found}
+    for chunk in chunked(referenced):
+        existing.update(Service.objects.filter(pk__in=chunk).values_list('id', flat=True))
+
+    rows = []
+    for pk, found in lists:
+        if pk not in existing:
+            continue
+        found = [(similar, score) for similar, score in found if similar in existing]
+        rows.extend((pk, similar, rank, score)
+                    for rank, (similar, score) in enumerate(found))
+    insert(SimilarService, ('service_id', 'similar_id', 'rank', 'score'), rows)
+    for chunk in chunked(done):
+        StaleSimilarService.objects.filter(service_id__in=chunk).delete()
+    return len(rows)
+
+
+def build():
+    """
+    Recomputes every service's vector and the document frequencies, and
+    from them the similar services of every service.
+    """
+    stale = set(StaleSimilarService.objects.values_list('service_id', flat=True))
+    catalogue = vectorize()
+    store_vectors(catalogue)
+    lists = list(neighbours(catalogue, range(len(catalogue.ids))))
+    count = store(lists, everything=True, done=stale)
+    # services saved while building were vectorized from their old text;
+    # their marks stay for the next refresh
+    saved = set(StaleSimilarService.objects.values_list('service_id', flat=True)) - stale
+    if saved:
+        with transaction.atomic():
+            index_services(saved)
+    # every list may have changed; service pages depend on this one scope
+    # rather than a key per service to bump
+    bump('similar')
+    return count
+
+
+def mark_stale(ids):
+    StaleSimilarService.objects.bulk_create(
+        [StaleSimilarService(service_id=pk) for pk in ids], ignore_conflicts=True)
+
+
+def refresh(ids=None):
+    """
+    Refreshes the similar services after the services `ids`, by default
+    the stale ones, changed. Only their stored vectors are read, and
+    compared through the postings of their terms; only the lists they can
+    have entered or left are recomputed: their own, those listing them,
+    and those whose last entry they now beat. Terms get rarer or commoner
+    with every change; build() corrects the drift that leaves in the
+    other vectors. Returns the ids of the services refreshed.
+    """
+    if ids is None:
+        ids = StaleSimilarService.objects.values_list('service_id', flat=True)
+    ids = set(ids)
+    if not ids:
+        return set()
+    count = settings.SIMILAR_SERVICES_COUNT
+
+    changed = set()
+    for chunk in chunked(ids):
+        changed.update(Service.objects.filter(pk__in=chunk).values_list('id', flat=True))
+    affected = set(changed)
+    for chunk in chunked(ids):
+        affected.update(SimilarService.objects.filter(similar_id__in=chunk).values_list(
+            'service_id', flat=True))
+
+    lists, best, postings = [], {}, {}
+    for pk, similar_ids, scores in compare(changed, postings):
+        lists.append((pk, closest(similar_ids, scores, count)))
+        for similar, score in zip(similar_ids.tolist(), scores.tolist()):
+            if score > best.get(similar, 0):
+                best[similar] = score
+    # the score to beat to enter each list: its last entry's, or anything
+    # above 0 while it is short; read for the lists a changed service
+    # scored in only
+    for chunk in chunked(best):
+        floors = SimilarService.objects.filter(service_id__in=chunk).values(
+            'service_id').annotate(lowest=Min('score'), listed=Count('id')).values_list(
+            'service_id', 'lowest', 'listed').order_by()
+        floor = {pk: lowest for pk, lowest, listed in floors if listed >= count}
+        affected.update(pk for pk in chunk if best[pk] > floor.get(pk, 0))
+
+    lists.extend((pk, closest(similar_ids, scores, count))
+                 for pk, similar_ids, scores in compare(affected - changed, postings))
+    store(lists, done=ids)
+    bump(*['service:%d' % pk for pk in affected])
+    return affected
@@ -0,0 +1,143 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from .models import Service, FieldStats, CompanyStats
+
+TRACKED = ('field_id', 'company_id', 'price_hour')
+
+
+def cents(price):
+    return int((Decimal(str(price)) * 100).to_integral_value())
+
+
+def snapshot(service):
+    """
+    The tracked columns of `service` as stored, from what was loaded when
+    possible and from the database otherwise; None if it is not stored.
+    """
+    loaded = getattr(service, '_loaded', {})
+    if all(name in loaded for name in TRACKED):
+        return {name: loaded[name] for name in TRACKED}
+    return Service.objects.filter(pk=service.pk).values(*TRACKED).first()
+
+
+def current(service):
+    return {name: getattr(service, name) for name in TRACKED}
+
+
+def increment(model, lookup, **deltas):
+    """
+    Adds `deltas` to the counters of the `model` row matching `lookup`,
+    creating it if there is none yet.
+    """
+    changes = {name: F(name) + delta for name, delta in deltas.items()}
+    if model.objects.filter(**lookup).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**deltas, **lookup)
+    except IntegrityError:
+        # created by a concurrent write in between
+        model.objects.filter(**lookup).update(**changes)
+
+
+def _groups(row):
+    return ((FieldStats, {'field_id': row['field_id']}),
+            (CompanyStats, {'company_id': row['company_id']}))
+
+
+def _apply(row, sign):
+    for model, lookup in _groups(row):
+        increment(model, lookup, service_count=sign,
+             price_cents_sum=sign * cents(row['price_hour']))
+
+
+def add_reviews(row, stars, count):
+    """ Adds `count` reviews totalling `stars` to the groups of `row`. """
+    for model, lookup in _groups(row):
+        increment(model, lookup, rating_sum=stars, review_count=count)
+
+
+def record_save(service, previous):
+    row = current(service)
+    if previous is not None:
+        if cents(previous['price_hour']) == cents(row['price_hour']) and all(
+                previous[name] == row[name] for name in TRACKED
+                if name != 'price_hour'):
+            return
+        _apply(previous, -1)
+        if _groups(previous) != _groups(row):
+            # the service's reviews move with it; the row was just written,
+            # so its totals cannot change under us before the commit
+            totals = Service.objects.filter(pk=service.pk).values(
+                'rating_sum', 'rating_count').first()
+            if totals['rating_count']:
+                add_reviews(previous, -totals['rating_sum'], -totals['rating_count'])
+                add_reviews(row, totals['rating_sum'], totals['rating_count'])
+    _apply(row, +1)
+
+
+def record_delete(service):
+    # the row is gone by now; take the values it was loaded with. Its
+    # reviews were deleted before it and took their stars with them
+    _apply({name: service.loaded_value(name) for name in TRACKED}, -1)
+
+
+def record_bulk_create(services):
+    """ Adds services inserted with bulk_create, which sends no signals. """
+    totals = {}
+    for service in services:
+        for model, lookup in ((FieldStats, ('field_id', service.field_id)),
+                              (CompanyStats, ('company_id', service.company_id))):
+            total = totals.setdefault((model, lookup), [0, 0])
+            total[0] += 1
+            total[1] += cents(service.price_hour)
+    with transaction.atomic():
+        for (model, (name, value)), (count, price) in totals.items():
+            increment(model, {name: value}, service_count=count, price_cents_sum=price)
+
+
+def compute(group_by):
+    """ Recomputes the totals of every group straight from Service. """
+    rows = Service.objects.values(group_by).annotate(
+        service_count=Count('id'), price_sum=Sum('price_hour'),
+        rating_sum=Sum('rating_sum'), review_count=Sum('rating_count')).order_by()
+    return {
+        row[group_by]: (row['service_count'], cents(row['price_sum']),
+                        row['rating_sum'], row['review_count'])
+        for row in rows
+    }
+
+
+def stored(model, key):
+    return {
+        row[0]: tuple(row[1:])
+        for row in model.objects.values_list(
+            key, 'service_count', 'price_cents_sum', 'rating_sum', 'review_count')
+    }
+
+
+def drift(model, key, group_by):
+    """ Groups whose stored totals differ from the recomputed ones. """
+    expected = compute(group_by)
+    actual = stored(model, key)
+    empty = (0, 0, 0, 0)
+    return {
+        group: (actual.get(group, empty), expected.get(group, empty))
+        for group in set(expected) | set(actual)
+        if actual.get(group, empty) != expected.get(group, empty)
+    }
+
+
+@transaction.atomic
+def rebuild():
+    """ Replaces both tables with totals recomputed from Service. """
+    for model, key, group_by in ((FieldStats, 'field_id', 'field_id'),
+                                 (CompanyStats, 'company_id', 'company_id')):
+        model.objects.all().delete()
+        model.objects.bulk_create(
+            model(service_count=count, price_cents_sum=price, rating_sum=rating,
+                  review_count=reviews, **{key: group})
+            for group, (count, price, rating, reviews) in compute(group_by).items())
@@ -0,0 +1,45 @@
+from django.core.mail import send_mail
+
+from main.tasks import task
+from . import availability, categories, search, similar, stats
+from .cache import NAVBAR, bump
+from .models import ServiceRequest
+
+
+@task
+def notify_company(request_id):
+    request = ServiceRequest.objects.select_related(
+        'service__company__user', 'customer__user').filter(pk=request_id).first()
+    if request is None:
+        return
+    service = request.service
+    send_mail(
+        f"New request for {service.name}",
+        f"{request.customer.user.username} requested {service.name} for "
+        f"{request.service_time} hour{'s' if request.service_time != 1 else ''} "
+        f"at {request.address}, for {request.price}€.\n",
+        None, [service.company.user.email])
+
+
+@task
+def rebuild_stats():
+    stats.rebuild()
+    bump('catalogue', NAVBAR, *categories.scopes())
+
+
+@task
+def rebuild_search_index():
+    if search.is_available():
+        search.rebuild()
+
+
+@task
+def refresh_similar_services():
+    # without NumPy the lists wait for a build where it is installed
+    if similar.is_available():
+        similar.refresh()
+
+
+@task
+def refresh_free_slots():
+    availability.refresh()
@@ -1,3 +1,962 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Q
+from django.http import Http404
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.utils.http import http_date
+
+from main.models import Task
+from users.models import User, Company, Customer
+from . import (
+    availability, categories, export, facets, onboarding, reviews, rollups, search, similar,
+    stats)
+from . import cache as catalogue_cache
+from .booking import IdempotencyConflict, book
+from .forms import FilterForm
+from .pagination import encode_cursor, paginate
+from .tasks import notify_company
+from .models import (
+    Category, Service, Review, FieldStats, CompanyStats, ServiceTerm, SimilarService,
+    StaleSimilarService, TermFrequency, FieldActivity, AvailabilityWindow,
+    ServiceRequest)
+
+
+def make_company(name='acme', field='Plumbing'):
+    user = User.objects.create_user(
+        username=name, email=name + '@example.com', password='secret',
+        is_company=True)
+    return Company.objects.create(user=user, field=categories.by_name(field))
+
+
+def make_customer(name):
+    user = User.objects.create_user(
+        username=name, email=name + '@example.com', password='secret',
+        is_customer=True)
+    return Customer.objects.create(user=user, birth='1990-01-01')
+
+
+def make_service(company, name='Leak repair', description='Fixes leaks'):
+    return Service.objects.create(company=company, name=name,
+                                  description=description, price_hour=20,
+                                  field=company.field)
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        company = make_company()
+        for n in range(5):
+            make_service(company, 'Repair %d' % n)
+        # ties on the date are broken by the id
+        Service.objects.filter(name__in=['Repair 1', 'Repair 2', 'Repair 3']).update(
+            date=timezone.now())
+        self.expected = list(Service.objects.order_by('-date', '-id').values_list('pk', flat=True))
+
+    def page(self, query):
+        return paginate(RequestFactory().get('/services/' + query), Service.objects.all())
+
+    def test_next_and_previous_links_walk_every_row_once(self):
+        page, seen = self.page('?size=2'), []
+        pages = [page]
+        while True:
+            seen += [service.pk for service in page]
+            if not page.has_next:
+                break
+            page = self.page(page.next_url)
+            pages.append(page)
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(len(pages), 3)
+
+        back = self.page(pages[-1].previous_url)
+        self.assertEqual([service.pk for service in back], self.expected[2:4])
+        self.assertTrue(back.has_next)
+        first = self.page(back.previous_url)
+        self.assertEqual([service.pk for service in first], self.expected[:2])
+        self.assertFalse(first.has_previous)
+
+    def test_invalid_cursors_are_not_found(self):
+        for cursor in ('nonsense', encode_cursor(['1']), encode_cursor(['soon', '1'])):
+            with self.assertRaises(Http404):
+                self.page('?after=' + cursor)
+        self.assertEqual(self.client.get('/services/?before=nonsense').status_code, 404)
+
+    def test_explain_catalogue_reads_the_listing_indexes_and_rolls_back(self):
+        output = io.StringIO()
+        call_command('explain_catalogue', services=200, companies=20, repeat=1, stdout=output)
+        report = output.getvalue()
+        with_indexes = report.split('With listing indexes')[1]
+        for index in ('service_date_idx', 'service_field_date_idx', 'service_company_date_idx'):
+            self.assertIn(index, with_indexes)
+        self.assertIn('Rolled back the seeded rows.', report)
+        self.assertEqual(Service.objects.count(), 5)
+        self.assertFalse(User.objects.filter(username__startswith='explain').exists())
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, Service._meta.db_table)
+        self.assertTrue({index.name for index in Service._meta.indexes} <= set(constraints))
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        company = make_company()
+        self.boiler = make_service(company, 'Boiler service', 'Stops leaks in old boilers')
+        self.leak = make_service(company, 'Leak repair', 'Pipes and taps')
+        self.paint = make_service(make_company('brush', 'Painting'), 'Wall painting', 'Any colour')
+
+    @unittest.skipUnless(search.is_available(), "needs SQLite FTS5")
+    def test_matches_in_the_name_rank_first(self):
+        self.assertEqual(search.search_ids('leak', 10), [self.leak.pk, self.boiler.pk])
+        self.assertEqual(search.search_ids('boil', 10), [self.boiler.pk])
+        self.assertEqual(search.search_ids('acme pipes', 10), [self.leak.pk])
+        self.assertEqual(search.search_ids('"*) OR', 10), [])
+
+        self.paint.name = 'Leak sealing'
+        self.paint.save()
+        self.leak.delete()
+        self.assertEqual(search.search_ids('leak', 10), [self.paint.pk, self.boiler.pk])
+
+    @unittest.skipUnless(search.is_available(), "needs SQLite FTS5")
+    def test_only_the_newest_matches_are_ranked(self):
+        drip = make_service(make_company('drip'), 'Taps', 'Fixes a slow leak')
+        with mock.patch.object(search, 'CANDIDATES', 2):
+            self.assertEqual(search.search_ids('leak', 10), [self.leak.pk, drip.pk])
+            self.assertEqual(search.search_ids('leak', 10, offset=1), [drip.pk])
+        self.assertEqual(search.search_ids('leak', 10),
+                         [self.leak.pk, drip.pk, self.boiler.pk])
+
+        output = io.StringIO()
+        call_command('bench_search', services=300, companies=10, searches=2, stdout=output)
+        self.assertIn('common bounded', output.getvalue())
+        self.assertIn('Rolled back the seeded rows.', output.getvalue())
+        self.assertEqual(Service.objects.count(), 4)
+
+    def test_falls_back_to_icontains_newest_first(self):
+        with mock.patch.object(search, 'is_available', return_value=False):
+            self.assertEqual(search.search_ids('leak', 10), [self.leak.pk, self.boiler.pk])
+            self.assertEqual(search.search_ids('brush wall', 10), [self.paint.pk])
+            self.assertEqual(search.search_ids('leak', 1, offset=1), [self.boiler.pk])
+            response = self.client.get('/services/search', {'q': 'pipes'})
+        self.assertContains(response, 'Leak repair')
+        self.assertNotContains(response, 'Boiler service')
+
+
+class CatalogueCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.plumber = make_company()
+        self.service = make_service(self.plumber)
+        make_service(make_company('brush', 'Painting'), 'Wall painting')
+
+    def x_cache(self, path):
+        return self.client.get(path).get('X-Cache')
+
+    def test_writes_invalidate_only_the_pages_they_touch(self):
+        pages = ['/services/', '/services/plumbing/', '/services/painting/',
+                 '/company/acme', '/company/brush', '/services/%d' % self.service.pk]
+        self.assertEqual([self.x_cache(path) for path in pages], ['MISS'] * 6)
+        self.assertEqual([self.x_cache(path) for path in pages], ['HIT'] * 6)
+
+        self.service.price_hour = 25
+        self.service.save()
+        self.assertEqual([self.x_cache(path) for path in pages],
+                         ['MISS', 'MISS', 'HIT', 'MISS', 'HIT', 'MISS'])
+
+        self.plumber.user.username = 'acme-plumbing'
+        self.plumber.user.save()
+        self.assertEqual(self.x_cache('/company/acme-plumbing'), 'MISS')
+        self.assertEqual(self.x_cache('/services/painting/'), 'HIT')
+
+    def test_only_anonymous_pages_are_shared(self):
+        self.client.force_login(self.plumber.user)
+        self.assertIsNone(self.x_cache('/services/'))
+        self.assertIsNone(self.x_cache('/services/'))
+
+    def test_cards_are_rendered_once_per_service_version(self):
+        before = catalogue_cache.counters()
+        services = list(Service.objects.for_listing())
+        first = catalogue_cache.render_cards(services)
+        self.assertEqual(catalogue_cache.render_cards(services), first)
+        after = catalogue_cache.counters()
+        self.assertEqual(after.get('card_misses', 0) - before.get('card_misses', 0), 2)
+        self.assertEqual(after.get('card_hits', 0) - before.get('card_hits', 0), 2)
+
+        self.service.name = 'Leak fixing'
+        self.service.save()
+        cards = catalogue_cache.render_cards(Service.objects.for_listing())
+        self.assertEqual(sum('Leak fixing' in card for card in cards), 1)
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        plumber, painter = make_company(), make_company('brush', 'Painting')
+        self.services = [make_service(plumber, 'Repair %d' % n) for n in range(4)]
+        self.services.append(make_service(painter, 'Wall painting'))
+        self.day = timezone.make_aware(datetime(2024, 5, 1))
+        # two services on the same date, tied on it across a chunk boundary
+        for n, service in enumerate(self.services):
+            Service.objects.filter(pk=service.pk).update(
+                date=self.day + timedelta(days=min(n, 3)))
+
+    def ids(self, rows):
+        return [row[0] for row in rows]
+
+    def test_chunks_export_every_row_once_oldest_first(self):
+        chunks = list(export.chunks(Service.objects.all(), chunk_size=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertEqual(self.ids(row for chunk in chunks for row in chunk),
+                         [service.pk for service in self.services])
+
+    def test_formats_and_filters(self):
+        response = self.client.get('/services/export', {
+            'field': 'plumbing', 'since': '2024-05-02', 'until': '2024-05-04'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['id'] for row in rows], [service.pk for service in self.services[1:3]])
+        self.assertEqual((rows[0]['field'], rows[0]['company'], rows[0]['company_field']),
+                         ('Plumbing', 'acme', 'Plumbing'))
+
+        response = self.client.get('/services/export', {'format': 'csv', 'field': 'painting'})
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0], [name for name, _ in export.COLUMNS])
+        self.assertEqual(rows[1][1:3], ['Wall painting', 'Fixes leaks'])
+        self.assertEqual(len(rows), 2)
+
+        self.assertEqual(self.client.get('/services/export', {'format': 'xml'}).status_code, 400)
+
+    def test_command_writes_the_same_rows(self):
+        with tempfile.NamedTemporaryFile('r', suffix='.csv') as output:
+            call_command('export_services', format='csv', since='2024-05-04',
+                         output=output.name, stderr=io.StringIO())
+            rows = list(csv.reader(output))
+        self.assertEqual([int(row[0]) for row in rows[1:]],
+                         [service.pk for service in self.services[3:]])
+
+
+class FacetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        plumber, painter = make_company(), make_company('brush', 'Painting')
+        for company, prices in ((plumber, (10, 30, 60, 150)), (painter, (40, 45, 250))):
+            for price in prices:
+                Service.objects.create(company=company, name='Job %d' % price,
+                                       description='Work', price_hour=price,
+                                       field=company.field)
+        make_company('volt', 'Electricity')
+
+    def check(self, query):
+        request = RequestFactory().get('/services/', query)
+        filters = FilterForm(request.GET).filters()
+        conditions = facets.conditions(filters)
+        listed = facets.filtered(Service.objects.all(), conditions)
+        with self.assertNumQueries(1):
+            counts = facets.facets(request, filters, conditions)
+
+        # a field's count is what the listing would show with that field
+        # ticked alone and every other filter kept
+        for field in counts['fields']:
+            self.assertEqual(field['count'], facets.filtered(
+                Service.objects.all(), dict(conditions, field=Q(field__slug=field['slug']))).count(),
+                field['slug'])
+            if field['selected']:
+                self.assertEqual(field['count'], listed.filter(field__slug=field['slug']).count())
+        for bucket in counts['prices']:
+            if bucket['selected']:
+                self.assertEqual(bucket['count'], listed.count())
+        return counts, listed
+
+    def test_counts_match_the_filtered_listing(self):
+        counts, listed = self.check({'field': ['plumbing', 'painting'],
+                                     'min_price': 25, 'max_price': 50})
+        self.assertEqual(sorted(listed.values_list('price_hour', flat=True)), [30, 40, 45])
+        by_slug = {field['slug']: field['count'] for field in counts['fields']}
+        self.assertEqual((by_slug['plumbing'], by_slug['painting'], by_slug['electricity']),
+                         (1, 2, 0))
+        self.assertEqual([bucket['count'] for bucket in counts['prices']], [1, 3, 1, 1, 1])
+
+        self.check({'field': ['painting'], 'company': 'brush'})
+        self.check({'min_rating': 4})
+
+        response = self.client.get('/services/', {'field': 'plumbing', 'min_price': 25,
+                                                  'max_price': 50})
+        self.assertEqual([service.price_hour for service in response.context['services']], [30])
+
+    def test_the_max_price_is_included(self):
+        Service.objects.create(company=Company.objects.get(user__username='acme'),
+                               name='Job 50', description='Work', price_hour=50,
+                               field=categories.by_name('Plumbing'))
+        _, listed = self.check({'field': ['plumbing'], 'max_price': 50})
+        self.assertEqual(sorted(listed.values_list('price_hour', flat=True)), [10, 30, 50])
+
+        # the buckets stop below their end, as their links say
+        counts, listed = self.check({'field': ['plumbing'], 'min_price': 25,
+                                     'max_price': '49.99'})
+        self.assertEqual(sorted(listed.values_list('price_hour', flat=True)), [30])
+        self.assertTrue(counts['prices'][1]['selected'])
+        self.assertIn('max_price=49.99', counts['prices'][1]['url'])
+        self.assertEqual(counts['prices'][2]['count'], 2)
+
+    def test_counts_are_cached_until_a_write(self):
+        query = {'field': ['plumbing'], 'min_price': 25}
+        counts, _ = self.check(query)
+        request = RequestFactory().get('/services/', query)
+        filters = FilterForm(request.GET).filters()
+        with self.assertNumQueries(0):
+            self.assertEqual(facets.facets(request, filters, facets.conditions(filters)), counts)
+
+        Service.objects.create(company=Company.objects.get(user__username='acme'),
+                               name='Job 35', description='Work', price_hour=35,
+                               field=categories.by_name('Plumbing'))
+        counts, _ = self.check(query)
+        self.assertEqual(counts['prices'][1]['count'], 2)
+
+
+class NavbarCountTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.company = make_company()
+
+    def test_cached_pages_show_the_current_counts(self):
+        painting = '/services/painting/'
+        self.assertEqual(self.client.get(painting)['X-Cache'], 'MISS')
+        self.assertContains(self.client.get(painting), 'Plumbing (0)')
+
+        service = make_service(self.company)
+        response = self.client.get(painting)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertContains(response, 'Plumbing (1)')
+
+        # an edit leaves the counts, and so the other fields' pages, alone
+        service.name = 'Leak fixing'
+        service.save()
+        self.assertEqual(self.client.get(painting)['X-Cache'], 'HIT')
+
+        service.delete()
+        self.assertContains(self.client.get(painting), 'Plumbing (0)')
+
+
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.service = make_service(make_company())
+
+    def test_revalidating_skips_the_listing_query(self):
+        etag = self.client.get('/services/')['ETag']
+        # the newest date and the count; neither the listing nor the cache
+        with self.assertNumQueries(2):
+            response = self.client.get('/services/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        etag = self.client.get('/company/acme')['ETag']
+        with self.assertNumQueries(2):
+            response = self.client.get('/company/acme', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_validators_change_with_a_write(self):
+        response = self.client.get('/services/%d' % self.service.pk)
+        etag = response['ETag']
+        self.service.name = 'Leak fixing'
+        self.service.save()
+        response = self.client.get('/services/%d' % self.service.pk, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertContains(response, 'Leak fixing')
+
+
+    def revalidate(self, path, change):
+        first = self.client.get(path)
+        self.assertNotIn('Last-Modified', first)
+        change()
+        for headers in ({'HTTP_IF_NONE_MATCH': first['ETag']},
+                        {'HTTP_IF_MODIFIED_SINCE': http_date()}):
+            response = self.client.get(path, **headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], first['ETag'])
+        return response
+
+    def test_a_review_changes_the_service_page(self):
+        response = self.revalidate('/services/%d' % self.service.pk, lambda: reviews.review(
+            make_customer('alice'), self.service, 4))
+        self.assertContains(response, 'Rated 4.0/5 from 1 review')
+
+    def test_deleting_an_older_service_changes_the_listing(self):
+        older = make_service(self.service.company, 'Boiler repair')
+        Service.objects.filter(pk=older.pk).update(date=self.service.date - timedelta(days=1))
+        response = self.revalidate('/services/', older.delete)
+        self.assertNotContains(response, 'Boiler repair')
+
+
+class ReviewTotalsTests(TestCase):
+
+    def setUp(self):
+        self.company = make_company()
+        self.service = make_service(self.company)
+
+    def assertTotals(self, stars, count, rating):
+        self.service.refresh_from_db()
+        self.company.refresh_from_db()
+        for row in (self.service, self.company):
+            self.assertEqual((row.rating_sum, row.rating_count, row.rating),
+                             (stars, count, rating))
+        for model in (FieldStats, CompanyStats):
+            totals = model.objects.values_list('rating_sum', 'review_count').get()
+            self.assertEqual(totals, (stars, count))
+
+    def test_writing_editing_and_deleting_reviews(self):
+        alice, bob = make_customer('alice'), make_customer('bob')
+        reviews.review(alice, self.service, 5)
+        reviews.review(bob, self.service, 2)
+        self.assertTotals(7, 2, 4)
+
+        _, created = reviews.review(bob, self.service, 4)
+        self.assertFalse(created)
+        self.assertTotals(9, 2, 5)
+
+        Review.objects.get(customer=alice).delete()
+        self.assertTotals(4, 1, 4)
+        bob.user.delete()
+        self.assertTotals(0, 0, 0)
+
+    def test_saving_a_loaded_service_keeps_reviews_written_since(self):
+        loaded = Service.objects.get(pk=self.service.pk)
+        reviews.review(make_customer('alice'), self.service, 3)
+        loaded.name = 'Leak and drain repair'
+        loaded.save()
+        self.assertTotals(3, 1, 3)
+
+    def test_reviews_move_with_their_service(self):
+        reviews.review(make_customer('alice'), self.service, 4)
+        other = make_company('bolt', 'Locks')
+        self.service.company = other
+        self.service.field = other.field
+        self.service.save()
+        self.assertEqual(stats.drift(FieldStats, 'field_id', 'field_id'), {})
+        self.assertEqual(stats.drift(CompanyStats, 'company_id', 'company_id'), {})
+        self.assertEqual(FieldStats.objects.get(field__slug='locks').review_count, 1)
+
+    def test_reconcile_repairs_drift(self):
+        reviews.review(make_customer('alice'), self.service, 4)
+        Service.objects.filter(pk=self.service.pk).update(rating_sum=40, rating=0)
+        self.assertEqual(len(list(reviews.drift(Service))), 1)
+        self.assertEqual(reviews.reconcile(Service), 1)
+        self.assertEqual(list(reviews.drift(Service)), [])
+        self.assertEqual(list(reviews.drift(Company)), [])
+
+    def test_rebuild_stats_reports_and_repairs_drift(self):
+        reviews.review(make_customer('alice'), self.service, 4)
+        FieldStats.objects.update(service_count=7)
+        CompanyStats.objects.all().delete()
+
+        output = io.StringIO()
+        with self.assertRaises(SystemExit) as exit:
+            call_command('rebuild_stats', check=True, stdout=output)
+        self.assertEqual(exit.exception.code, 1)
+        self.assertIn('FieldStats: 1 drifted rows', output.getvalue())
+        self.assertIn('CompanyStats: 1 drifted rows', output.getvalue())
+
+        call_command('rebuild_stats', stdout=io.StringIO())
+        self.assertTotals(4, 1, 4)
+        self.assertEqual(FieldStats.objects.get().service_count, 1)
+        output = io.StringIO()
+        call_command('rebuild_stats', check=True, stdout=output)
+        self.assertIn('FieldStats: 0 drifted rows', output.getvalue())
+        self.assertIn('CompanyStats: 0 drifted rows', output.getvalue())
+
+
+class ConcurrentReviewTests(TransactionTestCase):
+    # the flush after each test empties the categories the migrations made
+    fixtures = ['categories']
+
+    def test_parallel_reviews_lose_no_updates(self):
+        company = make_company()
+        services = [make_service(company, 'Service %d' % n) for n in range(2)]
+        customers = [make_customer('customer%d' % n) for n in range(8)]
+        barrier = threading.Barrier(len(customers))
+        errors = []
+
+        def write(n, customer):
+            try:
+                barrier.wait()
+                for round in range(3):
+                    for service in services:
+                        # a first review, then two edits of it
+                        reviews.review(customer, service, (n + round) % 5 + 1)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=write, args=(n, customer))
+                   for n, customer in enumerate(customers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        expected = sum((n + 2) % 5 + 1 for n in range(len(customers)))
+        for service in services:
+            service.refresh_from_db()
+            self.assertEqual((service.rating_sum, service.rating_count),
+                             (expected, len(customers)))
+        company.refresh_from_db()
+        self.assertEqual((company.rating_sum, company.rating_count),
+                         (2 * expected, 2 * len(customers)))
+        self.assertEqual(list(reviews.drift(Service)), [])
+        self.assertEqual(list(reviews.drift(Company)), [])
+        self.assertEqual(stats.drift(FieldStats, 'field_id', 'field_id'), {})
+
+
+@unittest.skipUnless(similar.is_available(), "needs NumPy")
+class SimilarServiceTests(TestCase):
+
+    def setUp(self):
+        acme, bolt, coil = make_company('acme'), make_company('bolt'), make_company('coil')
+        self.leak = make_service(acme, 'Leak repair', 'pipe leak fixed fast')
+        self.own = make_service(acme, 'Pipe leak fix', 'pipe leak fixed')
+        self.pipe = make_service(bolt, 'Pipe leak repair', 'leak in a pipe fixed')
+        self.boiler = make_service(bolt, 'Boiler service', 'boiler checked yearly')
+        self.other = make_service(coil, 'Boiler repair', 'boiler fixed')
+
+    def similar_to(self, service):
+        return list(service.similar.order_by('rank').values_list('similar_id', flat=True))
+
+    def test_build_lists_alike_services_of_other_companies(self):
+        with mock.patch.object(similar, 'bump') as bump:
+            similar.build()
+        # one version for every list, not one per service
+        bump.assert_called_once_with('similar')
+        self.assertEqual(self.similar_to(self.leak)[0], self.pipe.pk)
+        self.assertNotIn(self.own.pk, self.similar_to(self.leak))
+        self.assertEqual(self.similar_to(self.boiler)[0], self.other.pk)
+        self.assertFalse(StaleSimilarService.objects.exists())
+
+    def test_refresh_recomputes_after_changes(self):
+        similar.build()
+        self.other.name = 'Pipe leak repair'
+        self.other.description = 'pipe leak fixed'
+        self.other.save()
+        self.assertTrue(StaleSimilarService.objects.filter(service_id=self.other.pk).exists())
+        refreshed = similar.refresh()
+        self.assertIn(self.leak.pk, refreshed)
+        self.assertIn(self.other.pk, self.similar_to(self.leak))
+        self.assertFalse(StaleSimilarService.objects.exists())
+
+        # a deleted service leaves the lists it was in due a refresh
+        self.pipe.delete()
+        self.assertTrue(StaleSimilarService.objects.filter(service_id=self.leak.pk).exists())
+        similar.refresh()
+        self.assertNotIn(self.pipe.pk, SimilarService.objects.values_list('similar_id', flat=True))
+
+    def frequencies(self):
+        return dict(TermFrequency.objects.filter(services__gt=0).values_list('term', 'services'))
+
+    def test_saves_keep_the_term_index_a_build_would_store(self):
+        self.assertEqual(self.frequencies()['pipe'], 3)
+        self.boiler.description = 'boiler and pipe checked yearly'
+        self.boiler.save()
+        self.pipe.delete()
+        self.assertEqual(self.frequencies()['pipe'], 3)
+        self.assertFalse(ServiceTerm.objects.filter(service_id=self.pipe.pk).exists())
+        weights = ServiceTerm.objects.filter(service=self.boiler).values_list('weight', flat=True)
+        self.assertAlmostEqual(sum(weight * weight for weight in weights), 1, places=5)
+
+        saved = self.frequencies()
+        similar.build()
+        self.assertEqual(self.frequencies(), saved)
+
+    def test_refresh_compares_only_the_changed_vectors(self):
+        similar.build()
+        self.other.name = 'Pipe leak repair'
+        self.other.description = 'pipe leak fixed'
+        self.other.save()
+        # the rest of the catalogue is not vectorized again
+        with mock.patch.object(similar, 'vectorize', side_effect=AssertionError):
+            refreshed = similar.refresh()
+        self.assertEqual(refreshed, {self.other.pk, self.leak.pk, self.own.pk,
+                                     self.pipe.pk, self.boiler.pk})
+        self.assertEqual(self.similar_to(self.other)[0], self.pipe.pk)
+        # the boiler services have nothing in common any more
+        self.assertEqual(self.similar_to(self.boiler), [])
+
+
+class BookingTests(TestCase):
+
+    def setUp(self):
+        self.service = make_service(make_company())
+        self.customer = make_customer('alice')
+        self.key = uuid.uuid4()
+
+    def test_submitting_a_key_again_returns_the_first_booking(self):
+        first, created = book(self.customer, self.service, 'Main street 1', 2, self.key)
+        self.assertTrue(created)
+        again, created = book(self.customer, self.service, 'Main street 1', 2, self.key)
+        self.assertEqual((again.pk, created), (first.pk, False))
+        self.assertEqual(ServiceRequest.objects.count(), 1)
+        self.assertEqual(Task.objects.filter(name=notify_company.task_name).count(), 1)
+
+    def test_a_key_reused_for_another_booking_conflicts(self):
+        book(self.customer, self.service, 'Main street 1', 2, self.key)
+        for customer, service, address, hours in (
+                (make_customer('bob'), self.service, 'Main street 1', 2),
+                (self.customer, make_service(self.service.company, 'Boiler repair'),
+                 'Main street 1', 2),
+                (self.customer, self.service, 'Main street 2', 2),
+                (self.customer, self.service, 'Main street 1', 3)):
+            with self.assertRaises(IdempotencyConflict):
+                book(customer, service, address, hours, self.key)
+        self.assertEqual(ServiceRequest.objects.count(), 1)
+
+    def test_the_form_books_once_and_shows_conflicts(self):
+        self.client.force_login(self.customer.user)
+        path = '/services/%d/request_service/' % self.service.pk
+        data = {'address': 'Main street 1', 'service_time': 2, 'idempotency_key': self.key}
+        for _ in range(2):
+            self.assertRedirects(self.client.post(path, data), '/services/%d' % self.service.pk,
+                                 fetch_redirect_response=False)
+        self.assertEqual(ServiceRequest.objects.count(), 1)
+
+        response = self.client.post(path, dict(data, address='Main street 2'))
+        self.assertContains(response, "This form was already used for another request")
+        self.assertEqual(ServiceRequest.objects.count(), 1)
+
+
+def rollup_snapshot():
+    return {model: set(model.objects.values_list(key, 'resolution', 'period', *rollups.COUNTERS))
+            for model, key in rollups.GROUPS}
+
+
+class RollupTests(TestCase):
+
+    def test_counted_activity_matches_a_backfill(self):
+        company = make_company()
+        customer = make_customer('alice')
+        first = make_service(company)
+        make_service(company, 'Boiler repair')
+        book(customer, first, 'Main street 1', 3, uuid.uuid4())
+        book(customer, first, 'Main street 2', 2, uuid.uuid4())
+
+        counted = rollup_snapshot()
+        self.assertEqual(rollups.backfill(), 4)
+        self.assertEqual(rollup_snapshot(), counted)
+
+        day = FieldActivity.objects.get(field__slug='plumbing', resolution=rollups.DAY)
+        self.assertEqual((day.services_published, day.requests, day.hours_booked, day.booked_cents),
+                         (2, 2, 5, 10000))
+
+        chart = rollups.chart(company.activity.all(), rollups.WEEK, 2, timezone.now())
+        self.assertEqual(chart['series']['requests'], [0, 2])
+        self.assertEqual(chart['series']['booked'], [0, 100.0])
+
+    def test_deletions_are_counted_out_as_a_backfill_would(self):
+        company = make_company()
+        customer, other = make_customer('alice'), make_customer('bob')
+        first, second = make_service(company), make_service(company, 'Boiler repair')
+        book(customer, first, 'Main street 1', 3, uuid.uuid4())
+        request, _ = book(customer, first, 'Main street 2', 2, uuid.uuid4())
+        book(customer, second, 'Main street 3', 1, uuid.uuid4())
+        book(other, second, 'Main street 4', 4, uuid.uuid4())
+
+        request.delete()
+        second.delete()
+        other.user.delete()
+        counted = rollup_snapshot()
+        rollups.backfill()
+        self.assertEqual(rollup_snapshot(), counted)
+
+        day = FieldActivity.objects.get(field__slug='plumbing', resolution=rollups.DAY)
+        self.assertEqual((day.services_published, day.requests, day.hours_booked, day.booked_cents),
+                         (1, 1, 3, 6000))
+
+    def test_only_the_company_reads_its_activity(self):
+        company = make_company()
+        book(make_customer('alice'), make_service(company), 'Main street 1', 3, uuid.uuid4())
+        path = '/company/acme/activity?resolution=hour&periods=2'
+
+        self.assertEqual(self.client.get(path).status_code, 404)
+        self.client.force_login(make_company('rival').user)
+        self.assertEqual(self.client.get(path).status_code, 404)
+        self.client.force_login(company.user)
+        self.assertEqual(self.client.get(path).json()['series']['booked'], [0, 60.0])
+
+        series = self.client.get('/services/plumbing/activity').json()['series']
+        self.assertEqual(series['requests'][-1], 1)
+        self.assertNotIn('booked', series)
+
+
+class AvailabilityTests(TestCase):
+
+    def setUp(self):
+        self.day = timezone.localdate() + timedelta(days=2)
+        self.nine = timezone.make_aware(datetime.combine(self.day, time(9)))
+        self.hour = timedelta(hours=1)
+
+    def open(self, company, start=9, end=12):
+        AvailabilityWindow.objects.create(
+            company=company, date=self.day, start=time(start), end=time(end))
+
+    def test_search_finds_companies_free_in_the_field(self):
+        plumber, painter = make_company(), make_company('brush', 'Painting')
+        handyman = make_company('handy', None)
+        handyman.is_all_in_one = True
+        handyman.save()
+        plumbing = categories.by_name('Plumbing')
+        for company in (plumber, painter):
+            make_service(company)
+        Service.objects.create(company=handyman, name='Pipes', description='Any pipe',
+                               price_hour=30, field=plumbing)
+        self.open(plumber, 10, 12)
+        self.open(painter)
+        self.open(handyman, 9, 10)
+
+        self.assertEqual(availability.search(plumbing, self.nine, self.nine + 3 * self.hour),
+                         [(handyman.pk, self.nine), (plumber.pk, self.nine + self.hour)])
+        self.assertEqual(availability.search(plumbing, self.nine + 3 * self.hour,
+                                             self.nine + 6 * self.hour), [])
+
+    def test_search_skips_companies_without_a_service_in_the_field(self):
+        handyman = make_company('handy', None)
+        handyman.is_all_in_one = True
+        handyman.save()
+        Service.objects.create(company=handyman, name='Walls', description='Any wall',
+                               price_hour=30, field=categories.by_name('Painting'))
+        self.open(handyman)
+
+        until = self.nine + 3 * self.hour
+        self.assertEqual(availability.search(categories.by_name('Plumbing'), self.nine, until),
+                         [])
+        self.assertEqual(availability.search(categories.by_name('Painting'), self.nine, until),
+                         [(handyman.pk, self.nine)])
+
+    def test_booked_hours_stay_taken(self):
+        company = make_company()
+        self.open(company)
+        service, customer = make_service(company), make_customer('alice')
+        book(customer, service, 'Main street 1', 2, uuid.uuid4(), start=self.nine)
+        with self.assertRaises(availability.SlotTaken):
+            book(customer, service, 'Main street 2', 2, uuid.uuid4(),
+                 start=self.nine + self.hour)
+        self.assertEqual(ServiceRequest.objects.count(), 1)
+        self.assertEqual(availability.free_hours(company), [self.nine + 2 * self.hour])
+        availability.refresh([company.pk])
+        self.assertEqual(availability.free_hours(company), [self.nine + 2 * self.hour])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class OnboardingTests(TestCase):
+    password = 'Tr1cky-passw0rd'
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name + '/partners.csv'
+        self.pool = ThreadPoolExecutor(1)
+        self.addCleanup(self.pool.shutdown)
+
+    def write_csv(self, rows):
+        with open(self.path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(onboarding.COLUMNS)
+            for username, email, field, name, price, service_field in rows:
+                writer.writerow([username, email, self.password, field, name,
+                                 name and name + ' done well', price, service_field])
+
+    def run_import(self, after=0, batch_size=500):
+        return list(onboarding.Importer(self.path, self.pool, batch_size=batch_size).run(after))
+
+    def companies(self):
+        return list(Company.objects.order_by('user__username').values_list(
+            'user__username', flat=True))
+
+    def test_rejected_rows_are_reported_and_the_rest_imported(self):
+        make_company('acme')
+        self.write_csv([
+            ('pipeco', 'pipe@example.com', 'Plumbing', 'Leak repair', '30', ''),
+            ('pipeco', 'pipe@example.com', 'Plumbing', 'Cheap fix', 'abc', ''),
+            ('badco', 'not-an-email', 'Plumbing', 'Tap fitting', '20', ''),
+            ('badco', 'not-an-email', 'Plumbing', 'Tap swap', '20', ''),
+            # the same email as a company earlier in the batch
+            ('dupeco', 'PIPE@example.com', 'Plumbing', 'Drain cleaning', '25', ''),
+            ('acme', 'other@example.com', 'Plumbing', 'Boiler repair', '40', ''),
+            ('allco', 'all@example.com', 'All in One', 'Wall painting', '35', 'Painting'),
+        ])
+        [batch] = self.run_import()
+        self.assertEqual((batch.rows, batch.companies, batch.services), (7, 2, 2))
+        self.assertEqual([number for number, _ in batch.errors], [2, 3, 4, 5, 6])
+        errors = dict(batch.errors)
+        self.assertIn('price_hour', errors[2])
+        self.assertIn('email', errors[3])
+        self.assertEqual(errors[4], "company of row 3 was rejected")
+        self.assertEqual(errors[5], "email: This email is already registered.")
+        self.assertEqual(errors[6], "username: A user with that username already exists.")
+
+        self.assertEqual(self.companies(), ['acme', 'allco', 'pipeco'])
+        allco = Company.objects.get(user__username='allco')
+        self.assertTrue(allco.is_all_in_one)
+        self.assertEqual(Service.objects.get(company=allco).field.slug, 'painting')
+        self.assertTrue(User.objects.get(username='pipeco').check_password(self.password))
+
+    def test_bulk_inserts_keep_the_derived_tables(self):
+        self.write_csv([
+            ('pipeco', 'pipe@example.com', 'Plumbing', 'Leak repair', '30', ''),
+            ('pipeco', 'pipe@example.com', 'Plumbing', 'Boiler service', '45', ''),
+            ('brushco', 'brush@example.com', 'Painting', 'Wall painting', '35', ''),
+        ])
+        self.run_import()
+        created = set(Service.objects.values_list('id', flat=True))
+        self.assertEqual(len(created), 3)
+
+        self.assertEqual(stats.drift(FieldStats, 'field_id', 'field_id'), {})
+        self.assertEqual(stats.drift(CompanyStats, 'company_id', 'company_id'), {})
+        self.assertEqual(FieldStats.objects.get(field__slug='plumbing').service_count, 2)
+        counted = rollup_snapshot()
+        rollups.backfill()
+        self.assertEqual(rollup_snapshot(), counted)
+
+        leak = Service.objects.get(name='Leak repair')
+        if search.is_available():
+            self.assertEqual(search.search_ids('leak', 10), [leak.pk])
+        self.assertEqual(set(ServiceTerm.objects.values_list('service_id', flat=True)), created)
+        self.assertEqual(set(StaleSimilarService.objects.values_list('service_id', flat=True)),
+                         created)
+
+    def test_a_failed_batch_resumes_after_the_last_committed_one(self):
+        self.write_csv([
+            ('aco', 'a@example.com', 'Plumbing', 'Leak repair', '30', ''),
+            ('bco', 'b@example.com', 'Plumbing', 'Boiler service', '30', ''),
+            ('cco', 'c@example.com', 'Plumbing', 'Drain cleaning', '30', ''),
+        ])
+        write = onboarding.Importer.write
+
+        def fail_second(importer, accepted, hashes):
+            if accepted[0].form.cleaned_data['username'] == 'bco':
+                raise OperationalError('disk I/O error')
+            return write(importer, accepted, hashes)
+
+        with mock.patch.object(onboarding.Importer, 'write', fail_second):
+            with self.assertRaises(OperationalError):
+                self.run_import(batch_size=1)
+        self.assertEqual(self.companies(), ['aco'])
+        checkpoint = onboarding.Checkpoint(self.path + '.checkpoint')
+        self.assertEqual(checkpoint.load(), 1)
+
+        results = self.run_import(checkpoint.load(), batch_size=1)
+        self.assertEqual([batch.last_row for batch in results], [2, 3])
+        self.assertEqual(self.companies(), ['aco', 'bco', 'cco'])
+        self.assertFalse(os.path.exists(checkpoint.path))
+
+    def test_a_batch_committed_before_its_checkpoint_is_not_imported_again(self):
+        self.write_csv([
+            ('aco', 'a@example.com', 'Plumbing', 'Leak repair', '30', ''),
+            ('bco', 'b@example.com', 'Plumbing', 'Boiler service', '30', ''),
+        ])
+        save = onboarding.Checkpoint.save
+
+        def fail_after_first(checkpoint, row, pending=None):
+            if row == 1 and pending is None:
+                raise OSError('disk full')
+            return save(checkpoint, row, pending)
+
+        with mock.patch.object(onboarding.Checkpoint, 'save', fail_after_first):
+            with self.assertRaises(OSError):
+                self.run_import(batch_size=1)
+        # the pending mark names a user the batch created
+        checkpoint = onboarding.Checkpoint(self.path + '.checkpoint')
+        self.assertEqual(checkpoint.load(), 1)
+        [batch] = self.run_import(checkpoint.load(), batch_size=1)
+        self.assertEqual((batch.companies, batch.errors), (1, []))
+        self.assertEqual(self.companies(), ['aco', 'bco'])
+
+
+class CategoryMigrationTests(TransactionTestCase):
+    before = [('services', '0010_activity_rollups'), ('users', '0003_company_rating_totals')]
+    after = [('services', '0011_category'), ('users', '0004_company_category')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+        categories.clear()
+
+    def test_named_fields_become_categories_by_slug(self):
+        apps = self.migrate(self.before)
+        User, Company = apps.get_model('users', 'User'), apps.get_model('users', 'Company')
+        Service = apps.get_model('services', 'Service')
+        FieldStats = apps.get_model('services', 'FieldStats')
+        companies = {}
+        for name, field in (('acme', 'Plumbing'), ('handy', 'All in One')):
+            user = User.objects.create(username=name, email=name + '@example.com',
+                                       is_company=True)
+            companies[name] = Company.objects.create(user=user, field=field)
+        for company, field in (('acme', 'Plumbing'), ('handy', 'Home Machines')):
+            Service.objects.create(company=companies[company], name='Job', description='Work',
+                                   price_hour=10, field=field)
+        FieldStats.objects.create(field='Home Machines', service_count=1)
+
+        apps = self.migrate(self.after)
+        Company = apps.get_model('users', 'Company')
+        Service = apps.get_model('services', 'Service')
+        FieldStats = apps.get_model('services', 'FieldStats')
+        Category = apps.get_model('services', 'Category')
+        self.assertEqual(Category.objects.count(), 11)
+        self.assertEqual(
+            dict(Company.objects.values_list('user__username', 'field__slug')),
+            {'acme': 'plumbing', 'handy': None})
+        self.assertEqual(
+            sorted(Service.objects.values_list('company__user__username', 'field__slug')),
+            [('acme', 'plumbing'), ('handy', 'home-machines')])
+        self.assertEqual(FieldStats.objects.get().field.name, 'Home Machines')
+
+        # and back, to the names
+        apps = self.migrate(self.before)
+        self.assertEqual(
+            dict(apps.get_model('users', 'Company').objects.values_list('user__username', 'field')),
+            {'acme': 'Plumbing', 'handy': 'All in One'})
+        self.assertEqual(sorted(apps.get_model('services', 'Service').objects.values_list(
+            'field', flat=True)), ['Home Machines', 'Plumbing'])
+
+
+class CategoryMapTests(TestCase):
+
+    def setUp(self):
+        # the rollback of each test does not send the signals that clear the map
+        self.addCleanup(categories.clear)
+
+    def test_lookups_follow_admin_changes(self):
+        plumbing = categories.by_slug('plumbing')
+        with self.assertNumQueries(0):
+            self.assertEqual(categories.by_slug('plumbing'), plumbing)
+            self.assertEqual(categories.by_name('Plumbing'), plumbing)
+
+        plumbing.slug, plumbing.name = 'pipes', 'Pipes'
+        plumbing.save()
+        self.assertIsNone(categories.by_slug('plumbing'))
+        self.assertEqual(categories.by_slug('pipes').name, 'Pipes')
+        self.assertIn(('pipes', 'Pipes'), categories.choices())
+
+        Category.objects.create(name='Roofing', slug='roofing')
+        self.assertEqual(categories.by_slug('roofing').name, 'Roofing')
+        categories.by_slug('roofing').delete()
+        self.assertIsNone(categories.by_slug('roofing'))
@@ -4,7 +4,13 @@ from . import views as v
 urlpatterns = [
     path('', v.service_list, name='services_list'),
     path('create/', v.create, name='services_create'),
+    path('search', v.search, name='services_search'),
+    path('export', v.export, name='services_export'),
+    path('available', v.available, name='services_available'),
+    path('availability/', v.manage_availability, name='services_availability'),
     path('<int:id>', v.index, name='index'),
     path('<int:id>/request_service/', v.request_service, name='request_service'),
+    path('<int:id>/review/', v.review_service, name='review_service'),
     path('<slug:field>/', v.service_field, name='services_field'),
+    path('<slug:field>/activity', v.field_activity, name='services_field_activity'),
 ]
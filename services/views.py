@@ -1,20 +1,92 @@
-from django.shortcuts import render, redirect
-from django.http import HttpResponseRedirect,HttpResponse
+from datetime import timedelta
+
+from django.shortcuts import render, redirect, get_object_or_404
+from django.http import Http404, HttpResponseRedirect, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.db import router
 from django.contrib import messages
+from django.db.models import Sum
+from django.utils import timezone
+from main.ratelimit import ratelimit
 from users.models import Company, Customer, User
-from .models import Service
-from .forms import CreateNewService, RequestServiceForm
+from .models import AvailabilityWindow, Service, FieldStats, CompanyStats, FieldActivity
+from .forms import (
+    ActivityForm, AvailabilityWindowForm, AvailableForm, CreateNewService,
+    RequestServiceForm, ExportForm, FilterForm, ReviewForm)
+from .pagination import paginate, page_size
+from . import search as fulltext
+from . import export as catalogue_export
+from . import availability, categories, facets, rollups
+from .cache import cache_catalogue_page, conditional_page, render_cards
+from .booking import book, IdempotencyConflict
+from .reviews import review
+
+
+def category_or_404(slug):
+    category = categories.by_slug(slug)
+    if category is None:
+        raise Http404("No field %s." % slug)
+    return category
+
+
+def field_scopes(field):
+    return [categories.scope(category_or_404(field).pk)]
+
+
+# Validators for conditional_page: the newest date off the date indexes and
+# the count off the stats tables, so neither scans the services
+
+def newest(services):
+    return services.order_by('-date', '-id').values_list('date', flat=True).first()
+
+
+def list_validators():
+    total = FieldStats.objects.aggregate(total=Sum('service_count'))['total']
+    return newest(Service.objects.all()), total or 0
+
+
+def field_validators(field):
+    field = category_or_404(field)
+    count = FieldStats.objects.filter(field=field).values_list(
+        'service_count', flat=True).first()
+    return newest(Service.objects.filter(field=field)), count or 0
 
 
+def company_validators(name):
+    count = CompanyStats.objects.filter(company__user__username=name).values_list(
+        'service_count', flat=True).first()
+    return newest(Service.objects.filter(company__user__username=name)), count or 0
+
+
+@conditional_page(lambda: ['catalogue'], list_validators)
+@cache_catalogue_page(lambda: ['catalogue'])
 def service_list(request):
-    services = Service.objects.all().order_by("-date")
-    return render(request, 'services/list.html', {'services': services})
+    form = FilterForm(request.GET)
+    filters = form.filters()
+    conditions = facets.conditions(filters)
+    services = paginate(
+        request, facets.filtered(Service.objects.for_listing(), conditions),
+        facets.SORTS[filters['sort']])
+    return render(request, 'services/list.html', {
+        'services': services, 'cards': render_cards(services), 'form': form,
+        'facets': facets.facets(request, filters, conditions)})
 
 
+@conditional_page(lambda id: ['service:%s' % id, 'similar'],
+                  lambda id: (newest(Service.objects.filter(pk=id)), 1))
+@cache_catalogue_page(lambda id: ['service:%s' % id, 'similar'])
 def index(request, id):
-    service = Service.objects.get(id=id)
-    return render(request, 'services/single_service.html', {'service': service})
+    service = get_object_or_404(Service.objects.select_related('company__user'), id=id)
+    reviews = service.reviews.order_by('-date')[:10]
+    # precomputed by services.similar, read off the (service, rank) index
+    similar = service.similar.select_related('similar__company__user').only(
+        'service', 'similar__name', 'similar__price_hour', 'similar__company',
+        'similar__company__user__username').order_by('rank')
+    form = ReviewForm() if request.user.is_authenticated and request.user.is_customer else None
+    return render(request, 'services/single_service.html', {
+        'service': service, 'reviews': reviews, 'similar': similar,
+        'review_form': form})
 
+@ratelimit('create_service')
 def create(request):
     # First check authentication and company status
     if not request.user.is_authenticated or not request.user.is_company:
@@ -28,10 +100,10 @@ def create(request):
         return redirect('services_list')
 
     # Determine choices based on company type
-    if company.is_all_in_one or company.field == 'All in One':
-        choices = Service.choices
+    if company.is_all_in_one or company.field is None:
+        choices = categories.choices
     else:
-        choices = [(company.field, company.field)]
+        choices = [(company.field.slug, company.field.name)]
 
     if request.method == 'POST':
         form = CreateNewService(request.POST, choices=choices)
@@ -51,13 +123,181 @@ def create(request):
     
     return render(request, 'services/create.html', {'form': form})
 
+@conditional_page(field_scopes, field_validators)
+@cache_catalogue_page(field_scopes)
 def service_field(request, field):
     # search for the service present in the url
-    field = field.replace('-', ' ').title()
-    services = Service.objects.filter(
-        field=field)
-    return render(request, 'services/field.html', {'services': services, 'field': field})
+    field = category_or_404(field)
+    services = paginate(
+        request, Service.objects.for_listing().filter(field=field))
+    stats = FieldStats.objects.filter(field=field).first()
+    return render(request, 'services/field.html', {
+        'services': services, 'field': field, 'stats': stats})
+
+
+def search(request):
+    # ranked full-text search; results are ranked rather than dated, so
+    # pages are plain numbered slices of the ranking
+    query = request.GET.get('q', '').strip()
+    size = page_size(request)
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        page = 1
+    services, previous_url, next_url = [], None, None
+    if query:
+        ids = fulltext.search_ids(query, limit=size + 1, offset=(page - 1) * size)
+        found = Service.objects.for_listing().in_bulk(ids[:size])
+        services = [found[pk] for pk in ids[:size] if pk in found]
+        params = request.GET.copy()
+        if page > 1:
+            params['page'] = page - 1
+            previous_url = '?' + params.urlencode()
+        if len(ids) > size:
+            params['page'] = page + 1
+            next_url = '?' + params.urlencode()
+    return render(request, 'services/search.html', {
+        'services': services, 'cards': render_cards(services), 'query': query,
+        'previous_url': previous_url, 'next_url': next_url})
+
+
+def available(request):
+    # companies free in a field and time range, read off the precomputed
+    # free slots (see services.availability)
+    form = AvailableForm(request.GET or None, initial={
+        'day': timezone.localdate() + timedelta(days=1)})
+    companies = []
+    if form.is_valid():
+        since, until = form.period()
+        found = availability.search(
+            form.cleaned_data['field'], max(since, timezone.now()), until)
+        users = Company.objects.select_related('user').in_bulk([pk for pk, _ in found])
+        companies = [(users[pk], first) for pk, first in found if pk in users]
+    return render(request, 'services/available.html', {
+        'form': form, 'companies': companies})
+
+
+def manage_availability(request):
+    if not request.user.is_authenticated or not request.user.is_company:
+        messages.error(request, "Only companies can publish their availability")
+        return redirect('services_list')
+    company = get_object_or_404(Company, user=request.user)
+
+    if request.method == 'POST' and 'delete' in request.POST:
+        # deleting through the queryset still refreshes the slots, see signals
+        window = request.POST['delete']
+        company.availability.filter(pk=int(window) if window.isdigit() else None).delete()
+        return redirect('services_availability')
+    if request.method == 'POST':
+        form = AvailabilityWindowForm(request.POST, instance=AvailabilityWindow(company=company))
+        if form.is_valid():
+            form.save()
+            messages.success(request, f"Added {form.instance}")
+            return redirect('services_availability')
+    else:
+        form = AvailabilityWindowForm()
+
+    return render(request, 'services/availability.html', {
+        'form': form, 'windows': company.availability.all(),
+        'free_hours': availability.free_hours(company, limit=24)})
+
+
+def activity_chart(request, activity, revenue=True):
+    # chart data for a company's or a field's activity rollups, see
+    # services.rollups.chart
+    form = ActivityForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_json(), content_type='application/json')
+    chart = rollups.chart(
+        activity, form.cleaned_data['resolution'], form.cleaned_data['periods'],
+        timezone.now())
+    if not revenue:
+        del chart['series']['booked']
+    return JsonResponse(chart)
+
+
+def field_activity(request, field):
+    # public, so without the revenue series, which gives away a company's
+    # takings in a field it has to itself
+    return activity_chart(request, FieldActivity.objects.filter(field=category_or_404(field)),
+                          revenue=False)
+
+
+def export(request):
+    # the whole catalogue, or a field and date range of it, for partners
+    # mirroring it; streamed a chunk at a time
+    form = ExportForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_json(), content_type='application/json')
+    data = form.cleaned_data
+    services = catalogue_export.services(data['field'], data['since'], data['until'])
+    # the body is read after the middleware has returned, when the router
+    # no longer sees the request; stay on the database it picked
+    services = services.using(router.db_for_read(Service))
+    response = StreamingHttpResponse(
+        catalogue_export.render(catalogue_export.chunks(services), data['format']),
+        content_type=catalogue_export.CONTENT_TYPES[data['format']])
+    response['Content-Disposition'] = 'attachment; filename="services.%s"' % data['format']
+    return response
 
 
 def request_service(request, id):
-    return render(request, 'services/request_service.html', {})
+    service = get_object_or_404(
+        Service.objects.select_related('company__user'), id=id)
+    if not request.user.is_authenticated or not request.user.is_customer:
+        messages.error(request, "Only customers can request services")
+        return redirect('index', id=id)
+
+    try:
+        customer = Customer.objects.get(user=request.user)
+    except Customer.DoesNotExist:
+        messages.error(request, "Customer profile not found")
+        return redirect('index', id=id)
+
+    free_hours = availability.free_hours(service.company_id)
+    if request.method == 'POST':
+        form = RequestServiceForm(request.POST, free_hours=free_hours)
+        if form.is_valid():
+            try:
+                _, created = book(
+                    customer, service,
+                    address=form.cleaned_data['address'],
+                    hours=form.cleaned_data['service_time'],
+                    key=form.cleaned_data['idempotency_key'],
+                    start=form.cleaned_data['start'])
+            except IdempotencyConflict:
+                form.add_error(None, "This form was already used for another request")
+            except availability.SlotTaken:
+                form.add_error('start', "The company is not free for all those hours")
+            else:
+                if created:
+                    messages.success(request, f"Service '{service.name}' requested successfully")
+                return redirect('index', id=id)
+    else:
+        form = RequestServiceForm(free_hours=free_hours)
+
+    return render(request, 'services/request_service.html', {'form': form, 'service': service})
+
+
+def review_service(request, id):
+    service = get_object_or_404(Service, id=id)
+    if not request.user.is_authenticated or not request.user.is_customer:
+        messages.error(request, "Only customers can review services")
+        return redirect('index', id=id)
+
+    try:
+        customer = Customer.objects.get(user=request.user)
+    except Customer.DoesNotExist:
+        messages.error(request, "Customer profile not found")
+        return redirect('index', id=id)
+
+    if request.method == 'POST':
+        form = ReviewForm(request.POST)
+        if form.is_valid():
+            _, created = review(customer, service, form.cleaned_data['stars'],
+                                form.cleaned_data['text'])
+            messages.success(request, "Thanks for your review" if created
+                             else "Your review was updated")
+        else:
+            messages.error(request, "Pick between 1 and 5 stars")
+    return redirect('index', id=id)
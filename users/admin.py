@@ -1,18 +1,29 @@
 from django.contrib import admin
 
+from main.admin import ScaleModelAdmin
 from .models import User, Customer, Company
 
 
 @admin.register(User)
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(ScaleModelAdmin):
     list_display = ("id", "username", "email")
+    # exact matches, answered by the unique indexes; emails are stored
+    # lowercased
+    search_fields = ("username__exact", "email__exact")
 
 
 @admin.register(Company)
-class CompanyAdmin(admin.ModelAdmin):
+class CompanyAdmin(ScaleModelAdmin):
     list_display = ("user", "field")
+    # the field comes from services.categories without a join
+    list_select_related = ("user",)
+    raw_id_fields = ("user",)
+    search_fields = ("user__username__exact", "user__email__exact")
 
 
 @admin.register(Customer)
-class CustomerAdmin(admin.ModelAdmin):
+class CustomerAdmin(ScaleModelAdmin):
     list_display = ("user", "birth")
+    list_select_related = ("user",)
+    raw_id_fields = ("user",)
+    search_fields = ("user__username__exact", "user__email__exact")
@@ -3,8 +3,12 @@ from django.contrib.auth.forms import UserCreationForm, AuthenticationForm, auth
 from django.db import transaction
 from django.core.exceptions import ValidationError
 
+from services import categories
 from .models import User, Company, Customer
 
+# the field choice of companies offering services of every category
+ALL_IN_ONE = 'all-in-one'
+
 
 class DateInput(forms.DateInput):
     input_type = 'date'
@@ -67,8 +71,9 @@ class CompanySignUpForm(UserCreationForm):
         }
     )
     
-    field = forms.ChoiceField(
-        choices=Company.FIELD_CHOICES,
+    # the slug of the company's category, or ALL_IN_ONE
+    field = forms.TypedChoiceField(
+        coerce=categories.by_slug,
         widget=forms.Select(attrs={
             'class': 'form-control'
         }),
@@ -82,7 +87,8 @@ class CompanySignUpForm(UserCreationForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields['field'].choices = [('', '--- Select Field ---')] + list(Company.FIELD_CHOICES)
+        self.fields['field'].choices = [
+            ('', '--- Select Field ---'), (ALL_IN_ONE, 'All in One')] + categories.choices()
         
         # Set common attributes for all fields
         field_attrs = {
@@ -125,7 +131,7 @@ class CompanySignUpForm(UserCreationForm):
                 company = Company(
                     user=user,
                     field=field_value,
-                    is_all_in_one=(field_value == 'All in One')
+                    is_all_in_one=(field_value is None)
                  
                 )
                 company.save()
@@ -0,0 +1,58 @@
+# Generated by Django 3.1.14 on 2026-10-18 20:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def flag_all_in_one(apps, schema_editor):
+    Company = apps.get_model('users', 'Company')
+    Company.objects.filter(field='All in One').update(is_all_in_one=True)
+
+
+def unflag_all_in_one(apps, schema_editor):
+    Company = apps.get_model('users', 'Company')
+    Company.objects.filter(is_all_in_one=True).update(field='All in One')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='user',
+            options={},
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='is_all_in_one',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(flag_all_in_one, unflag_all_in_one),
+        migrations.AlterField(
+            model_name='company',
+            name='field',
+            field=models.CharField(choices=[('Air Conditioner', 'Air Conditioner'), ('All in One', 'All in One'), ('Carpentry', 'Carpentry'), ('Electricity', 'Electricity'), ('Gardening', 'Gardening'), ('Home Machines', 'Home Machines'), ('House Keeping', 'House Keeping'), ('Interior Design', 'Interior Design'), ('Locks', 'Locks'), ('Painting', 'Painting'), ('Plumbing', 'Plumbing'), ('Water Heaters', 'Water Heaters')], default='All in One', max_length=70),
+        ),
+        migrations.AlterField(
+            model_name='company',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='company', serialize=False, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='email',
+            field=models.EmailField(max_length=254, unique=True),
+        ),
+        migrations.AlterModelTable(
+            name='company',
+            table='users_company',
+        ),
+        migrations.AlterModelTable(
+            name='user',
+            table='users_user',
+        ),
+    ]
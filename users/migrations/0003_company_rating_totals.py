@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-18 21:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_company_is_all_in_one'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
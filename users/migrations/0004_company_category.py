@@ -0,0 +1,51 @@
+# Generated by Django 3.1.14 on 2026-10-18 22:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def link_categories(apps, schema_editor):
+    # All in One companies are left without a category
+    Category = apps.get_model('services', 'Category')
+    Company = apps.get_model('users', 'Company')
+    for category in Category.objects.all():
+        Company.objects.filter(field=category.name).update(category=category)
+
+
+def unlink_categories(apps, schema_editor):
+    Category = apps.get_model('services', 'Category')
+    Company = apps.get_model('users', 'Company')
+    Company.objects.update(field='All in One')
+    for category in Category.objects.all():
+        Company.objects.filter(category=category).update(field=category.name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0011_category'),
+        ('users', '0003_company_rating_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='services.category'),
+        ),
+        migrations.RunPython(link_categories, unlink_categories),
+        migrations.RemoveField(
+            model_name='company',
+            name='field',
+        ),
+        migrations.RenameField(
+            model_name='company',
+            old_name='category',
+            new_name='field',
+        ),
+        migrations.AlterField(
+            model_name='company',
+            name='field',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='companies', to='services.category'),
+        ),
+    ]
@@ -19,47 +19,72 @@ class Customer(models.Model):
     birth = models.DateField()
 
 
-class Company(models.Model):
-
-    FIELD_CHOICES = [
-        ('Air Conditioner', 'Air Conditioner'),
-        ('All in One', 'All in One'),
-        ('Carpentry', 'Carpentry'),
-        ('Electricity', 'Electricity'),
-        ('Gardening', 'Gardening'),
-        ('Home Machines', 'Home Machines'),
-        ('House Keeping', 'House Keeping'),
-        ('Interior Design', 'Interior Design'),
-        ('Locks', 'Locks'),
-        ('Painting', 'Painting'),
-        ('Plumbing', 'Plumbing'),
-        ('Water Heaters', 'Water Heaters')
-    ]
+class Rated(models.Model):
+    """
+    Rating columns kept by the review writes with F() updates (see
+    services/reviews.py): `rating` is the rounded average of `rating_count`
+    reviews totalling `rating_sum` stars. Saving a loaded row leaves them
+    out, so an edit cannot write back values a concurrent review changed.
+    """
+    RATING_FIELDS = ('rating', 'rating_sum', 'rating_count')
+
+    rating = models.IntegerField(
+        validators=[MaxValueValidator(5), MinValueValidator(0)],
+        default=0
+        )
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def average_rating(self):
+        if not self.rating_count:
+            return None
+        return round(self.rating_sum / self.rating_count, 1)
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in deferred
+                and field.name not in self.RATING_FIELDS]
+        super().save(*args, **kwargs)
+
+
+class Company(Rated):
     user = models.OneToOneField(
         User, 
         on_delete=models.CASCADE,
           primary_key=True,
           related_name= 'company'
           )
-    field = models.CharField(
-         max_length=70, 
-         choices=  FIELD_CHOICES,
-         blank= False,
-         null = False,
-         default='All in One'
+    # no field for All in One companies
+    field = models.ForeignKey(
+         'services.Category',
+         on_delete=models.PROTECT,
+         null=True,
+         blank=True,
+         related_name='companies'
     )
     is_all_in_one = models.BooleanField(default=False)
-    rating = models.IntegerField(
-        validators=[MaxValueValidator(5), MinValueValidator(0)], 
-        default=0
-        )
+
     class Meta:
         db_table = 'users_company'
 
     def __str__(self):
-          if self.is_all_in_one  or self.field == 'All in One':
+          if self.is_all_in_one  or self.field is None:
             return f"{self.user.username} (All in One)"
           return f"{self.user.username} ({self.field})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        from services import categories
+        instance = super().from_db(db, field_names, values)
+        categories.attach(instance, dict(zip(field_names, values)))
+        return instance
+
 
    
\ No newline at end of file
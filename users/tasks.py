@@ -0,0 +1,17 @@
+from django.core.mail import send_mail
+
+from main.tasks import task
+from .models import User
+
+
+@task
+def send_welcome_email(user_id):
+    user = User.objects.filter(pk=user_id).first()
+    if user is None:
+        return
+    kind = 'company' if user.is_company else 'customer'
+    send_mail(
+        "Welcome to NetFix",
+        f"Hi {user.username},\n\nYour NetFix {kind} account is ready. "
+        f"Log in with {user.email} to get started.\n",
+        None, [user.email])
@@ -3,12 +3,17 @@ from django.contrib.auth import login, authenticate
 from django.views.generic import CreateView, TemplateView
 from django.db import transaction
 from django.contrib import messages
+from django.utils.decorators import method_decorator
 from .forms import CustomerSignUpForm, CompanySignUpForm, UserLoginForm
+from main.ratelimit import ratelimit
+from main.tasks import enqueue
 from .models import User, Company, Customer
+from .tasks import send_welcome_email
 
 def register(request):
     return render(request, 'users/register.html')
 
+@method_decorator(ratelimit('signup'), name='post')
 class CustomerSignUpView(CreateView):
     model = User
     form_class = CustomerSignUpForm
@@ -20,9 +25,11 @@ class CustomerSignUpView(CreateView):
 
     def form_valid(self, form):
         user = form.save()
+        enqueue(send_welcome_email, user_id=user.pk)
         login(self.request, user)
         return redirect('/')
 
+@method_decorator(ratelimit('signup'), name='post')
 class CompanySignUpView(CreateView):
     model = User
     form_class = CompanySignUpForm
@@ -37,6 +44,7 @@ class CompanySignUpView(CreateView):
     def form_valid(self, form):
         try:
                 user = form.save()
+                enqueue(send_welcome_email, user_id=user.pk)
                 login(self.request, user)
                 messages.success(
                     self.request,
@@ -51,6 +59,7 @@ class CompanySignUpView(CreateView):
             )
             return self.form_invalid(form)
 
+@ratelimit('login')
 def LoginUserView(request):
     if request.method == 'POST':
         form = UserLoginForm(request.POST)